@@ -0,0 +1,277 @@
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class MockGeminiConfig:
+    """
+    Comportamiento del servidor simulado de Gemini.
+
+    Attributes:
+        latency_ms (float): Latencia mediana hasta la primera respuesta, en milisegundos.
+        latency_sigma (float): Sigma de la distribución log-normal de la latencia (0 = latencia fija).
+        stream_chunk_chars (int): Caracteres de texto por evento SSE (y por elemento del array JSON).
+        chunk_delay_ms (float): Espera entre eventos de una respuesta en streaming, en milisegundos.
+        error_rate (float): Probabilidad de responder 429 a una petición.
+        retry_after_s (float): Valor de la cabecera Retry-After de los 429 inyectados.
+        response_ratio (float): Tamaño del texto de la respuesta respecto al contenido recibido.
+        seed (int): Semilla del generador aleatorio, para que las ejecuciones sean reproducibles.
+        context_cache (bool): Si acepta contextos en caché (cachedContents); si no, su creación responde 404.
+        min_cache_tokens (int): Tokens mínimos de un contexto en caché; los menores se rechazan con 400.
+    """
+    def __init__(self, latency_ms=50.0, latency_sigma=0.0, stream_chunk_chars=256, chunk_delay_ms=0.0,
+                 error_rate=0.0, retry_after_s=0.05, response_ratio=1.0, seed=0, context_cache=True,
+                 min_cache_tokens=0):
+        if not 0.0 <= error_rate < 1.0:
+            raise ValueError("error_rate debe estar en [0, 1).")
+        if stream_chunk_chars < 1:
+            raise ValueError("stream_chunk_chars debe ser un entero positivo.")
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.stream_chunk_chars = stream_chunk_chars
+        self.chunk_delay_ms = chunk_delay_ms
+        self.error_rate = error_rate
+        self.retry_after_s = retry_after_s
+        self.response_ratio = response_ratio
+        self.seed = seed
+        self.context_cache = context_cache
+        self.min_cache_tokens = min_cache_tokens
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def _input_content(body):
+    """Devuelve el contenido que cambiacosas envía (el prompt va en las instrucciones del sistema)."""
+    return body["contents"][0]["parts"][0]["text"]
+
+
+def _tokens(text):
+    return len(text) // 4 + 1
+
+
+def _response_text(body, response_ratio):
+    """Construye una respuesta válida para el esquema de la petición (reescritura, parche o paquete)."""
+    properties = body.get("generationConfig", {}).get("responseSchema", {}).get("properties", {})
+    content = _input_content(body)
+    if "edits" in properties:
+        return json.dumps({"edits": []})
+    if "files" in properties:
+        try:
+            files = json.loads(content)
+        except json.JSONDecodeError:
+            files = []
+        return json.dumps({"files": [{"path": item["path"], "content": _resize(item["content"], response_ratio)}
+                                     for item in files]})
+    return json.dumps({"response": _resize(content, response_ratio)})
+
+
+def _resize(content, ratio):
+    if ratio == 1.0 or not content:
+        return content
+    size = max(1, int(len(content) * ratio))
+    return (content * math.ceil(size / len(content)))[:size]
+
+
+def _item(text, usage=None):
+    item = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+    if usage is not None:
+        item["usageMetadata"] = usage
+    return item
+
+
+def _usage(body, text, cached_instruction=None):
+    """
+    usageMetadata aproximado (4 caracteres por token), como el que Gemini incluye en cada respuesta.
+    Los tokens de un contexto en caché se cuentan en promptTokenCount y en cachedContentTokenCount.
+    """
+    instruction = body.get("systemInstruction", {}).get("parts", [{}])[0].get("text", "")
+    prompt_tokens = _tokens(body["contents"][0]["parts"][0]["text"]) + (_tokens(instruction) if instruction else 0)
+    candidates_tokens = _tokens(text)
+    usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": candidates_tokens}
+    if cached_instruction is not None:
+        usage["cachedContentTokenCount"] = _tokens(cached_instruction)
+        usage["promptTokenCount"] += usage["cachedContentTokenCount"]
+    usage["totalTokenCount"] = usage["promptTokenCount"] + candidates_tokens
+    return usage
+
+
+class _MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Conexiones keep-alive, como la API real
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024  # Cabeceras y cuerpo en un solo envío: evita esperas de ACK retardado de TCP
+
+    def _send_json(self, status, data):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _create_cached_content(self, body):
+        """POST cachedContents: guarda las instrucciones del sistema y devuelve el nombre del contexto."""
+        server = self.server
+        instruction = body.get("systemInstruction", {}).get("parts", [{}])[0].get("text", "")
+        if not server.config.context_cache:
+            self._send_json(404, {"error": {"code": 404, "status": "NOT_FOUND"}})
+            return
+        if _tokens(instruction) < server.config.min_cache_tokens:
+            self._send_json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                            "message": "Cached content is too small."}})
+            return
+        ttl = float(str(body.get("ttl", "3600s")).rstrip("s"))
+        with server.lock:
+            server.contexts_created += 1
+            name = f"cachedContents/mock{server.contexts_created}"
+            server.cached_contents[name] = (instruction, time.monotonic() + ttl)
+        self._send_json(200, {"name": name, "model": body.get("model"),
+                              "usageMetadata": {"totalTokenCount": _tokens(instruction)}})
+
+    def _cached_instruction(self, name):
+        """Devuelve las instrucciones de un contexto en caché, o None si no existe o ha expirado."""
+        with self.server.lock:
+            instruction, expires_at = self.server.cached_contents.get(name, (None, 0.0))
+        return instruction if expires_at > time.monotonic() else None
+
+    def do_DELETE(self):
+        name = urlparse(self.path).path[len("/v1beta/"):]
+        with self.server.lock:
+            found = self.server.cached_contents.pop(name, None) is not None
+        self._send_json(200 if found else 404, {} if found else {"error": {"code": 404, "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if urlparse(self.path).path.endswith("/cachedContents"):
+            self._create_cached_content(body)
+            return
+        with server.lock:
+            server.requests += 1
+            inject_error = server.random.random() < server.config.error_rate
+            latency = server.config.latency_ms / 1000.0
+            if server.config.latency_sigma > 0:
+                latency *= server.random.lognormvariate(0.0, server.config.latency_sigma)
+        if inject_error:
+            with server.lock:
+                server.injected_errors += 1
+            payload = json.dumps({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("Retry-After", str(server.config.retry_after_s))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        cached_instruction = None
+        if "cachedContent" in body:
+            cached_instruction = self._cached_instruction(body["cachedContent"])
+            if cached_instruction is None:
+                self._send_json(404, {"error": {"code": 404, "status": "NOT_FOUND"}})
+                return
+            if "systemInstruction" in body:  # Como la API real: no se admiten junto a un contexto en caché
+                self._send_json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT"}})
+                return
+        time.sleep(latency)
+        text = _response_text(body, server.config.response_ratio)
+        size = server.config.stream_chunk_chars
+        fragments = [text[start:start + size] for start in range(0, len(text), size)] or [""]
+        usage = _usage(body, text, cached_instruction)  # Solo en el último elemento, que lleva el recuento final
+        items = [_item(fragment, usage if index == len(fragments) - 1 else None) for index, fragment in enumerate(fragments)]
+        if "alt=sse" in urlparse(self.path).query:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")  # Sin Content-Length: el final del stream cierra la conexión
+            self.end_headers()
+            for index, item in enumerate(items):
+                if index and server.config.chunk_delay_ms:
+                    time.sleep(server.config.chunk_delay_ms / 1000.0)
+                self.wfile.write(b"data: " + json.dumps(item).encode("utf-8") + b"\r\n\r\n")
+                self.wfile.flush()
+            self.close_connection = True
+        else:
+            payload = json.dumps(items).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockGeminiServer:
+    """
+    Servidor HTTP local que imita streamGenerateContent de Gemini (JSON y SSE con alt=sse) y los
+    contextos en caché (POST cachedContents, DELETE y el campo cachedContent de las peticiones)
+    para los benchmarks y las pruebas: no necesita red ni clave de API. Se usa como gestor de contexto:
+
+        with MockGeminiServer(MockGeminiConfig(latency_ms=100)) as server:
+            os.environ["GEMINI_API_BASE_URL"] = server.base_url
+    """
+    def __init__(self, config=None):
+        self.config = config or MockGeminiConfig()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _MockGeminiHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.config = self.config
+        self._httpd.random = random.Random(self.config.seed)
+        self._httpd.lock = threading.Lock()
+        self._httpd.requests = 0
+        self._httpd.injected_errors = 0
+        self._httpd.contexts_created = 0
+        self._httpd.cached_contents = {}
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        """Número de peticiones recibidas (incluidas las respondidas con 429)."""
+        with self._httpd.lock:
+            return self._httpd.requests
+
+    @property
+    def injected_errors(self):
+        """Número de respuestas 429 inyectadas."""
+        with self._httpd.lock:
+            return self._httpd.injected_errors
+
+    @property
+    def cached_contents(self):
+        """Nombres de los contextos en caché que existen en el servidor."""
+        with self._httpd.lock:
+            return sorted(self._httpd.cached_contents)
+
+    def expire_cached_contents(self):
+        """Hace expirar todos los contextos en caché (como si hubiera pasado su TTL)."""
+        with self._httpd.lock:
+            self._httpd.cached_contents = {name: (instruction, 0.0)
+                                           for name, (instruction, _) in self._httpd.cached_contents.items()}
+
+    def reset_counters(self):
+        with self._httpd.lock:
+            self._httpd.requests = 0
+            self._httpd.injected_errors = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
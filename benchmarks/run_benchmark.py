@@ -0,0 +1,227 @@
+"""
+Benchmark de extremo a extremo de cambiacosas contra un servidor simulado de Gemini local.
+
+Genera árboles sintéticos, los procesa con process_files_with_gemini (cada escenario en un
+proceso hijo, para medir su pico de memoria por separado) y escribe un informe JSON con
+archivos/s, latencia por archivo (p50/p95/p99), pico de RSS y número de peticiones. No usa la
+red, así que puede ejecutarse en CI para detectar regresiones (ver --baseline).
+
+    python -m benchmarks.run_benchmark --files 100,1000 --sizes 1K,16K --workers 1,8 -o informe.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_gemini_server import MockGeminiConfig, MockGeminiServer
+
+PROMPT = "Convierte el texto a mayúsculas."
+FILES_PER_DIR = 100
+WORDS = ("alfa", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa")
+
+
+def _make_tree(root, file_count, file_size, seed):
+    """Crea file_count archivos de texto de unos file_size bytes (±50 %), FILES_PER_DIR por carpeta."""
+    rng = random.Random(seed)
+    for index in range(file_count):
+        folder = os.path.join(root, f"dir_{index // FILES_PER_DIR:04d}")
+        os.makedirs(folder, exist_ok=True)
+        target = max(1, int(file_size * rng.uniform(0.5, 1.5)))
+        lines, size = [], 0
+        while size < target:
+            line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) + "\n"
+            lines.append(line)
+            size += len(line)
+        with open(os.path.join(folder, f"file_{index:06d}.txt"), "w", encoding="utf-8") as output:
+            output.write("".join(lines))
+
+
+def _percentile(sorted_values, percent):
+    """Percentil por rango más cercano de una lista ordenada (None si está vacía)."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS lo da en bytes
+
+
+def _run_scenario(scenario, base_url):
+    """Ejecuta un escenario en el proceso actual (un hijo) y devuelve sus métricas."""
+    os.environ["GEMINI_API_KEY"] = "benchmark"
+    os.environ["GEMINI_API_BASE_URL"] = base_url
+    from src.cambiacosas import __main__ as cambiacosas_main
+    from src.cambiacosas.administracion_archivo.manifest import RunManifest
+    from src.cambiacosas.googleapi.http_client import GeminiHTTPClient
+    from src.cambiacosas.googleapi.rate_limiter import RateLimiter
+
+    work_dir = tempfile.mkdtemp(prefix="cambiacosas-bench-")
+    tree = os.path.join(work_dir, "tree")
+    _make_tree(tree, scenario["files"], scenario["file_size"], scenario["seed"])
+
+    latencies = []
+    process_single_file = cambiacosas_main._process_single_file
+
+    def timed_process_single_file(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return process_single_file(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    cambiacosas_main._process_single_file = timed_process_single_file
+    workers = scenario["workers"]
+    client = GeminiHTTPClient(pool_size=workers)
+    # Sin presupuestos por minuto, como una ejecución normal: se mide el cliente, no la cuota
+    limiter = RateLimiter(initial_concurrency=workers, max_concurrency=workers, log=lambda message: None)
+    context = cambiacosas_main.ProcessingContext(workers=workers, client=client, stream=scenario["stream"],
+                                                 chunk_tokens=scenario["chunk_tokens"], patch=scenario["patch"],
+                                                 limiter=limiter)
+    context.manifest = RunManifest(os.path.join(work_dir, "manifest.jsonl"), PROMPT)
+    stdout = sys.stdout
+    try:
+        with open(os.devnull, "w") as devnull:
+            sys.stdout = devnull
+            start = time.perf_counter()
+            file_count = cambiacosas_main.process_files_with_gemini(
+                cambiacosas_main.scan_folder(tree), PROMPT, False, context)
+            elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout = stdout
+        context.manifest.close()
+        client.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies.sort()
+    return {
+        "files_processed": file_count,
+        "elapsed_s": round(elapsed, 4),
+        "files_per_s": round(file_count / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": {name: round(_percentile(latencies, percent) * 1000, 2) if latencies else None
+                       for name, percent in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "peak_rss_kb": _peak_rss_kb(),
+        "retries": limiter.retries,
+    }
+
+
+def run_benchmark(scenarios, server_config):
+    """
+    Ejecuta los escenarios contra un servidor simulado y devuelve el informe.
+
+    Args:
+        scenarios (list): Diccionarios con 'files', 'file_size', 'workers', 'stream', 'patch',
+                          'chunk_tokens' y 'seed'.
+        server_config (MockGeminiConfig): Comportamiento del servidor simulado.
+
+    Returns:
+        dict: El informe, con la configuración del servidor y las métricas de cada escenario.
+    """
+    results = []
+    spawn_context = multiprocessing.get_context("spawn")
+    with MockGeminiServer(server_config) as server:
+        for scenario in scenarios:
+            server.reset_counters()
+            with spawn_context.Pool(1) as pool:
+                metrics = pool.apply(_run_scenario, (scenario, server.base_url))
+            metrics["requests"] = server.requests
+            metrics["injected_429"] = server.injected_errors
+            results.append({"name": scenario_name(scenario), "scenario": scenario, **metrics})
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "server": server_config.to_dict(),
+        "results": results,
+    }
+
+
+def scenario_name(scenario):
+    mode = "patch" if scenario["patch"] else "rewrite"
+    transport = "stream" if scenario["stream"] else "json"
+    return f"{scenario['files']}x{scenario['file_size']}B-w{scenario['workers']}-{transport}-{mode}"
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """
+    Compara archivos/s con un informe anterior y devuelve los escenarios que empeoran más que
+    tolerance (fracción, p. ej. 0.2 = 20 %), como mensajes.
+    """
+    previous = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(result["name"])
+        if not old or not old.get("files_per_s") or result["files_per_s"] is None:
+            continue
+        if result["files_per_s"] < old["files_per_s"] * (1 - tolerance):
+            regressions.append(f"{result['name']}: {result['files_per_s']} archivos/s (antes {old['files_per_s']})")
+    return regressions
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv=None):
+    from src.cambiacosas.__main__ import _parse_size
+
+    parser = argparse.ArgumentParser(description="Benchmark de cambiacosas contra un servidor simulado de Gemini (sin red).")
+    parser.add_argument("--files", type=_int_list, default=[50, 500], help="Números de archivos de los árboles, separados por comas.")
+    parser.add_argument("--sizes", type=lambda value: [_parse_size(item) for item in value.split(",") if item],
+                        default=[1024, 16 * 1024], help="Tamaños medios de archivo, separados por comas (p. ej., 1K,64K).")
+    parser.add_argument("--workers", type=_int_list, default=[1, 8], help="Valores de --workers, separados por comas.")
+    parser.add_argument("--stream", action="store_true", help="Usa respuestas en streaming (SSE).")
+    parser.add_argument("--patch", action="store_true", help="Usa el modo parche.")
+    parser.add_argument("--chunk-tokens", type=int, help="Presupuesto de tokens por petición (por defecto: según el modelo).")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latencia mediana del servidor en ms (por defecto: 50).")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Sigma log-normal de la latencia (0 = fija; por defecto: 0.5).")
+    parser.add_argument("--chunk-chars", type=int, default=256, help="Caracteres por evento de streaming (por defecto: 256).")
+    parser.add_argument("--chunk-delay-ms", type=float, default=0.0, help="Espera entre eventos de streaming en ms.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de responder 429 (por defecto: 0).")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After de los 429 inyectados, en segundos.")
+    parser.add_argument("--response-ratio", type=float, default=1.0, help="Tamaño de la respuesta respecto a la entrada.")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los árboles y del servidor.")
+    parser.add_argument("-o", "--output", help="Archivo del informe JSON (por defecto: salida estándar).")
+    parser.add_argument("--baseline", help="Informe anterior con el que comparar archivos/s.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento admitido respecto a --baseline (por defecto: 0.2).")
+    args = parser.parse_args(argv)
+
+    server_config = MockGeminiConfig(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                                     stream_chunk_chars=args.chunk_chars, chunk_delay_ms=args.chunk_delay_ms,
+                                     error_rate=args.error_rate, retry_after_s=args.retry_after,
+                                     response_ratio=args.response_ratio, seed=args.seed)
+    scenarios = [{"files": files, "file_size": size, "workers": workers, "stream": args.stream,
+                  "patch": args.patch, "chunk_tokens": args.chunk_tokens, "seed": args.seed}
+                 for files, size, workers in itertools.product(args.files, args.sizes, args.workers)]
+    report = run_benchmark(scenarios, server_config)
+
+    report_text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(report_text + "\n")
+    else:
+        print(report_text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            regressions = compare_with_baseline(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"Regresión: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
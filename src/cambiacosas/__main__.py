@@ -1,52 +1,521 @@
 import sys
 import os
 import pathlib
-import tempfile
 import argparse 
+import contextlib
+import json
+import socket
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from .administracion_archivo.file_info import LineIndexedFile, get_file_info
+from .administracion_archivo.file_watcher import DEFAULT_DEBOUNCE_SECONDS, DEFAULT_POLL_INTERVAL, FileWatcher
+from .administracion_archivo.edit_file import apply_line_edits, modify_file_lines, validate_line_edits
+from .administracion_archivo.chunking import (CHARS_PER_TOKEN, estimate_tokens, split_into_chunks, split_into_line_ranges,
+                                              token_budget_for_model)
+from .administracion_archivo.manifest import RunManifest, content_hash, default_manifest_path
+from .administracion_archivo.scan_filter import ScanFilter
+from .administracion_archivo.staging import StagingArea, default_staging_dir
+from .googleapi.gemini_options import GeminisOptions, GeminiOptionsError, DEFAULT_MODEL_ID, LINE_EDITS_RESPONSE_SCHEMA, PACKED_FILES_RESPONSE_SCHEMA
+from .googleapi.batch_jobs import batch_key, batch_request_line, parse_batch_key, read_batch_results
+from .googleapi.context_cache import DEFAULT_TTL_SECONDS, EXPIRY_MARGIN_SECONDS, ContextCache, is_context_error
+from .googleapi.api_client import call_gemini_api, gemini_response_text, parse_gemini_text, stream_gemini_api
+from .googleapi.hedging import DEFAULT_MAX_FRACTION, HedgePolicy
+from .googleapi.model_router import ModelRouter, parse_route
+from .googleapi.http_client import GeminiHTTPClient
+from .googleapi.rate_limiter import RateLimiter
+from .googleapi.request_dedup import RequestDeduplicator
+from .googleapi.response_cache import ResponseCache, cache_key, default_cache_dir
+from .job_server import DEFAULT_HOST, DEFAULT_PORT, TOKEN_ENV_VAR, Job, JobServer, create_http_server, is_loopback_host
+from .run_metrics import RunMetrics
+
+# Bloqueo para que los mensajes de distintos hilos no se mezclen en la consola
+_log_lock = threading.Lock()
+# Mensajes pendientes del archivo que procesa el hilo actual (solo con varios trabajadores)
+_log_buffer = threading.local()
 
-from typing import List, Dict, Union
-from .administracion_archivo.file_info import get_file_info
-from .administracion_archivo.edit_file import modify_file_lines
-from .googleapi.gemini_options import GeminisOptions
-from .googleapi.api_client import call_gemini_api, parse_gemini_response
+# Un archivo entra en un paquete si ocupa como mucho esta fracción del presupuesto del paquete
+PACK_SMALL_FILE_RATIO = 0.25
+# Máximo de archivos por paquete, para que una respuesta incompleta no obligue a repetir demasiados
+PACK_MAX_FILES = 50
+# Tamaño (en bytes) a partir del cual un archivo no se lee entero: se indexa por líneas con mmap
+# (get_file_info con lazy=True) y cada fragmento se lee solo cuando se procesa
+LAZY_FILE_BYTES = 32 * 1024 * 1024
+# Con --stream, texto de una respuesta que se guarda en memoria mientras llega; el resto se
+# escribe en un archivo temporal
+STREAM_SPOOL_BYTES = 1024 * 1024
+# Con un evento de parada (watch_folder), cada cuántos segundos se comprueba si se activó
+WATCH_STOP_CHECK_SECONDS = 0.5
+# Opciones de un trabajo del servidor (serve); las demás se fijan al arrancarlo y son comunes a todos
+JOB_FLAGS = ("divide", "patch", "pack", "no_ignore", "resume")
+JOB_OPTIONS = JOB_FLAGS + ("chunk_tokens", "pack_tokens", "include", "exclude", "max_size")
 
 
-def scan_folder(folder_path: str) -> list[dict]:
+class ProcessingContext:
     """
-    Escanea todos los archivos en la carpeta especificada y recupera información del archivo.
+    Estado compartido por todos los archivos de una ejecución.
+
+    Attributes:
+        workers (int): Número de archivos (y de fragmentos por archivo grande) que se procesan en paralelo.
+        client (GeminiHTTPClient): Cliente HTTP persistente compartido por todas las llamadas a Gemini.
+                                   Si es None, cada llamada abre su propia conexión.
+        stream (bool): Si es True, las respuestas se consumen de forma incremental (SSE) con
+                       stream_gemini_api en lugar de esperar al array JSON completo.
+        cache (ResponseCache): Caché de respuestas consultada antes de cada llamada a Gemini.
+                               Si es None, no se usa caché.
+        manifest (RunManifest): Manifiesto donde se registra el progreso por archivo y fragmento,
+                                y que permite omitir el trabajo terminado al reanudar. Si es None, no se registra.
+        chunk_tokens (int): Presupuesto de tokens estimados por petición. Los archivos que lo superan
+                            se procesan en fragmentos. Por defecto, el del modelo predeterminado.
+        patch (bool): Si es True, se pide a Gemini solo las ediciones por rango de líneas y se aplican
+                      con apply_line_edits, en lugar de reescribir el archivo completo.
+        limiter (RateLimiter): Limitador compartido de peticiones a Gemini (RPM, TPM, concurrencia
+                               adaptativa y reintentos ante 429/5xx). Si es None, no se limita ni se reintenta.
+        staging (StagingArea): Área de preparación donde se dejan las salidas para confirmarlas todas
+                               al final. Si es None, cada archivo se escribe en cuanto se procesa.
+        pack_tokens (int): Presupuesto de tokens estimados de un paquete. Si se indica, los archivos
+                           pequeños se agrupan en una sola petición por paquete. Si es None, cada
+                           archivo se envía por separado.
+        metrics (RunMetrics): Métricas de la ejecución (tiempo por fase y tokens por petición).
+                              Si es None, no se miden.
+        context_cache (ContextCache): Contextos en caché de Gemini con las instrucciones del sistema
+                                      (el prompt), a los que las peticiones hacen referencia en lugar
+                                      de enviarlas. Si es None, las instrucciones van en cada petición.
+        hedge (HedgePolicy): Política de duplicado de las peticiones lentas: si una no recibe su
+                             primer byte a tiempo, se envía otra igual y se usa la primera
+                             respuesta. Si es None, no se duplican.
+        router (ModelRouter): Elige el modelo de cada petición según sus tokens, sus archivos o su
+                              contenido. Si es None, todas usan el modelo predeterminado.
+        root (str): La carpeta procesada. Las rutas de los archivos se comparan con las condiciones
+                    `paths` de router relativas a ella (con '/' como separador). Si es None, se
+                    comparan las rutas absolutas.
+        dedup (bool): Si es True (por defecto), los archivos y fragmentos idénticos se envían a
+                      Gemini una sola vez y su respuesta se reutiliza (context.dedup es un
+                      RequestDeduplicator; None si se desactiva).
+        on_write (Callable[[str], None]): Función a la que se llama con la ruta de cada salida
+                                          escrita en la carpeta (no con las preparadas en staging).
+                                          watch_folder la usa para reconocer sus propias escrituras.
+        executor (ThreadPoolExecutor): Grupo de hilos compartido en el que se procesan los archivos
+                                       (p. ej., por todos los trabajos del servidor). Si es None,
+                                       process_files_with_gemini crea uno con `workers` hilos.
+        cancel (threading.Event): Si se activa, no se empiezan más archivos; los que están en curso
+                                  terminan. Si es None, la ejecución no se puede cancelar.
+        on_file_done (Callable[[List[Dict], List[str]], None]): Función a la que se llama al terminar
+                                  cada archivo (o paquete) con sus registros y sus mensajes de
+                                  registro. Si se indica, los mensajes se acumulan por archivo aunque
+                                  haya un solo trabajador.
+    """
+    def __init__(self, workers: int = 1, client: Optional[GeminiHTTPClient] = None, stream: bool = False,
+                 cache: Optional[ResponseCache] = None, manifest: Optional[RunManifest] = None,
+                 chunk_tokens: Optional[int] = None, patch: bool = False,
+                 staging: Optional[StagingArea] = None, limiter: Optional[RateLimiter] = None,
+                 pack_tokens: Optional[int] = None, metrics: Optional[RunMetrics] = None,
+                 context_cache: Optional[ContextCache] = None, hedge: Optional[HedgePolicy] = None,
+                 router: Optional[ModelRouter] = None, root: Optional[str] = None, dedup: bool = True,
+                 on_write: Optional[Callable[[str], None]] = None,
+                 executor: Optional[ThreadPoolExecutor] = None, cancel: Optional[threading.Event] = None,
+                 on_file_done: Optional[Callable[[List[Dict], List[str]], None]] = None):
+        if workers < 1:
+            raise ValueError("workers debe ser un entero positivo.")
+        if chunk_tokens is not None and chunk_tokens < 1:
+            raise ValueError("chunk_tokens debe ser un entero positivo.")
+        if pack_tokens is not None and pack_tokens < 1:
+            raise ValueError("pack_tokens debe ser un entero positivo.")
+        self.workers = workers
+        self.client = client
+        self.stream = stream
+        self.cache = cache
+        self.manifest = manifest
+        self.chunk_tokens = chunk_tokens or token_budget_for_model(DEFAULT_MODEL_ID)
+        self.patch = patch
+        self.staging = staging
+        self.limiter = limiter
+        self.pack_tokens = pack_tokens
+        self.metrics = metrics
+        self.context_cache = context_cache
+        self.hedge = hedge
+        self.router = router
+        self.root = os.path.abspath(root) if root is not None else None
+        self.dedup = RequestDeduplicator() if dedup else None
+        self.on_write = on_write
+        self.executor = executor
+        self.cancel = cancel
+        self.on_file_done = on_file_done
+
+
+def scan_folder(folder_path: str, scan_filter: Optional[ScanFilter] = None) -> Iterator[Dict]:
+    """
+    Escanea de forma perezosa todos los archivos en la carpeta especificada.
+
+    La carpeta se valida de inmediato, pero el recorrido (con os.scandir) avanza a medida que
+    se consumen los registros, de modo que el procesamiento puede empezar con el primer archivo
+    mientras el recorrido continúa. Los registros no incluyen el contenido: se carga con
+    get_file_info cuando un trabajador toma el archivo.
 
     Args:
         folder_path (str): Ruta a la carpeta para escanear.
+        scan_filter (ScanFilter, opcional): Filtros del escaneo. Las carpetas excluidas se podan sin
+                                            descender en ellas. Si no se proporciona, se usan los
+                                            filtros por defecto (.gitignore, carpetas conocidas y binarios).
 
     Returns:
-        list[dict]: Una lista de diccionarios, donde cada diccionario contiene
-                      información del archivo obtenida de get_file_info.
+        Iterator[Dict]: Un iterador de registros ligeros con 'name', 'full_path' y 'metadata'
+                        (tamaño, fecha de modificación y tipo de archivo).
+
+    Raises:
+        ValueError: Si folder_path no es una carpeta.
     """
-    file_info_list = []
-    folder = pathlib.Path(folder_path)
-    if not folder.is_dir():
+    if not os.path.isdir(folder_path):
         raise ValueError(f"Ruta de carpeta no válida: {folder_path}")
+    return _walk_folder(os.path.abspath(folder_path), scan_filter or ScanFilter())
+
+
+def _walk_folder(folder_path: str, scan_filter: ScanFilter) -> Iterator[Dict]:
+    """Recorre folder_path en profundidad con os.scandir y genera un registro por archivo no filtrado."""
+    pending_dirs = [(folder_path, scan_filter.root_rules(folder_path))]
+    while pending_dirs:
+        current_dir, rules = pending_dirs.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Error al leer la carpeta {current_dir}: {e}")  # Registra el error y continua
+            continue
 
-    for file_path_obj in folder.rglob('*'):
-        if file_path_obj.is_file():
+        subdirs = []
+        for entry in entries:
+            relative_path = os.path.relpath(entry.path, folder_path).replace(os.sep, "/")
             try:
-                file_info = get_file_info(str(file_path_obj))  # get_file_info expects string path
-                file_info_list.append(file_info)
-            except Exception as e:
-                print(f"Error al procesar el archivo {file_path_obj}: {e}")  # Registra el error y continua
-    return file_info_list
+                if entry.is_dir(follow_symlinks=False):
+                    if scan_filter.should_descend(entry.path, relative_path, rules):
+                        subdirs.append((entry.path, scan_filter.rules_for(entry.path, rules)))
+                elif entry.is_file():
+                    file_stats = entry.stat()
+                    if not scan_filter.should_include(entry.path, relative_path, file_stats.st_size, rules):
+                        continue
+                    yield _file_record(entry.path, file_stats)
+            except OSError as e:
+                print(f"Error al procesar el archivo {entry.path}: {e}")  # Registra el error y continua
+        pending_dirs.extend(reversed(subdirs))  # Visitar las subcarpetas en orden alfabético
+
+
+def _file_record(file_path: str, file_stats: os.stat_result) -> Dict:
+    """El registro ligero de un archivo (sin su contenido), como los que genera scan_folder."""
+    return {
+        "name": os.path.basename(file_path),
+        "full_path": file_path,
+        "metadata": {
+            "size": file_stats.st_size,
+            "modification_date": file_stats.st_mtime,
+            "file_type": "file",
+        },
+    }
+
+
+def _rewrite_config(content: str, prompt_content: str) -> GeminisOptions:
+    """
+    Construye la petición que pide a Gemini el contenido completo reescrito. El prompt va en las
+    instrucciones del sistema, iguales para todos los archivos, y el contenido en el texto de entrada.
+    """
+    gemini_config = GeminisOptions()
+    gemini_config.set_system_instruction(f"Eres una herramienta que lee un archivo, aplica el siguiente cambio — '{prompt_content}' — "
+                                         "y reescribe el archivo con la modificación. El mensaje del usuario es el contenido "
+                                         "completo del archivo.")
+    gemini_config.set_input_text(content)
+    return gemini_config
+
+
+def _extract_modified_text(modified_content_data: Any, description: str, indent: str) -> Optional[str]:
+    """Extrae el texto modificado de la respuesta analizada de una petición de reescritura."""
+    # Extraer el contenido de texto del diccionario de respuesta
+    if isinstance(modified_content_data, dict) and modified_content_data:
+        modified_text = next(iter(modified_content_data.values()), None)
+        if modified_text is None or not isinstance(modified_text, str):
+            _log(f"{indent}No se pudo extraer contenido de texto válido del diccionario de respuesta de Gemini para {description}: {modified_content_data}")
+            return None
+        return modified_text
+    _log(f"{indent}Se recibió un diccionario no válido o vacío de parse_gemini_response para {description}: {modified_content_data}")
+    return None
+
+
+def _request_modified_text(content: str, prompt_content: str, context: ProcessingContext,
+                           description: str, indent: str = "  ", source: Optional[Dict] = None) -> Optional[str]:
+    """
+    Envía un contenido (un archivo completo o un fragmento) a Gemini y devuelve el texto modificado.
+
+    Args:
+        content (str): El contenido que se va a modificar.
+        prompt_content (str): El prompt para aplicar.
+        context (ProcessingContext): Estado compartido de la ejecución.
+        description (str): Descripción del contenido para los mensajes (p. ej., el nombre del archivo).
+        indent (str): Sangría de los mensajes de registro.
+        source (Dict): Archivo (y fragmento) de origen para las métricas ({"file", "chunk"}).
+
+    Returns:
+        Optional[str]: El texto modificado, o None si falla la llamada o el análisis de la respuesta.
+    """
+    gemini_config = _rewrite_config(content, prompt_content)
+    return _request_response_data(gemini_config, context, description, indent,
+                                  lambda data: _extract_modified_text(data, description, indent), source)
+
+
+def _line_edits_config(content: str, first_line: int, prompt_content: str) -> GeminisOptions:
+    """
+    Construye la petición del modo parche: el contenido con sus líneas numeradas a partir de
+    first_line y el esquema LINE_EDITS_RESPONSE_SCHEMA.
+    """
+    # Misma numeración que splice_file_lines: líneas delimitadas por '\n'
+    lines = content.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    numbered_content = "".join(f"{line_num}| {line}\n" for line_num, line in enumerate(lines, start=first_line))
+
+    gemini_config = GeminisOptions()
+    gemini_config.set_response_schema(LINE_EDITS_RESPONSE_SCHEMA)
+    gemini_config.set_system_instruction(
+        f"Eres una herramienta que lee un archivo con sus líneas numeradas, aplica el siguiente cambio — '{prompt_content}' — "
+        "y devuelve solo las ediciones necesarias. Cada edición reemplaza las líneas start_line a end_line "
+        "(inclusive, con la numeración mostrada) por el texto replacement, sin números de línea; un replacement "
+        "vacío elimina las líneas. Las ediciones no deben solaparse. Si no hace falta ningún cambio, devuelve "
+        "una lista de ediciones vacía. El mensaje del usuario es el archivo con sus líneas numeradas.")
+    gemini_config.set_input_text(numbered_content)
+    return gemini_config
+
+
+def _extract_line_edits(edits_data: Any, last_line: Optional[int], first_line: int, description: str,
+                        indent: str) -> Optional[List[Dict]]:
+    """Extrae y valida las ediciones de la respuesta analizada de una petición del modo parche."""
+    if not isinstance(edits_data, dict) or "edits" not in edits_data:
+        _log(f"{indent}La respuesta de Gemini para {description} no contiene una lista de ediciones: {edits_data}")
+        return None
+    try:
+        return validate_line_edits(edits_data["edits"], last_line, first_line)
+    except ValueError as e:
+        _log(f"{indent}Se recibieron ediciones no válidas de Gemini para {description}: {e}")
+        return None
+
+
+def _request_line_edits(content: str, first_line: int, prompt_content: str, context: ProcessingContext,
+                        description: str, indent: str = "  ", source: Optional[Dict] = None) -> Optional[List[Dict]]:
+    """
+    Modo parche: envía un contenido con sus líneas numeradas a Gemini y devuelve solo las ediciones
+    por rango de líneas, en lugar del contenido completo reescrito.
+
+    Args:
+        content (str): El contenido que se va a modificar (un archivo completo o un fragmento).
+        first_line (int): El número de línea, dentro del archivo, de la primera línea de content.
+        prompt_content (str): El prompt para aplicar.
+        context (ProcessingContext): Estado compartido de la ejecución.
+        description (str): Descripción del contenido para los mensajes (p. ej., el nombre del archivo).
+        indent (str): Sangría de los mensajes de registro.
+        source (Dict): Archivo (y fragmento) de origen para las métricas ({"file", "chunk"}).
+
+    Returns:
+        Optional[List[Dict]]: Las ediciones validadas ('start_line', 'end_line', 'replacement'),
+                              ordenadas por línea y con la numeración del archivo completo (una
+                              lista vacía si no hay cambios), o None si falla la llamada o la validación.
+    """
+    last_line = first_line + _line_count(content) - 1
+    gemini_config = _line_edits_config(content, first_line, prompt_content)
+    return _request_response_data(gemini_config, context, description, indent,
+                                  lambda data: _extract_line_edits(data, last_line, first_line, description, indent),
+                                  source)
+
+
+def _line_count(content: str) -> int:
+    """Número de líneas delimitadas por '\n' (sin contar una línea vacía tras el último salto)."""
+    return content.count("\n") + (0 if not content or content.endswith("\n") else 1)
 
 
-def process_large_file(file_info: Dict, prompt_content: str, divide: bool) -> Union[str, bool]:
+def _request_response_data(gemini_config: GeminisOptions, context: ProcessingContext, description: str,
+                           indent: str, extract: Callable[[Any], Any], source: Optional[Dict] = None) -> Any:
     """
-    Procesa un archivo grande (>300 líneas).
+    Obtiene la respuesta de Gemini a una petición (de la caché, en streaming o con una llamada
+    normal), analiza su JSON y devuelve el resultado de extract, que registra el problema y
+    devuelve None si la respuesta no es válida. Solo se guardan en la caché las respuestas válidas.
+    Con context.metrics, registra la petición (tiempos y tokens, con source como origen).
+
+    Con context.context_cache, la petición hace referencia al contexto en caché de sus
+    instrucciones del sistema; si la API lo rechaza, se repite una vez con las instrucciones en línea.
+    La clave de la caché de respuestas se calcula antes, con las instrucciones en línea, para que
+    no dependa del nombre del contexto. Con context.router, el modelo se elige antes, así que la
+    clave y el contexto son los del modelo elegido. Con context.dedup, las peticiones con la misma
+    clave (el mismo contenido, prompt y modelo) se envían una sola vez por ejecución.
+    """
+    if context.router is not None:
+        file_paths = [_route_path(path, context) for path in ((source.get("files") or [source["file"]]) if source else [])]
+        context.router.apply(gemini_config, file_paths, estimate_tokens(gemini_config.input_text))
+    response_text = None
+    from_cache = False
+    shared = False
+    key = cache_key(gemini_config) if context.cache is not None or context.dedup is not None else None
+    if context.cache is not None:
+        response_text = context.cache.get(key)
+        from_cache = response_text is not None
+    if from_cache:
+        _log(f"{indent}Respuesta obtenida de la caché para {description}.")
+        if context.metrics is not None:
+            context.metrics.record_request(source, "cached")
+    else:
+        # Los tiempos y el usageMetadata solo se piden a api_client si se miden
+        measured = {}
+
+        def on_first_byte(seconds):
+            measured["ttfb_s"] = seconds
+
+        def on_usage(usage):
+            measured["usage"] = usage
+
+        callbacks = {} if context.metrics is None else {"on_first_byte": on_first_byte, "on_usage": on_usage}
+        if context.hedge is not None:
+            callbacks["hedge"] = context.hedge
+
+        def send():
+            if context.stream:
+                return _stream_response_text(gemini_config, context, description, indent, **callbacks)
+            api_response = call_gemini_api(gemini_config, context.client, context.limiter, **callbacks)
+            return gemini_response_text(api_response) if api_response else None
+
+        def fetch():
+            response_text = None
+            start_time = time.monotonic()
+            try:
+                if context.context_cache is not None and context.context_cache.apply(gemini_config):
+                    try:
+                        response_text = send()
+                    except Exception as e:
+                        if not is_context_error(e):
+                            raise
+                        _log(f"{indent}Gemini rechazó el contexto en caché para {description}; se reintenta con las instrucciones en la petición.")
+                        context.context_cache.invalidate(gemini_config.cached_content)
+                        gemini_config.set_cached_content(None)
+                        response_text = send()
+                else:
+                    response_text = send()
+            finally:
+                if context.metrics is not None:
+                    context.metrics.record_request(source, "ok" if response_text else "failed",
+                                                   time.monotonic() - start_time, **measured)
+            return response_text
+
+        if context.dedup is not None:
+            response_text, shared = context.dedup.run(key, fetch)
+        else:
+            response_text = fetch()
+        if shared:
+            _log(f"{indent}Respuesta compartida con una petición idéntica para {description}.")
+            if context.metrics is not None:
+                context.metrics.record_request(source, "cached")
+        if not response_text:
+            _log(f"{indent}Error al llamar a la API de Gemini para {description}.")
+            return None
+
+    with _timed(context, "parse"):
+        response_data = parse_gemini_text(response_text) if response_text is not None else None
+        if not response_data:
+            _log(f"{indent}Error al analizar la respuesta de Gemini para {description}.")
+            return None
+        result = extract(response_data)
+    if result is not None and context.cache is not None and not from_cache and not shared:
+        context.cache.put(key, response_text)  # Solo se guardan respuestas válidas
+    return result
+
+
+def _route_path(file_path: str, context: ProcessingContext) -> str:
+    """La ruta de un archivo tal como la comparan las condiciones paths del enrutador: relativa a context.root."""
+    if context.root is None:
+        return file_path
+    return os.path.relpath(file_path, context.root).replace(os.sep, "/")
+
+
+def _stream_response_text(gemini_config: GeminisOptions, context: ProcessingContext, description: str, indent: str,
+                          **callbacks) -> str:
+    """
+    Recibe la respuesta de Gemini en modo streaming e informa del primer fragmento recibido y
+    del total al terminar, de modo que un stream detenido sea visible en el registro.
+    callbacks (on_first_byte, on_usage, hedge) se pasan a stream_gemini_api.
+
+    Los fragmentos se escriben según llegan en un archivo temporal (en memoria hasta
+    STREAM_SPOOL_BYTES), en lugar de acumularse en una lista que luego se une. El texto completo
+    se lee al terminar, porque la respuesta es un objeto JSON que hay que analizar entero (y que
+    guardan la caché y el deduplicador): el pico de memoria es una copia del texto, no dos.
+    """
+    start_time = time.monotonic()
+    received = {"chars": 0}
+
+    def on_text(text):
+        if received["chars"] == 0:
+            _log(f"{indent}Primeros datos recibidos para {description} tras {time.monotonic() - start_time:.1f} s.")
+        received["chars"] += len(text)
+
+    with tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_BYTES, mode="w+", encoding="utf-8") as sink:
+        stream_gemini_api(gemini_config, context.client, sink=sink, on_text=on_text, limiter=context.limiter,
+                          **callbacks)
+        _log(f"{indent}Respuesta completa para {description}: {received['chars']} caracteres en {time.monotonic() - start_time:.1f} s.")
+        sink.seek(0)
+        return sink.read()
+
+
+def _process_chunk(chunk_content: str, chunk_num: int, total_chunks: int, file_info: Dict, prompt_content: str,
+                   context: ProcessingContext, first_line: int = 1) -> Optional[Union[str, List[Dict]]]:
+    """
+    Envía un fragmento de un archivo grande a Gemini y devuelve el texto modificado (o, en modo
+    parche, sus ediciones por rango de líneas).
+
+    Args:
+        chunk_content (str): Contenido del fragmento.
+        chunk_num (int): Número del fragmento (basado en 1).
+        total_chunks (int): Número total de fragmentos del archivo.
+        file_info (Dict): Información del archivo original ('full_path', 'name').
+        prompt_content (str): El prompt para aplicar al fragmento.
+        context (ProcessingContext): Estado compartido de la ejecución.
+        first_line (int): El número de línea, dentro del archivo, de la primera línea del fragmento
+                          (solo se usa en modo parche).
+
+    Returns:
+        Optional[Union[str, List[Dict]]]: El texto modificado o las ediciones del fragmento, o None
+                                          si falla el procesamiento.
+    """
+    original_name = file_info['name']
+    if context.manifest is not None:
+        saved_output = context.manifest.chunk_output(file_info['full_path'], chunk_num, chunk_content)
+        if saved_output is not None:
+            _log(f"    Fragmento {chunk_num}/{total_chunks} de {original_name} reutilizado de una ejecución anterior.")
+            return saved_output
+
+    _log(f"    Procesando fragmento {chunk_num}/{total_chunks} para {original_name}...")
+    description = f"el fragmento {chunk_num} de {original_name}"
+    if context.patch:
+        chunk_output = _request_line_edits(chunk_content, first_line, prompt_content, context, description, indent="    ",
+                                           source={"file": file_info['full_path'], "chunk": chunk_num})
+    else:
+        chunk_output = _request_modified_text(chunk_content, prompt_content, context, description, indent="    ",
+                                              source={"file": file_info['full_path'], "chunk": chunk_num})
+    if chunk_output is not None and context.manifest is not None:
+        context.manifest.record_chunk(file_info['full_path'], chunk_num, chunk_content, chunk_output)
+    return chunk_output
+
+
+def process_large_file(file_info: Dict, prompt_content: str, divide: bool, context: Optional[ProcessingContext] = None) -> Union[str, bool]:
+    """
+    Procesa un archivo grande (que supera el presupuesto de tokens por petición).
+    Los fragmentos se forman con split_into_chunks: se llenan hasta context.chunk_tokens tokens
+    estimados y se cortan preferentemente al inicio de definiciones de nivel superior.
     Si divide es False, divide en fragmentos, procesa cada uno, combina los resultados y devuelve la cadena combinada.
     Si divide es True, divide en fragmentos, procesa cada uno, guarda cada fragmento permanentemente y devuelve True si tiene éxito, False si falla.
+    Los fragmentos se envían a Gemini en paralelo (hasta `context.workers` a la vez) y se reensamblan en su orden original.
+    Los archivos .partN solo se escriben cuando todos los fragmentos se procesaron con éxito.
 
     Args:
-        file_info (Dict): Información del archivo ('full_path', 'name', 'content').
+        file_info (Dict): Información del archivo ('full_path', 'name' y 'content', o 'lines' si se leyó con
+                          get_file_info(..., lazy=True)).
         prompt_content (str): El prompt para aplicar a cada fragmento.
         divide (bool): Si es True, guarda los fragmentos como archivos separados en lugar de fusionarlos.
+        context (ProcessingContext, opcional): Estado compartido de la ejecución. Si no se proporciona,
+                                              los fragmentos se procesan de forma secuencial.
 
     Returns:
         Union[str, bool]: Cadena de contenido combinada si divide es False y tiene éxito.
@@ -54,210 +523,918 @@ def process_large_file(file_info: Dict, prompt_content: str, divide: bool) -> Un
                           Una cadena vacía o False si falla el procesamiento.
     """
 
-    lines = file_info['content'].splitlines(keepends=True)
-    chunk_size = 300
-    total_chunks = (len(lines) + chunk_size - 1) // chunk_size
-    modified_chunks_content = []
-    temp_files = []
-    processed_chunk_paths = []  # Keep track of successfully saved permanent chunks if divide=True
+    if context is None:
+        context = ProcessingContext()
+
+    if 'lines' in file_info:
+        chunks = _LineRangeChunks(file_info['lines'], split_into_line_ranges(file_info['lines'], context.chunk_tokens))
+    else:
+        chunks = split_into_chunks(file_info['content'], context.chunk_tokens, file_info['name'])
+    total_chunks = len(chunks)
 
     original_path = pathlib.Path(file_info['full_path'])
     original_name = file_info['name']
 
     try:
-        for i in range(0, len(lines), chunk_size):
-            chunk_index = i // chunk_size
-            chunk_lines = lines[i:i + chunk_size]
-            chunk_content = "".join(chunk_lines)
-            chunk_num = chunk_index + 1
-
-            print(f"    Procesando fragmento {chunk_num}/{total_chunks} para {original_name}...")
-
-            # --- Llamada a la API de Gemini ---
-            gemini_config = GeminisOptions()
-            input_text = f"Eres una herramienta que lee un archivo, aplica el siguiente cambio — '{prompt_content}' — y reescribe el archivo con la modificación.\\n'{chunk_content}'"
-            gemini_config.set_input_text(input_text)
-
-            api_response = call_gemini_api(gemini_config)
-            if not api_response:
-                print(f"    Error al llamar a la API de Gemini para el fragmento {chunk_num} de {original_name}.")
-                # Si se divide, idealmente deberíamos limpiar los fragmentos guardados previamente, pero por simplicidad, simplemente fallamos.
-                return False if divide else ""
-
-            modified_chunk_data = parse_gemini_response(api_response)
-            if not modified_chunk_data:
-                print(f"    Error al analizar la respuesta de Gemini para el fragmento {chunk_num} de {original_name}.")
-                return False if divide else ""
-
-            # Extract text content from response
-            if isinstance(modified_chunk_data, dict) and modified_chunk_data:
-                modified_text = next(iter(modified_chunk_data.values()), None)
-                if modified_text is None or not isinstance(modified_text, str):
-                    print(f"    Contenido de texto no válido en la respuesta de Gemini para el fragmento {chunk_num} de {original_name}: {modified_chunk_data}")
-                    return False if divide else ""
-            else:
-                print(f"    Respuesta no válida o vacía de parse_gemini_response para el fragmento {chunk_num} de {original_name}: {modified_chunk_data}")
-                return False if divide else ""
-            # --- Fin de la llamada a la API de Gemini ---
+        modified_chunks_content = _process_chunks_in_order(chunks, file_info, prompt_content, context)
+        if modified_chunks_content is None:
+            return False if divide else ""
 
-            if divide:
-                # Save chunk permanently
+        if divide:
+            # Todos los fragmentos se procesaron con éxito: guardarlos permanentemente en orden
+            for chunk_num, modified_text in enumerate(modified_chunks_content, start=1):
                 output_filename = f"{original_path.stem}.part{chunk_num}{original_path.suffix}"
                 output_path = original_path.parent / output_filename
                 try:
-                    with open(output_path, 'w', encoding='utf-8') as f_out:
-                        f_out.write(modified_text)
-                    processed_chunk_paths.append(output_path)  # Seguimiento del éxito
-                    print(f"    Fragmento {chunk_num} procesado y guardado con éxito en {output_filename}.")
+                    _write_output(str(output_path), lambda path, text=modified_text: _write_text(path, text), context)
+                    if context.manifest is not None:
+                        # Evita reprocesar la parte al reanudar
+                        context.manifest.record_file(str(output_path), "done", content=modified_text)
+                    _log(f"    Fragmento {chunk_num} procesado y guardado con éxito en {output_filename}.")
                 except IOError as e:
-                    print(f"    Error al escribir el archivo de fragmento permanente {output_filename}: {e}")
-                    # ¿Limpiar los fragmentos ya guardados para este archivo? Tal vez sea demasiado complejo por ahora. Falla explícitamente.
+                    _log(f"    Error al escribir el archivo de fragmento permanente {output_filename}: {e}")
                     return False  # Indica falla para el modo de división
-            else:
-                # Usar archivo temporal y almacenar contenido para fusionar (lógica existente)
-                # Crear un archivo temporal para el fragmento (necesario para el seguimiento de la limpieza)
-                with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix=".txt", encoding='utf-8') as temp_f:
-                    # Ya no necesitamos estrictamente escribir el fragmento original aquí,
-                    # pero necesitamos la ruta del archivo temporal para el bloque final.
-                    # Simplemente hagamos un seguimiento de las rutas sin escribir.
-                    temp_path = temp_f.name
-                    temp_files.append(temp_path)  # Seguimiento para la limpieza
-
-                modified_chunks_content.append(modified_text)
-                print(f"    Fragmento {chunk_num} procesado con éxito.")
-
-        # --- Loop finished ---
-        if divide:
-            # Si llegamos aquí, todos los fragmentos se procesaron y guardaron con éxito
             return True
         else:
             # Combinar fragmentos modificados
+            for chunk_num in range(1, total_chunks + 1):
+                _log(f"    Fragmento {chunk_num} procesado con éxito.")
             return "".join(modified_chunks_content)
 
     except Exception as e:
-        print(f"    Se produjo un error durante el procesamiento de archivos grandes para {original_name}: {e}")
+        _log(f"    Se produjo un error durante el procesamiento de archivos grandes para {original_name}: {e}")
         return False if divide else ""  # Indica falla
+
+
+class _LineRangeChunks:
+    """
+    Los fragmentos de un archivo leído con get_file_info(..., lazy=True): cada uno se decodifica
+    de su LineIndexedFile solo al accederse, de modo que en memoria solo están los que se procesan.
+    """
+    def __init__(self, lines, ranges: List[Tuple[int, int]]):
+        self.lines = lines
+        self.ranges = ranges
+        self.first_lines = [start + 1 for start, _ in ranges]
+
+    def __len__(self) -> int:
+        return len(self.ranges)
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.ranges[index]
+        return self.lines.lines(start, end)
+
+
+def _chunk_first_lines(chunks: List[str]) -> List[int]:
+    """Devuelve el número de línea, dentro del archivo, de la primera línea de cada fragmento."""
+    if isinstance(chunks, _LineRangeChunks):
+        return chunks.first_lines
+    first_lines = []
+    next_line = 1
+    for chunk_content in chunks:
+        first_lines.append(next_line)
+        next_line += chunk_content.count("\n")
+    return first_lines
+
+
+def _process_chunks_in_order(chunks: List[str], file_info: Dict, prompt_content: str,
+                             context: ProcessingContext) -> Optional[List[Any]]:
+    """
+    Procesa los fragmentos de un archivo y devuelve los textos modificados (o, en modo parche, las
+    ediciones) en el mismo orden que los fragmentos originales.
+
+    Con context.executor (el grupo de trabajadores de los archivos), el hilo del archivo procesa
+    fragmentos y pide ayuda al grupo con hasta workers - 1 tareas que toman fragmentos de la misma
+    cola. No hay un grupo propio por archivo: entre archivos y fragmentos nunca hay más de
+    `workers` hilos trabajando. Si el grupo está ocupado con otros archivos, las ayudas no llegan
+    a empezar (o no encuentran fragmentos pendientes) y el hilo del archivo los procesa todos, así
+    que esperar a las ayudas no puede bloquear el grupo. Sin context.executor, los fragmentos se
+    procesan en orden en el hilo actual.
+
+    Returns:
+        Optional[List[Any]]: Los resultados de los fragmentos en orden, o None si algún fragmento falla.
+                             Al primer fallo no se empiezan más fragmentos.
+    """
+    total_chunks = len(chunks)
+    first_lines = _chunk_first_lines(chunks)
+
+    if context.executor is None or context.workers <= 1 or total_chunks <= 1:
+        modified_chunks_content = []
+        for chunk_num, chunk_content in enumerate(chunks, start=1):
+            modified_text = _process_chunk(chunk_content, chunk_num, total_chunks, file_info, prompt_content, context,
+                                           first_lines[chunk_num - 1])
+            if modified_text is None:
+                return None
+            modified_chunks_content.append(modified_text)
+        return modified_chunks_content
+
+    modified_chunks_content = [None] * total_chunks
+    next_chunk = iter(range(total_chunks))
+    next_chunk_lock = threading.Lock()
+    failed = threading.Event()
+
+    def process_pending_chunks():
+        while not failed.is_set():
+            with next_chunk_lock:
+                index = next(next_chunk, None)
+            if index is None:
+                return
+            try:
+                # Cada fragmento se obtiene en el hilo que lo procesa (los de _LineRangeChunks se leen entonces)
+                modified_text = _process_chunk(chunks[index], index + 1, total_chunks, file_info, prompt_content,
+                                               context, first_lines[index])
+            except BaseException:
+                failed.set()
+                raise
+            if modified_text is None:
+                failed.set()
+                return
+            modified_chunks_content[index] = modified_text
+
+    helper = _with_current_log_buffer(process_pending_chunks)
+    helpers = [context.executor.submit(helper) for _ in range(min(context.workers, total_chunks) - 1)]
+    try:
+        process_pending_chunks()
     finally:
-        # Limpiar archivos temporales SOLO si no se divide
-        if not divide:
-            for temp_path in temp_files:
-                try:
-                    os.remove(temp_path)
-                except OSError as e:
-                    print(f"    Advertencia: No se pudo eliminar el archivo temporal {temp_path}: {e}")
+        for future in helpers:
+            future.cancel()  # Las que no empezaron ya no hacen falta
+        for future in helpers:
+            if not future.cancelled():
+                future.exception()  # Esperar a los fragmentos en curso
+    for future in helpers:
+        if not future.cancelled() and future.exception() is not None:
+            raise future.exception()
+    return None if failed.is_set() else modified_chunks_content
+
+
+def _log(message: str):
+    """
+    Imprime un mensaje de registro. Si el hilo actual procesa un archivo dentro del grupo de
+    trabajadores, el mensaje se acumula y se imprime junto al resto de líneas de ese archivo.
+    """
+    buffered_lines = getattr(_log_buffer, "lines", None)
+    if buffered_lines is not None:
+        buffered_lines.append(message)
+    else:
+        with _log_lock:
+            print(message)
+
+
+def _with_current_log_buffer(function):
+    """
+    Envuelve una función para que, al ejecutarse en otro hilo, registre sus mensajes en el
+    búfer del hilo que la envolvió (p. ej., los fragmentos de un archivo procesado en paralelo).
+    """
+    buffered_lines = getattr(_log_buffer, "lines", None)
+
+    def wrapper(*args, **kwargs):
+        _log_buffer.lines = buffered_lines
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _log_buffer.lines = None
+
+    return wrapper
+
+
+def _process_file_buffered(work_item: List[Dict], prompt_content: str, divide: bool, context: ProcessingContext):
+    """
+    Procesa un archivo (o un paquete de archivos pequeños) acumulando sus mensajes de registro y
+    los imprime en bloque al terminar, para que las líneas de archivos procesados en paralelo no
+    se entremezclen. Si la ejecución se canceló antes de empezarlo, no lo procesa.
+    """
+    if _cancelled(context):
+        return
+    _log_buffer.lines = []
+    try:
+        _process_work_item(work_item, prompt_content, divide, context)
+    finally:
+        buffered_lines = _log_buffer.lines
+        _log_buffer.lines = None
+        with _log_lock:
+            for line in buffered_lines:
+                print(line)
+        if context.on_file_done is not None:
+            context.on_file_done(work_item, buffered_lines)
+
+
+def _cancelled(context: ProcessingContext) -> bool:
+    return context.cancel is not None and context.cancel.is_set()
+
+
+def _process_work_item(work_item: List[Dict], prompt_content: str, divide: bool, context: ProcessingContext):
+    """Procesa un elemento de _work_items: un archivo suelto o un paquete de archivos pequeños."""
+    with _timed(context, "file"):
+        if len(work_item) == 1:
+            _process_single_file(work_item[0], prompt_content, divide, context)
+        else:
+            _process_pack(work_item, prompt_content, divide, context)
+
+
+def _process_single_file(file_info: Dict, prompt_content: str, divide: bool, context: ProcessingContext):
+    """
+    Procesa un único archivo usando la API de Gemini y escribe el resultado.
+
+    Args:
+        file_info (Dict): Diccionario de información del archivo.
+        prompt_content (str): El prompt para aplicar.
+        divide (bool): Indica si se deben dividir los archivos grandes en fragmentos permanentes.
+        context (ProcessingContext): Estado compartido de la ejecución.
+    """
+    original_file_path = file_info['full_path']  # Almacenar para posible eliminación
+    original_file_name = file_info['name']
+    _log(f"Procesando archivo: {original_file_path}...")
+    try:
+        if 'content' not in file_info and 'lines' not in file_info:
+            # Registro ligero de scan_folder: cargar el contenido solo ahora (o, si el archivo es
+            # muy grande y se va a fragmentar, indexarlo por líneas sin leerlo entero)
+            lazy = not context.patch and file_info['metadata']['size'] >= LAZY_FILE_BYTES
+            file_info = get_file_info(original_file_path, lazy=lazy)
+
+        if context.manifest is not None and context.manifest.is_file_done(file_info):
+            _log(f"  Se omite {original_file_name}: ya se procesó en una ejecución anterior.")
+            return
+
+        if context.patch:
+            _patch_single_file(file_info, prompt_content, context)
+            return
+
+        # Comprobar si el archivo cabe en una sola petición
+        token_count = _estimated_file_tokens(file_info)
+        text_content = ""  # Inicializar text_content para el caso sin división
+        process_as_large_file = token_count > context.chunk_tokens
+        skip_final_write = False  # Bandera para omitir la escritura si se divide
+
+        if process_as_large_file:
+            _log(f"  El archivo {original_file_name} tiene ~{token_count} tokens, superando el presupuesto de {context.chunk_tokens} tokens por petición. Procesando en fragmentos...")
+            # Llamar a process_large_file con la bandera de división
+            large_file_result = process_large_file(file_info, prompt_content, divide, context)
+
+            if divide:
+                if large_file_result is True:
+                    _log(f"  Se procesó y dividió con éxito el archivo grande {original_file_name} en fragmentos.")
+                    skip_final_write = True  # No reescribir el original
+                    if context.staging is not None:
+                        # El original se elimina al confirmar; hasta entonces cuenta como terminado
+                        context.staging.stage_remove(original_file_path)
+                        _record_file_done(original_file_path, _original_content(file_info), context)
+                        return
+                    if context.manifest is not None:
+                        context.manifest.forget_chunks(original_file_path)
+                    _close_line_index(file_info)
+                    # Intentar eliminar el archivo original
+                    try:
+                        os.remove(original_file_path)
+                        _log(f"  Se eliminó con éxito el archivo grande original: {original_file_name}")
+                    except OSError as e:
+                        _log(f"  Advertencia: No se pudo eliminar el archivo grande original {original_file_name}: {e}")
+                    # Dividido con éxito, no hay nada más que hacer con este archivo
+                    return
+                else:  # large_file_result es False
+                    _log(f"  No se pudo procesar y dividir el archivo grande {original_file_name}.")
+                    return
+            else:  # No se divide, se espera una cadena de contenido combinada
+                # Comprobar si el resultado es una cadena no vacía (éxito)
+                if isinstance(large_file_result, str) and large_file_result:
+                     text_content = large_file_result  # Usar el contenido combinado
+                else:  # El resultado es una cadena vacía "" (falla)
+                    _log(f"  No se pudo procesar el archivo grande {original_file_name} para la fusión.")
+                    return
+
+        else:  # Procesar normalmente los archivos que caben en una petición
+            text_content = _request_modified_text(_file_text(file_info), prompt_content, context, original_file_name,
+                                                  source={"file": original_file_path})
+            if text_content is None:
+                return
+
+        # --- Fin del if/else para el procesamiento de archivos grandes/pequeños ---
+
+        # Escribir el contenido modificado final de nuevo en el archivo original
+        # Esto solo debería suceder si NO estamos dividiendo un archivo grande.
+        if not skip_final_write:
+            if text_content:  # Asegurarse de que tenemos contenido para escribir (de un archivo pequeño o un archivo grande fusionado)
+                _write_rewritten_file(file_info, text_content, context)
+            else:
+                # Este caso implica que ocurrió un problema en el procesamiento de archivos pequeños o en la fusión de archivos grandes
+                # (o el procesamiento de archivos grandes falló antes de establecer text_content)
+                if not process_as_large_file:  # Solo imprimir si no fue una falla de archivo grande (ya registrado)
+                    _log(f"  No se generó contenido válido para {original_file_name}, omitiendo la modificación.")
+
+    except Exception as e:
+        _log(f"  Se produjo un error al procesar {original_file_name}: {e}")
+        if context.manifest is not None and ('content' in file_info or 'lines' in file_info):
+            context.manifest.record_file(original_file_path, "failed", content=_original_content(file_info))
+    finally:
+        if 'lines' in file_info:
+            file_info['lines'].close()
+
+
+def _original_content(file_info: Dict):
+    """
+    El contenido original de un archivo: su texto o, si se leyó con lazy=True, su LineIndexedFile
+    (None si ya se cerró; el manifiesto lo lee entonces del disco).
+    """
+    if 'content' in file_info:
+        return file_info['content']
+    return None if file_info['lines'].closed else file_info['lines']
+
+
+def _close_line_index(file_info: Dict):
+    """
+    Cierra el mmap del original leído con lazy=True antes de sustituirlo o eliminarlo: en Windows
+    no se puede reemplazar ni borrar un archivo mapeado en memoria.
+    """
+    if 'lines' in file_info:
+        file_info['lines'].close()
+
+
+def _file_text(file_info: Dict) -> str:
+    """El contenido de un archivo como texto (leyéndolo entero si se abrió con lazy=True)."""
+    if 'content' in file_info:
+        return file_info['content']
+    return file_info['lines'].lines(0, file_info['lines'].line_count)
+
+
+def _timed(context: ProcessingContext, phase: str):
+    """Gestor de contexto que mide una fase en context.metrics (o no hace nada si no hay métricas)."""
+    return context.metrics.timed(phase) if context.metrics is not None else contextlib.nullcontext()
+
+
+def _write_output(file_path: str, write: Callable[[str], None], context: ProcessingContext):
+    """
+    Escribe una salida: directamente en file_path o, si hay un área de preparación, en ella, para
+    confirmarla al final de la ejecución.
+
+    Args:
+        file_path (str): La ruta del archivo de salida.
+        write (Callable[[str], None]): Función que escribe la salida en la ruta que recibe.
+        context (ProcessingContext): Estado compartido de la ejecución.
+    """
+    with _timed(context, "write"):
+        if context.staging is None:
+            write(file_path)
+            if context.on_write is not None:
+                context.on_write(file_path)
+        else:
+            context.staging.stage(file_path, write)
+
+
+def _write_rewritten_file(file_info: Dict, text_content: str, context: ProcessingContext):
+    """Escribe (o prepara) el contenido reescrito de un archivo y lo registra como terminado."""
+    original_file_path = file_info['full_path']
+    if context.staging is None:
+        _close_line_index(file_info)  # El original se sustituye ahora
+    _write_output(original_file_path,
+                  lambda path: modify_file_lines(original_file_path, None, text_content, output_path=path),
+                  context)
+    _record_file_done(original_file_path, _original_content(file_info), context)
+    _log(f"  Se modificó con éxito {file_info['name']}.")
+
+
+def _write_text(file_path: str, text: str):
+    with open(file_path, 'w', encoding='utf-8') as f_out:
+        f_out.write(text)
+
+
+def _record_file_done(file_path: str, original_content: str, context: ProcessingContext):
+    """
+    Registra un archivo como terminado en el manifiesto. Con un área de preparación, el archivo
+    del disco sigue siendo el original hasta confirmar, así que se registra su contenido original.
+    """
+    if context.manifest is None:
+        return
+    context.manifest.record_file(file_path, "done", content=original_content if context.staging is not None else None)
+
+
+def _patch_single_file(file_info: Dict, prompt_content: str, context: ProcessingContext):
+    """
+    Procesa un archivo en modo parche: pide a Gemini solo las ediciones por rango de líneas y las
+    aplica con apply_line_edits. Si el archivo supera el presupuesto de tokens, cada fragmento se
+    envía con la numeración de líneas del archivo completo y sus ediciones se aplican juntas.
+
+    Args:
+        file_info (Dict): Información del archivo ('full_path', 'name', 'content').
+        prompt_content (str): El prompt para aplicar.
+        context (ProcessingContext): Estado compartido de la ejecución.
+    """
+    original_file_name = file_info['name']
+    token_count = estimate_tokens(file_info['content'])
+    if token_count > context.chunk_tokens:
+        _log(f"  El archivo {original_file_name} tiene ~{token_count} tokens, superando el presupuesto de {context.chunk_tokens} tokens por petición. Procesando en fragmentos...")
+        chunks = split_into_chunks(file_info['content'], context.chunk_tokens, original_file_name)
+        chunk_edits = _process_chunks_in_order(chunks, file_info, prompt_content, context)
+        edits = None if chunk_edits is None else [edit for edits in chunk_edits for edit in edits]
+    else:
+        edits = _request_line_edits(file_info['content'], 1, prompt_content, context, original_file_name,
+                                    source={"file": file_info['full_path']})
+
+    if edits is None:
+        _log(f"  No se obtuvieron ediciones válidas para {original_file_name}, omitiendo la modificación.")
+        return
+    _write_patched_file(file_info, edits, context)
+
+
+def _write_patched_file(file_info: Dict, edits: List[Dict], context: ProcessingContext):
+    """Aplica (o prepara) las ediciones de un archivo y lo registra como terminado."""
+    if edits:
+        _write_output(file_info['full_path'],
+                      lambda path: apply_line_edits(file_info['full_path'], edits, output_path=path),
+                      context)
+        _log(f"  Se aplicaron {len(edits)} ediciones a {file_info['name']}.")
+    else:
+        _log(f"  Gemini no propuso cambios para {file_info['name']}.")
+    _record_file_done(file_info['full_path'], file_info['content'], context)
+
+
+def _estimated_file_tokens(file_info: Dict) -> int:
+    """
+    Estima los tokens de un archivo: por su contenido si ya está cargado o, si no (un registro de
+    scan_folder o un archivo leído con lazy=True), por su tamaño.
+    """
+    if 'content' in file_info:
+        return estimate_tokens(file_info['content'])
+    return -(-file_info['metadata']['size'] // CHARS_PER_TOKEN)
+
+
+def _work_items(file_info_list: Iterable[Dict], context: ProcessingContext) -> Iterator[List[Dict]]:
+    """
+    Agrupa los registros de archivos en elementos de trabajo. Sin context.pack_tokens, cada archivo
+    es un elemento. Con él, los archivos pequeños (hasta PACK_SMALL_FILE_RATIO del presupuesto,
+    estimados por su tamaño sin leerlos) se reúnen en paquetes de hasta context.pack_tokens tokens
+    y PACK_MAX_FILES archivos, y el resto sigue siendo un elemento por archivo.
+    """
+    if not context.pack_tokens:
+        for file_info in file_info_list:
+            yield [file_info]
+        return
+
+    pack, pack_tokens = [], 0
+    for file_info in file_info_list:
+        file_tokens = _estimated_file_tokens(file_info)
+        if file_tokens > context.pack_tokens * PACK_SMALL_FILE_RATIO:
+            yield [file_info]
+            continue
+        if pack and (pack_tokens + file_tokens > context.pack_tokens or len(pack) >= PACK_MAX_FILES):
+            yield pack
+            pack, pack_tokens = [], 0
+        pack.append(file_info)
+        pack_tokens += file_tokens
+    if pack:
+        yield pack
 
 
-def process_files_with_gemini(file_info_list: List[Dict], prompt_content: str, divide: bool):
+def _process_pack(file_info_list: List[Dict], prompt_content: str, divide: bool, context: ProcessingContext):
+    """
+    Procesa un paquete de archivos pequeños con una sola petición a Gemini y reparte el resultado
+    entre los archivos. Los archivos que faltan en la respuesta (o todos, si la petición falla) se
+    procesan después uno a uno.
+
+    Args:
+        file_info_list (List[Dict]): Registros de los archivos del paquete.
+        prompt_content (str): El prompt para aplicar.
+        divide (bool): Se pasa a _process_single_file para los archivos que se reintentan.
+        context (ProcessingContext): Estado compartido de la ejecución.
+    """
+    pending = []
+    for file_info in file_info_list:
+        try:
+            if 'content' not in file_info:
+                file_info = get_file_info(file_info['full_path'])
+        except Exception as e:
+            _log(f"  Se produjo un error al procesar {file_info['name']}: {e}")
+            continue
+        if context.manifest is not None and context.manifest.is_file_done(file_info):
+            _log(f"  Se omite {file_info['name']}: ya se procesó en una ejecución anterior.")
+            continue
+        pending.append(file_info)
+    if len(pending) <= 1:
+        for file_info in pending:
+            _process_single_file(file_info, prompt_content, divide, context)
+        return
+
+    # Rutas relativas a la carpeta común: identifican cada archivo sin exponer rutas absolutas
+    base_dir = os.path.commonpath([os.path.dirname(file_info['full_path']) for file_info in pending])
+    files_by_path = {os.path.relpath(file_info['full_path'], base_dir).replace(os.sep, "/"): file_info
+                     for file_info in pending}
+    _log(f"Procesando paquete de {len(pending)} archivos en {base_dir}: {', '.join(files_by_path)}...")
+
+    try:
+        packed_outputs = _request_packed_files(files_by_path, prompt_content, context, f"el paquete de {len(pending)} archivos")
+    except Exception as e:
+        _log(f"  Se produjo un error al procesar el paquete: {e}")
+        packed_outputs = None
+
+    missing = []
+    for path, file_info in files_by_path.items():
+        text_content = (packed_outputs or {}).get(path)
+        if not text_content:
+            missing.append(file_info)
+            continue
+        try:
+            _write_rewritten_file(file_info, text_content, context)
+        except Exception as e:
+            _log(f"  Se produjo un error al escribir {file_info['name']}: {e}")
+    if missing:
+        _log(f"  {len(missing)} archivos del paquete no se recibieron en la respuesta; se procesan por separado.")
+        for file_info in missing:
+            _process_single_file(file_info, prompt_content, divide, context)
+
+
+def _request_packed_files(files_by_path: Dict[str, Dict], prompt_content: str, context: ProcessingContext,
+                          description: str) -> Optional[Dict[str, str]]:
+    """
+    Envía varios archivos en una sola petición (esquema PACKED_FILES_RESPONSE_SCHEMA) y devuelve
+    el contenido modificado de cada ruta recibida, o None si falla la llamada o el análisis.
+    """
+    gemini_config = GeminisOptions()
+    gemini_config.set_response_schema(PACKED_FILES_RESPONSE_SCHEMA)
+    packed_files = json.dumps([{"path": path, "content": file_info['content']} for path, file_info in files_by_path.items()],
+                              ensure_ascii=False)
+    gemini_config.set_system_instruction(
+        f"Eres una herramienta que lee varios archivos, aplica el siguiente cambio — '{prompt_content}' — a cada uno "
+        "y reescribe cada archivo completo con la modificación. Devuelve todos los archivos, cada uno con la misma "
+        "ruta (path) con la que se recibió. El mensaje del usuario es una lista JSON de archivos (path y content).")
+    gemini_config.set_input_text(packed_files)
+
+    def extract_files(files_data):
+        files = files_data.get("files") if isinstance(files_data, dict) else None
+        if not isinstance(files, list):
+            _log(f"  La respuesta de Gemini para {description} no contiene una lista de archivos: {files_data}")
+            return None
+        return {item["path"]: item["content"] for item in files
+                if isinstance(item, dict) and item.get("path") in files_by_path and isinstance(item.get("content"), str)}
+
+    return _request_response_data(gemini_config, context, description, "  ", extract_files,
+                                  {"files": [file_info['full_path'] for file_info in files_by_path.values()]})
+
+
+def process_files_with_gemini(file_info_list: Iterable[Dict], prompt_content: str, divide: bool,
+                              context: Optional[ProcessingContext] = None) -> int:
     """
     Procesa cada archivo usando la API de Gemini. Maneja archivos grandes dividiéndolos en fragmentos.
     Si divide es True, los archivos grandes se dividen en archivos de fragmentos permanentes y el original se elimina si tiene éxito.
+    Si context.workers es mayor que 1, se procesan hasta `workers` archivos a la vez y los mensajes de
+    cada archivo se imprimen juntos cuando ese archivo termina. Los fragmentos de cada archivo grande
+    también se envían en paralelo en el mismo grupo, de modo que entre archivos y fragmentos hay
+    como mucho `workers` peticiones a la vez. Con context.executor, los archivos se procesan en ese
+    grupo compartido (con hasta 2 * workers pendientes por llamada) en lugar de en uno propio. Si se activa context.cancel, no se toman más archivos del iterable.
+
+    Los archivos se consumen del iterable a medida que hay trabajadores libres (como mucho
+    2 * workers registros pendientes), por lo que el procesamiento puede empezar mientras
+    scan_folder sigue recorriendo la carpeta y el contenido en memoria depende de la concurrencia,
+    no del tamaño del árbol.
 
     Args:
-        file_info_list (List[Dict]): Lista de diccionarios de información de archivos.
+        file_info_list (Iterable[Dict]): Registros de archivos (de scan_folder o de get_file_info).
         prompt_content (str): El prompt para aplicar.
         divide (bool): Indica si se deben dividir los archivos grandes en fragmentos permanentes.
+        context (ProcessingContext, opcional): Estado compartido de la ejecución (trabajadores, cliente HTTP).
+                                              Si no se proporciona, los archivos se procesan de forma secuencial.
+
+    Returns:
+        int: El número de archivos recibidos del iterable.
     """
-    for file_info in file_info_list:
-        original_file_path = file_info['full_path']  # Almacenar para posible eliminación
-        original_file_name = file_info['name']
-        print(f"Procesando archivo: {original_file_path}...")
+    if context is None:
+        context = ProcessingContext()
+    if context.metrics is not None:
+        file_info_list = context.metrics.timed_iter(file_info_list, "scan")
+
+    file_count = 0
+    if context.workers == 1 and context.executor is None:
+        process_work_item = _process_work_item if context.on_file_done is None else _process_file_buffered
+        for work_item in _work_items(file_info_list, context):
+            if _cancelled(context):
+                break
+            file_count += len(work_item)
+            process_work_item(work_item, prompt_content, divide, context)
+        return file_count
+
+    pending_limit = 2 * context.workers
+    pending_slots = threading.BoundedSemaphore(pending_limit)
+    errors = []
+
+    def on_done(future):
+        pending_slots.release()
+        if future.exception() is not None:
+            errors.append(future.exception())
+
+    # Los fragmentos de los archivos grandes también se procesan en este grupo (ver
+    # _process_chunks_in_order), así que `workers` limita todos los hilos de la ejecución
+    own_executor = context.executor is None
+    if own_executor:
+        context.executor = ThreadPoolExecutor(max_workers=context.workers, thread_name_prefix="cambiacosas-worker")
+    executor = context.executor
+    try:
+        for work_item in _work_items(file_info_list, context):
+            if _cancelled(context):
+                break
+            file_count += len(work_item)
+            pending_slots.acquire()
+            future = executor.submit(_process_file_buffered, work_item, prompt_content, divide, context)
+            future.add_done_callback(on_done)
+    finally:
+        # Esperar a los archivos pendientes de esta llamada (un grupo compartido no se puede cerrar)
+        for _ in range(pending_limit):
+            pending_slots.acquire()
+        if own_executor:
+            executor.shutdown()
+            context.executor = None
+    if errors:
+        raise errors[0]
+    return file_count
+
+
+def watch_folder(folder_path: str, prompt_content: str, context: ProcessingContext,
+                 scan_filter: Optional[ScanFilter] = None, watcher: Optional[FileWatcher] = None,
+                 stop: Optional[threading.Event] = None) -> int:
+    """
+    Procesa la carpeta y después la vigila: en cada tanda de cambios (ver FileWatcher) procesa
+    solo los archivos cuyo contenido cambió, con el mismo contexto durante todo el proceso (las
+    conexiones HTTP, las cachés, el contexto en caché de Gemini y el limitador siguen activos
+    entre tandas).
+
+    Se guarda el hash del contenido de cada archivo procesado y de cada salida escrita
+    (context.on_write). Un archivo cuyo contenido coincide con el hash guardado no se procesa:
+    así se ignoran las escrituras propias y los archivos guardados sin cambios, y un archivo cuyo
+    procesamiento falló no se reintenta hasta que vuelve a cambiar. Los archivos grandes se
+    procesan en fragmentos y se fusionan (nunca se dividen).
+
+    Args:
+        folder_path (str): Ruta a la carpeta.
+        prompt_content (str): El prompt para aplicar.
+        context (ProcessingContext): Estado compartido del proceso. No debe tener área de preparación.
+        scan_filter (ScanFilter, opcional): Filtros del escaneo y de la vigilancia.
+        watcher (FileWatcher, opcional): Vigilante de la carpeta, que se cierra al terminar. Si no se
+                                         proporciona, se crea uno antes del recorrido inicial.
+        stop (threading.Event, opcional): Termina la vigilancia cuando se activa. Sin él, se vigila
+                                          hasta que se interrumpe el proceso (KeyboardInterrupt).
+
+    Returns:
+        int: El número de archivos procesados, en el recorrido inicial y en las tandas.
+
+    Raises:
+        ValueError: Si folder_path no es una carpeta.
+    """
+    if watcher is None:
+        # Antes del recorrido inicial, para no perder los cambios que ocurran durante él
+        watcher = FileWatcher(folder_path, scan_filter)
+    known_hashes: Dict[str, str] = {}  # ruta -> hash del contenido procesado o escrito por última vez
+    hashes_lock = threading.Lock()
+
+    def remember_write(file_path: str):
+        digest = _file_content_hash(file_path)
+        with hashes_lock:
+            known_hashes[file_path] = digest
+
+    previous_on_write = context.on_write
+    context.on_write = remember_write
+    try:
+        file_count = process_files_with_gemini(scan_folder(folder_path, scan_filter), prompt_content, False, context)
+        _log(f"Vigilando {folder_path} ({watcher.backend}); pulse Ctrl+C para terminar.")
+        while stop is None or not stop.is_set():
+            changed_paths = watcher.wait(timeout=None if stop is None else WATCH_STOP_CHECK_SECONDS)
+            file_records = _changed_file_records(changed_paths, known_hashes, hashes_lock)
+            if not file_records:
+                continue
+            _log(f"Cambiaron {len(file_records)} archivos; procesándolos...")
+            file_count += process_files_with_gemini(file_records, prompt_content, False, context)
+            if context.dedup is not None:
+                context.dedup.clear()
+    finally:
+        context.on_write = previous_on_write
+        watcher.close()
+    return file_count
+
+
+def _file_content_hash(file_path: str) -> Optional[str]:
+    """El hash del contenido de un archivo (leído por bloques), o None si no se puede leer como texto."""
+    try:
+        with LineIndexedFile(file_path) as lines:
+            return content_hash(lines)
+    except (OSError, ValueError):  # Se eliminó o no es UTF-8 (UnicodeDecodeError)
+        return None
+
+
+def _changed_file_records(paths: Iterable[str], known_hashes: Dict[str, str], hashes_lock: threading.Lock) -> List[Dict]:
+    """
+    Devuelve los registros ligeros de los archivos de paths cuyo contenido no coincide con su hash
+    en known_hashes, y guarda en él el hash nuevo.
+    """
+    file_records = []
+    for file_path in paths:
+        digest = _file_content_hash(file_path)
         try:
-            # Comprobar el número de líneas en el archivo
-            line_count = len(file_info['content'].splitlines())
-            text_content = ""  # Inicializar text_content para el caso sin división
-            process_as_large_file = line_count > 300
-            skip_final_write = False  # Bandera para omitir la escritura si se divide
-
-            if process_as_large_file:
-                print(f"  El archivo {original_file_name} tiene {line_count} líneas, superando las 300 líneas. Procesando en fragmentos...")
-                # Llamar a process_large_file con la bandera de división
-                large_file_result = process_large_file(file_info, prompt_content, divide)
-
-                if divide:
-                    if large_file_result is True:
-                        print(f"  Se procesó y dividió con éxito el archivo grande {original_file_name} en fragmentos.")
-                        skip_final_write = True  # No reescribir el original
-                        # Intentar eliminar el archivo original
-                        try:
-                            os.remove(original_file_path)
-                            print(f"  Se eliminó con éxito el archivo grande original: {original_file_name}")
-                        except OSError as e:
-                            print(f"  Advertencia: No se pudo eliminar el archivo grande original {original_file_name}: {e}")
-                        # Dividido con éxito, continuar con el siguiente archivo en la lista
-                        continue
-                    else:  # large_file_result es False
-                        print(f"  No se pudo procesar y dividir el archivo grande {original_file_name}.")
-                        continue  # Saltar al siguiente archivo
-                else:  # No se divide, se espera una cadena de contenido combinada
-                    # Comprobar si el resultado es una cadena no vacía (éxito)
-                    if isinstance(large_file_result, str) and large_file_result:
-                         text_content = large_file_result  # Usar el contenido combinado
-                    else:  # El resultado es una cadena vacía "" (falla)
-                        print(f"  No se pudo procesar el archivo grande {original_file_name} para la fusión.")
-                        continue  # Saltar al siguiente archivo
-
-            else:  # Procesar normalmente para archivos <= 300 líneas
-                # Crear instancia de GeminisOptions
-                gemini_config = GeminisOptions()
-
-                # Formatear el texto de entrada y establecerlo
-                input_text = f"Eres una herramienta que lee un archivo, aplica el siguiente cambio — '{prompt_content}' — y reescribe el archivo con la modificación.\\n'{file_info['content']}'"
-                gemini_config.set_input_text(input_text)
-
-                # Llamar a la API de Gemini
-                api_response = call_gemini_api(gemini_config)
-                if not api_response:
-                    print(f"  Error al llamar a la API de Gemini para {file_info['name']}.")
-                    continue  # Saltar al siguiente archivo
-
-                # Analizar la respuesta
-                modified_content_data = parse_gemini_response(api_response)
-                if not modified_content_data:
-                    print(f"  Error al analizar la respuesta de Gemini para {file_info['name']}.")
-                    continue  # Saltar al siguiente archivo
-
-                # Extraer el contenido de texto del diccionario de respuesta
-                if isinstance(modified_content_data, dict) and modified_content_data:
-                    extracted_text = next(iter(modified_content_data.values()), None)
-                    if extracted_text is None or not isinstance(extracted_text, str):
-                        print(f"  No se pudo extraer contenido de texto válido del diccionario de respuesta de Gemini para {file_info['name']}: {modified_content_data}")
-                        continue  # Saltar al siguiente archivo
-                    text_content = extracted_text  # Asignar el texto extraído
-                else:
-                    print(f"  Se recibió un diccionario no válido o vacío de parse_gemini_response para {file_info['name']}: {modified_content_data}")
-                    continue  # Saltar al siguiente archivo
+            file_stats = os.stat(file_path)
+        except OSError:
+            continue
+        with hashes_lock:
+            if digest is None or known_hashes.get(file_path) == digest:
+                continue
+            known_hashes[file_path] = digest
+        file_records.append(_file_record(file_path, file_stats))
+    return file_records
+
 
-            # --- Fin del if/else para el procesamiento de archivos grandes/pequeños ---
+def batch_submit(file_info_list: Iterable[Dict], folder_path: str, prompt_content: str, output_path: str,
+                 context: Optional[ProcessingContext] = None) -> int:
+    """
+    Serializa, sin llamar a la API, todas las peticiones que haría un procesamiento normal en un
+    archivo JSON Lines de entrada para la API de lotes de Gemini (una línea {"key", "request"} por
+    archivo o fragmento). Las claves (ver batch_key) identifican la ruta relativa, el fragmento y
+    el contenido, de modo que batch_apply puede aplicar los resultados más tarde o en otra máquina.
 
-            # Escribir el contenido modificado final de nuevo en el archivo original
-            # Esto solo debería suceder si NO estamos dividiendo un archivo grande.
-            if not skip_final_write:
-                if text_content:  # Asegurarse de que tenemos contenido para escribir (de un archivo pequeño o un archivo grande fusionado)
-                    modify_file_lines(file_path=original_file_path, line_range=None, new_content=text_content)
-                    print(f"  Se modificó con éxito {original_file_name}.")
+    Se respetan context.chunk_tokens (los archivos grandes se envían en fragmentos) y
+    context.patch (peticiones de ediciones por rango de líneas).
+
+    Args:
+        file_info_list (Iterable[Dict]): Registros de archivos (de scan_folder o de get_file_info).
+        folder_path (str): La carpeta procesada; las claves usan rutas relativas a ella.
+        prompt_content (str): El prompt para aplicar.
+        output_path (str): Ruta del archivo JSON Lines que se escribe.
+        context (ProcessingContext, opcional): Estado compartido de la ejecución.
+
+    Returns:
+        int: El número de peticiones escritas.
+    """
+    if context is None:
+        context = ProcessingContext()
+    folder = os.path.abspath(folder_path)
+    request_count = 0
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        for file_info in file_info_list:
+            try:
+                if 'content' not in file_info:
+                    file_info = get_file_info(file_info['full_path'])
+            except Exception as e:
+                print(f"Error al leer {file_info['full_path']}: {e}")
+                continue
+            content = file_info['content']
+            relative_path = os.path.relpath(os.path.abspath(file_info['full_path']), folder).replace(os.sep, "/")
+            if estimate_tokens(content) > context.chunk_tokens:
+                chunks = split_into_chunks(content, context.chunk_tokens, file_info['name'])
+            else:
+                chunks = [content]
+            file_hash = content_hash(content)
+            for chunk_num, (chunk_content, first_line) in enumerate(zip(chunks, _chunk_first_lines(chunks)), start=1):
+                if context.patch:
+                    gemini_config = _line_edits_config(chunk_content, first_line, prompt_content)
                 else:
-                    # Este caso implica que ocurrió un problema en el procesamiento de archivos pequeños o en la fusión de archivos grandes
-                    # (o el procesamiento de archivos grandes falló antes de establecer text_content)
-                    if not process_as_large_file:  # Solo imprimir si no fue una falla de archivo grande (ya registrado)
-                        print(f"  No se generó contenido válido para {original_file_name}, omitiendo la modificación.")
+                    gemini_config = _rewrite_config(chunk_content, prompt_content)
+                key = batch_key(relative_path, chunk_num, len(chunks), file_hash)
+                output_file.write(batch_request_line(key, gemini_config))
+                request_count += 1
+    return request_count
 
-        except Exception as e:
-            print(f"  Se produjo un error al procesar {original_file_name}: {e}")
 
+def batch_apply(folder_path: str, results_path: str, context: Optional[ProcessingContext] = None) -> Dict[str, int]:
+    """
+    Aplica los resultados de un trabajo por lotes (ver read_batch_results) a los archivos de una
+    carpeta con la misma ruta de escritura que un procesamiento normal (incluida el área de
+    preparación de context.staging, si la hay).
 
-def main():
-    parser = argparse.ArgumentParser(description="Procesa archivos usando la API de Gemini, con fragmentación opcional para archivos grandes.")
-    parser.add_argument("folder_name", help="Ruta a la carpeta que contiene los archivos para procesar.")
-    parser.add_argument("prompt_file", help="Ruta al archivo que contiene el prompt de procesamiento.")
-    parser.add_argument("--divide", action="store_true", help="Divide archivos grandes (>300 líneas) en archivos de fragmentos procesados separados en lugar de fusionarlos.")
+    Un archivo solo se modifica si su contenido sigue siendo el que se envió (se compara el hash
+    de la clave) y están todos sus fragmentos sin error. El modo de cada archivo se deduce de la
+    respuesta: una lista de ediciones se aplica con apply_line_edits y un texto reescrito
+    sustituye el archivo (uniendo los fragmentos en orden).
 
-    args = parser.parse_args()
+    Args:
+        folder_path (str): La carpeta a la que se refieren las rutas relativas de las claves.
+        results_path (str): Ruta al archivo JSON Lines de resultados.
+        context (ProcessingContext, opcional): Estado compartido de la ejecución.
+
+    Returns:
+        Dict[str, int]: Número de archivos aplicados ('applied') y omitidos ('skipped').
+    """
+    if context is None:
+        context = ProcessingContext()
+    folder = os.path.abspath(folder_path)
+    files: Dict[str, Dict[str, Any]] = {}
+    for key, response_text, error in read_batch_results(results_path):
+        if key is None:
+            print(f"Advertencia: Se omite un resultado no válido de {results_path}: {error}")
+            continue
+        try:
+            relative_path, chunk_num, total_chunks, hash_prefix = parse_batch_key(key)
+        except ValueError as e:
+            print(f"Advertencia: {e}")
+            continue
+        entry = files.setdefault(relative_path, {"total": total_chunks, "hash": hash_prefix, "outputs": {}, "errors": []})
+        if (total_chunks, hash_prefix) != (entry["total"], entry["hash"]):
+            entry["errors"].append(f"claves de envíos distintos ({key})")
+        elif error is not None:
+            entry["errors"].append(f"fragmento {chunk_num}: {error}")
+        else:
+            entry["outputs"][chunk_num] = response_text
+
+    counts = {"applied": 0, "skipped": 0}
+    for relative_path in sorted(files):
+        applied = _apply_batch_file(folder, relative_path, files[relative_path], context)
+        counts["applied" if applied else "skipped"] += 1
+    return counts
+
+
+def _apply_batch_file(folder: str, relative_path: str, entry: Dict[str, Any], context: ProcessingContext) -> bool:
+    """Aplica los resultados de un archivo de un trabajo por lotes. Devuelve True si se aplicaron."""
+    file_path = os.path.abspath(os.path.join(folder, *relative_path.split("/")))
+    if os.path.commonpath([folder, file_path]) != folder:
+        print(f"Advertencia: Se omite {relative_path}: la ruta está fuera de la carpeta.")
+        return False
+    if entry["errors"]:
+        print(f"Advertencia: Se omite {relative_path}: {'; '.join(str(error) for error in entry['errors'])}")
+        return False
+    missing = [chunk_num for chunk_num in range(1, entry["total"] + 1) if chunk_num not in entry["outputs"]]
+    if missing:
+        print(f"Advertencia: Se omite {relative_path}: faltan los fragmentos {missing}.")
+        return False
+    try:
+        file_info = get_file_info(file_path)
+    except Exception as e:
+        print(f"Advertencia: Se omite {relative_path}: {e}")
+        return False
+    if content_hash(file_info['content'])[:len(entry["hash"])] != entry["hash"]:
+        print(f"Advertencia: Se omite {relative_path}: el archivo cambió después de generar las peticiones.")
+        return False
+
+    responses = [parse_gemini_text(entry["outputs"][chunk_num] or "") for chunk_num in range(1, entry["total"] + 1)]
+    try:
+        if all(isinstance(data, dict) and "edits" in data for data in responses):
+            # Las ediciones de todos los fragmentos usan la numeración del archivo completo
+            edits = _extract_line_edits({"edits": [edit for data in responses for edit in data["edits"]]},
+                                        _line_count(file_info['content']), 1, relative_path, "  ")
+            if edits is None:
+                return False
+            _write_patched_file(file_info, edits, context)
+        else:
+            texts = [_extract_modified_text(data, relative_path, "  ") for data in responses]
+            if any(not text for text in texts):
+                _log(f"  No se obtuvo contenido válido para {relative_path}, omitiendo la modificación.")
+                return False
+            _write_rewritten_file(file_info, "".join(texts), context)
+    except Exception as e:
+        _log(f"  Se produjo un error al aplicar {relative_path}: {e}")
+        return False
+    return True
+
+
+def default_batch_path(folder_path: str) -> str:
+    """
+    Devuelve la ruta por defecto del archivo de peticiones de batch submit: un archivo oculto
+    junto a la carpeta (no dentro de ella, para que el escaneo no lo procese).
+    """
+    folder = os.path.abspath(folder_path)
+    return os.path.join(os.path.dirname(folder), f".{os.path.basename(folder)}.cambiacosas-batch.jsonl")
+
+
+def _parse_size(value: str) -> int:
+    """Convierte un tamaño como '2048', '500K', '2M' o '1G' a bytes (para argparse)."""
+    multipliers = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = value.strip().upper().rstrip("B")
+    try:
+        if text and text[-1] in multipliers:
+            size = int(float(text[:-1]) * multipliers[text[-1]])
+        else:
+            size = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Tamaño no válido: {value}")
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"El tamaño debe ser positivo: {value}")
+    return size
+
+
+def _rollback(staging_dir: str):
+    """Deshace la última confirmación del área de preparación indicada."""
+    if not os.path.isdir(staging_dir):
+        print(f"Error: No existe el directorio de preparación {staging_dir}.")
+        sys.exit(1)
+    staging = StagingArea(staging_dir, resume=True)
+    try:
+        undone = staging.rollback()
+        print(f"Se deshizo la última confirmación: {undone} archivos restaurados.")
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        staging.close()
+
+
+def _write_metrics(metrics: RunMetrics, report_path: Optional[str], prometheus_path: Optional[str]):
+    """Escribe el informe de la ejecución y el archivo de Prometheus que se hayan pedido."""
+    tokens = metrics.summary()["tokens"]
+    print(f"Tokens usados: {tokens['prompt']} de entrada, {tokens['candidates']} de salida ({tokens['total']} en total).")
+    try:
+        if report_path:
+            if report_path.endswith((".ndjson", ".jsonl")):
+                metrics.write_ndjson(report_path)
+            else:
+                metrics.write_json(report_path)
+            print(f"Informe de la ejecución escrito en {report_path}.")
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path)
+    except OSError as e:
+        print(f"Advertencia: No se pudo escribir el informe de la ejecución: {e}")
 
-    folder_name = args.folder_name
-    prompt_file_path = args.prompt_file
-    divide_flag = args.divide
 
-    # Leer el contenido del archivo de prompt
+def _read_prompt_file(prompt_file_path: str) -> str:
+    """Lee el contenido del archivo de prompt o termina la ejecución con un error."""
     try:
         with open(prompt_file_path, 'r', encoding='utf-8') as f:
             prompt_content = f.read().strip()
@@ -269,18 +1446,528 @@ def main():
     except Exception as e:
         print(f"Error al leer el archivo de prompt: {e}")
         sys.exit(1)
+    return prompt_content
+
+
+def _add_scan_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB", help="Procesa solo los archivos cuya ruta relativa o nombre coincide con el glob (se puede repetir).")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB", help="Omite los archivos y carpetas cuya ruta relativa o nombre coincide con el glob (se puede repetir).")
+    parser.add_argument("--max-size", type=_parse_size, metavar="TAMAÑO", help="Omite los archivos mayores que este tamaño (p. ej., 500K o 2M).")
+    parser.add_argument("--no-ignore", action="store_true", help="No aplica .gitignore ni omite carpetas como .git, node_modules o entornos virtuales.")
+
+
+def _batch_main(argv: List[str]):
+    """
+    Subcomandos de trabajos por lotes: `batch submit` genera el archivo JSON Lines de peticiones
+    sin llamar a la API y `batch apply` aplica un archivo de resultados a la carpeta.
+    """
+    parser = argparse.ArgumentParser(prog="cambiacosas batch", description="Trabajos por lotes: genera las peticiones a Gemini en JSON Lines y aplica sus resultados más tarde.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = subparsers.add_parser("submit", help="Escribe todas las peticiones de la carpeta en un archivo JSON Lines, sin llamar a la API.")
+    submit_parser.add_argument("folder_name", help="Ruta a la carpeta que contiene los archivos para procesar.")
+    submit_parser.add_argument("prompt_file", help="Ruta al archivo que contiene el prompt de procesamiento.")
+    submit_parser.add_argument("-o", "--output", help="Archivo de peticiones (por defecto: .<carpeta>.cambiacosas-batch.jsonl junto a la carpeta).")
+    submit_parser.add_argument("--patch", action="store_true", help="Genera peticiones del modo parche (ediciones por rango de líneas).")
+    submit_parser.add_argument("--chunk-tokens", type=int, help="Presupuesto de tokens estimados por petición (por defecto: según el modelo).")
+    _add_scan_arguments(submit_parser)
+
+    apply_parser = subparsers.add_parser("apply", help="Aplica un archivo JSON Lines de resultados a los archivos de la carpeta.")
+    apply_parser.add_argument("folder_name", help="Ruta a la carpeta a la que se refieren los resultados.")
+    apply_parser.add_argument("results_file", help="Archivo JSON Lines de resultados ({\"key\", \"response\"} por línea).")
+    apply_parser.add_argument("--stage", action="store_true", help="Prepara las salidas y las confirma juntas al terminar (se deshacen con --rollback).")
+    apply_parser.add_argument("--staging-dir", help="Directorio de preparación (por defecto: .<carpeta>.cambiacosas-staging junto a la carpeta).")
+    apply_parser.add_argument("--fsync", action="store_true", help="Con --stage, fuerza a disco las salidas y los directorios al confirmar.")
+
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.folder_name):
+        parser.error(f"La ruta de la carpeta no es válida: {args.folder_name}")
+
+    if args.command == "submit":
+        if args.chunk_tokens is not None and args.chunk_tokens < 1:
+            parser.error("--chunk-tokens debe ser un entero positivo.")
+        prompt_content = _read_prompt_file(args.prompt_file)
+        output_path = args.output or default_batch_path(args.folder_name)
+        scan_filter = ScanFilter(include=args.include, exclude=args.exclude, max_size=args.max_size,
+                                 use_gitignore=not args.no_ignore)
+        context = ProcessingContext(chunk_tokens=args.chunk_tokens, patch=args.patch)
+        try:
+            request_count = batch_submit(scan_folder(args.folder_name, scan_filter), args.folder_name, prompt_content,
+                                         output_path, context)
+        except (GeminiOptionsError, OSError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Se escribieron {request_count} peticiones en {output_path} (modelo: {DEFAULT_MODEL_ID}).")
+        return
+
+    if args.fsync and not args.stage:
+        parser.error("--fsync requiere --stage.")
+    context = ProcessingContext()
+    staging_dir = args.staging_dir or default_staging_dir(args.folder_name)
+    if args.stage:
+        context.staging = StagingArea(staging_dir, fsync=args.fsync)
+    try:
+        counts = batch_apply(args.folder_name, args.results_file, context)
+        print(f"Se aplicaron los resultados de {counts['applied']} archivos; {counts['skipped']} omitidos.")
+        if context.staging is not None and len(context.staging):
+            committed = context.staging.commit()
+            print(f"Se confirmaron {committed} cambios. Use --rollback para deshacerlos.")
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        if context.staging is not None:
+            context.staging.close()
+
+
+def _add_processing_arguments(parser: argparse.ArgumentParser):
+    """Opciones del procesamiento con Gemini comunes a la ejecución normal y a `watch`."""
+    parser.add_argument("--patch", action="store_true", help="Pide a Gemini solo las ediciones por rango de líneas y las aplica, en lugar de reescribir cada archivo completo.")
+    parser.add_argument("--pack", action="store_true", help="Agrupa los archivos pequeños en una sola petición a Gemini por paquete.")
+    parser.add_argument("--pack-tokens", type=int, help="Presupuesto de tokens estimados de un paquete con --pack (por defecto: el de --chunk-tokens).")
+    parser.add_argument("--chunk-tokens", type=int, help="Presupuesto de tokens estimados por petición; los archivos mayores se procesan en fragmentos (por defecto: según el modelo).")
+    _add_scan_arguments(parser)
+    parser.add_argument("--manifest", help="Registra el progreso de la ejecución en este manifiesto, para poder reanudarla con --resume.")
+    parser.add_argument("--resume", action="store_true", help="Registra el progreso en el manifiesto (por defecto: .<carpeta>.cambiacosas-manifest.jsonl junto a la carpeta) y, si existe uno de una ejecución anterior, la reanuda: omite los archivos terminados y reutiliza los fragmentos ya procesados.")
+    _add_gemini_arguments(parser)
+
+
+def _add_gemini_arguments(parser: argparse.ArgumentParser):
+    """Opciones de la conexión con Gemini y de los recursos compartidos (trabajadores, cachés, cuota, modelos e informes)."""
+    parser.add_argument("--workers", type=int, default=1, help="Número de archivos que se procesan en paralelo con Gemini (por defecto: 1).")
+    parser.add_argument("--stream", action="store_true", help="Recibe las respuestas de Gemini de forma incremental (SSE) y muestra el progreso de cada una.")
+    parser.add_argument("--cache-dir", default=default_cache_dir(), help="Directorio de la caché de respuestas de Gemini (por defecto: ~/.cache/cambiacosas).")
+    parser.add_argument("--cache-max-mb", type=int, default=512, help="Tamaño máximo de la caché de respuestas en MB (por defecto: 512).")
+    parser.add_argument("--no-cache", action="store_true", help="No consulta ni guarda respuestas en la caché.")
+    parser.add_argument("--context-cache", action="store_true", help="Registra el prompt una vez como contexto en caché de Gemini (cachedContents) y hace referencia a él en cada petición, en lugar de reenviarlo.")
+    parser.add_argument("--context-cache-ttl", type=int, default=DEFAULT_TTL_SECONDS, help=f"Tiempo de vida en segundos del contexto en caché con --context-cache (por defecto: {DEFAULT_TTL_SECONDS}).")
+    parser.add_argument("--model", help=f"Modelo de Gemini de las peticiones que no cumplen ninguna ruta (por defecto: {DEFAULT_MODEL_ID}).")
+    parser.add_argument("--route", action="append", default=[], metavar="MODELO[:CONDICIONES]", help="Envía a MODELO las peticiones que cumplen las condiciones, p. ej. 'gemini-2.0-flash-lite:max_tokens=500;paths=*.json|*.yaml' (claves: min_tokens, max_tokens, paths, content). Se puede repetir; gana la primera ruta que se cumple.")
+    parser.add_argument("--routes", metavar="ARCHIVO", help="Archivo JSON con el modelo por defecto y las rutas de modelos ({\"default\": ..., \"routes\": [...]}); las rutas de --route se comprueban antes.")
+    parser.add_argument("--rpm", type=int, help="Peticiones por minuto permitidas a Gemini (por defecto, sin límite fijo: la concurrencia se adapta a las respuestas 429/503).")
+    parser.add_argument("--tpm", type=int, help="Tokens de entrada por minuto permitidos a Gemini (por defecto, sin límite fijo).")
+    parser.add_argument("--tier", choices=("free", "paid"), default="paid", help="Nivel de la clave de Gemini: con 'free' se aplican la RPM y la TPM del nivel gratuito de cada modelo salvo --rpm/--tpm (por defecto: paid, sin presupuestos fijos).")
+    parser.add_argument("--hedge", action="store_true", help="Duplica las peticiones que tardan en recibir su primer byte y usa la primera respuesta (reduce la latencia de cola).")
+    parser.add_argument("--hedge-delay", type=float, help="Segundos sin primer byte tras los que se duplica una petición con --hedge (por defecto: el p95 observado).")
+    parser.add_argument("--hedge-max-fraction", type=float, default=DEFAULT_MAX_FRACTION, help=f"Fracción máxima de peticiones duplicadas con --hedge (por defecto: {DEFAULT_MAX_FRACTION}).")
+    parser.add_argument("--max-retries", type=int, default=6, help="Reintentos por petición ante respuestas 429/5xx o errores de conexión (por defecto: 6).")
+    parser.add_argument("--report", help="Escribe un informe de la ejecución (tiempo por fase y tokens por petición) en JSON, o en NDJSON si termina en .ndjson o .jsonl.")
+    parser.add_argument("--prometheus", metavar="ARCHIVO", help="Escribe las métricas de la ejecución en formato de texto de Prometheus (recolector textfile).")
+    parser.add_argument("--connect-timeout", type=float, default=10.0, help="Segundos máximos para conectar con la API de Gemini (por defecto: 10).")
+    parser.add_argument("--read-timeout", type=float, default=300.0, help="Segundos máximos sin recibir datos de la API de Gemini (por defecto: 300).")
+
+
+def _validate_processing_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> Optional[ModelRouter]:
+    """
+    Valida las opciones de _add_processing_arguments (termina con parser.error si alguna no es
+    válida) y devuelve el enrutador de modelos de --model, --route y --routes, o None.
+    """
+    if args.chunk_tokens is not None and args.chunk_tokens < 1:
+        parser.error("--chunk-tokens debe ser un entero positivo.")
+    if args.pack and args.patch:
+        parser.error("--pack no se puede combinar con --patch.")
+    if args.pack_tokens is not None and (args.pack_tokens < 1 or not args.pack):
+        parser.error("--pack-tokens debe ser un entero positivo y requiere --pack.")
+    return _validate_gemini_arguments(parser, args)
+
+
+def _validate_gemini_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> Optional[ModelRouter]:
+    """Valida las opciones de _add_gemini_arguments y devuelve el enrutador de modelos, o None."""
+    for option, value in (("--rpm", args.rpm), ("--tpm", args.tpm)):
+        if value is not None and value < 1:
+            parser.error(f"{option} debe ser un entero positivo.")
+    if args.max_retries < 0:
+        parser.error("--max-retries no puede ser negativo.")
+    if args.workers < 1:
+        parser.error("--workers debe ser un entero positivo.")
+    if args.cache_max_mb < 1:
+        parser.error("--cache-max-mb debe ser un entero positivo.")
+    if (args.hedge_delay is not None or args.hedge_max_fraction != DEFAULT_MAX_FRACTION) and not args.hedge:
+        parser.error("--hedge-delay y --hedge-max-fraction requieren --hedge.")
+    if args.hedge_delay is not None and args.hedge_delay <= 0:
+        parser.error("--hedge-delay debe ser positivo.")
+    if not 0 <= args.hedge_max_fraction <= 1:
+        parser.error("--hedge-max-fraction debe estar entre 0 y 1.")
+    if args.context_cache_ttl != DEFAULT_TTL_SECONDS and not args.context_cache:
+        parser.error("--context-cache-ttl requiere --context-cache.")
+    if args.context_cache_ttl <= EXPIRY_MARGIN_SECONDS:
+        parser.error(f"--context-cache-ttl debe ser mayor que {EXPIRY_MARGIN_SECONDS}.")
+
+    router = None
+    if args.model or args.route or args.routes:
+        try:
+            routes = [parse_route(spec) for spec in args.route]
+            if args.routes:
+                router = ModelRouter.from_file(args.routes, default_model=args.model, extra_routes=routes)
+            else:
+                router = ModelRouter(routes, default_model=args.model or DEFAULT_MODEL_ID)
+        except ValueError as e:
+            parser.error(str(e))
+    return router
+
+
+def _create_context(args: argparse.Namespace, router: Optional[ModelRouter], prompt_content: str) -> ProcessingContext:
+    """
+    Crea el contexto de la ejecución a partir de las opciones de _add_processing_arguments, con
+    su cliente HTTP, caché de respuestas y limitador (sin manifiesto ni área de preparación).
+    """
+    context = _create_gemini_context(args, router)
+    context.root = os.path.abspath(args.folder_name)
+    if args.chunk_tokens is not None:
+        context.chunk_tokens = args.chunk_tokens
+    context.patch = args.patch
+    if args.pack:
+        context.pack_tokens = args.pack_tokens or context.chunk_tokens
+    if context.context_cache is not None and estimate_tokens(prompt_content) < context.context_cache.min_tokens:
+        print(f"Aviso: el prompt tiene menos de ~{context.context_cache.min_tokens} tokens; Gemini no admite contextos "
+              "en caché tan pequeños, así que se enviará en cada petición.")
+    return context
+
+
+def _create_gemini_context(args: argparse.Namespace, router: Optional[ModelRouter]) -> ProcessingContext:
+    """
+    Crea un contexto con los recursos de las opciones de _add_gemini_arguments: el cliente HTTP,
+    la caché de respuestas, el limitador, el enrutador, las métricas, el duplicado de peticiones
+    y el contexto en caché de Gemini.
+    """
+    workers = args.workers
+    # Sin --chunk-tokens, los fragmentos caben en el presupuesto de cualquiera de los modelos elegibles
+    chunk_tokens = None
+    if router is not None:
+        chunk_tokens = min(token_budget_for_model(model) for model in router.models)
+
+    # Un único cliente HTTP para toda la ejecución. Archivos y fragmentos comparten los `workers`
+    # hilos del grupo, así que nunca hay más de `workers` peticiones en curso.
+    client = GeminiHTTPClient(pool_size=workers,
+                              connect_timeout=args.connect_timeout,
+                              read_timeout=args.read_timeout)
+    import sqlite3  # Diferido, como en ResponseCache
+    try:
+        cache = None if args.no_cache else ResponseCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Advertencia: No se pudo abrir la caché de respuestas en {args.cache_dir}, se continúa sin caché: {e}")
+        cache = None
+    # El límite de peticiones simultáneas empieza en `workers`, el máximo, y se reduce ante 429/503
+    limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm, free_tier=args.tier == "free", initial_concurrency=workers,
+                          max_concurrency=workers, max_retries=args.max_retries, log=_log)
+    context = ProcessingContext(workers=workers, client=client, stream=args.stream, cache=cache,
+                                chunk_tokens=chunk_tokens, limiter=limiter, router=router)
+    if args.report or args.prometheus:
+        context.metrics = RunMetrics()
+    if args.hedge:
+        context.hedge = HedgePolicy(delay=args.hedge_delay, max_fraction=args.hedge_max_fraction)
+    if args.context_cache:
+        context.context_cache = ContextCache(client, ttl_seconds=args.context_cache_ttl, log=_log)
+    return context
+
+
+def _print_run_summary(context: ProcessingContext):
+    """Imprime los aciertos de la caché, los reintentos, los modelos usados y los duplicados de la ejecución."""
+    if context.cache is not None:
+        print(f"Caché de respuestas: {context.cache.hits} aciertos, {context.cache.misses} fallos.")
+    if context.dedup is not None and context.dedup.shared:
+        print(f"Se reutilizaron {context.dedup.shared} respuestas de archivos o fragmentos idénticos.")
+    if context.limiter is not None and context.limiter.retries:
+        print(f"Se reintentaron {context.limiter.retries} peticiones por límites de cuota o errores transitorios.")
+    if context.router is not None and context.router.routed:
+        print("Peticiones por modelo: " + ", ".join(f"{model}: {count}" for model, count in sorted(context.router.routed.items())) + ".")
+    if context.hedge is not None and context.hedge.hedges:
+        print(f"Se duplicaron {context.hedge.hedges} peticiones lentas; {context.hedge.hedge_wins} duplicados respondieron antes.")
+
+
+def _close_context(context: ProcessingContext):
+    """Cierra el contexto en caché de Gemini, el cliente HTTP, la caché de respuestas y el manifiesto."""
+    if context.context_cache is not None:
+        context.context_cache.close()
+    if context.client is not None:
+        context.client.close()
+    if context.cache is not None:
+        context.cache.close()
+    if context.manifest is not None:
+        context.manifest.close()
+
+
+def _watch_main(argv: List[str]):
+    """
+    Subcomando `watch`: procesa la carpeta y después la vigila, procesando solo los archivos cuyo
+    contenido cambia, hasta que se interrumpe con Ctrl+C.
+    """
+    parser = argparse.ArgumentParser(prog="cambiacosas watch", description="Procesa la carpeta con Gemini y después la vigila: cada vez que cambian archivos, procesa solo aquellos cuyo contenido cambió.")
+    parser.add_argument("folder_name", help="Ruta a la carpeta que se procesa y se vigila.")
+    parser.add_argument("prompt_file", help="Ruta al archivo que contiene el prompt de procesamiento.")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE_SECONDS, help=f"Segundos sin cambios nuevos tras los que se procesa una tanda de cambios (por defecto: {DEFAULT_DEBOUNCE_SECONDS}).")
+    parser.add_argument("--poll", action="store_true", help="Vigila la carpeta recorriéndola periódicamente en lugar de con inotify.")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help=f"Segundos entre dos recorridos de la carpeta si no se usa inotify (por defecto: {DEFAULT_POLL_INTERVAL}).")
+    _add_processing_arguments(parser)
+
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.folder_name):
+        parser.error(f"La ruta de la carpeta no es válida: {args.folder_name}")
+    if args.debounce < 0:
+        parser.error("--debounce no puede ser negativo.")
+    if args.poll_interval <= 0:
+        parser.error("--poll-interval debe ser positivo.")
+    router = _validate_processing_arguments(parser, args)
+    prompt_content = _read_prompt_file(args.prompt_file)
+    scan_filter = ScanFilter(include=args.include, exclude=args.exclude, max_size=args.max_size,
+                             use_gitignore=not args.no_ignore)
+
+    context = _create_context(args, router, prompt_content)
+    file_count = 0
+    try:
+        if args.manifest or args.resume:
+            manifest_path = args.manifest or default_manifest_path(args.folder_name)
+            context.manifest = RunManifest(manifest_path, prompt_content, resume=args.resume,
+                                           mode="patch" if args.patch else "rewrite")
+            print(f"Registrando el progreso en {manifest_path}.")
+        watcher = FileWatcher(args.folder_name, scan_filter, debounce=args.debounce,
+                              poll_interval=args.poll_interval, use_inotify=not args.poll)
+        print(f"Procesando la carpeta {args.folder_name} con Gemini antes de vigilarla...")
+        file_count = watch_folder(args.folder_name, prompt_content, context, scan_filter, watcher)
+    except KeyboardInterrupt:
+        print("Se dejó de vigilar la carpeta.")
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        _close_context(context)
+        if context.metrics is not None:
+            _write_metrics(context.metrics, args.report, args.prometheus)
+    if file_count:
+        print(f"Se procesaron {file_count} archivos.")
+    _print_run_summary(context)
+
+
+def _parse_job_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida el cuerpo JSON de un trabajo del servidor: {"folder", "prompt"} y las opciones de
+    JOB_OPTIONS, con los nombres de las opciones de la línea de comandos (p. ej.,
+    {"folder": "src", "prompt": "...", "patch": true, "include": ["*.py"], "max_size": "500K"}).
+    El prompt llega como texto: el servidor no lee archivos de prompt, que permitirían a un
+    cliente enviar a Gemini cualquier archivo local legible por el servidor. Por lo mismo no se
+    admite la ruta del manifiesto: con resume se usa siempre default_manifest_path(folder).
+
+    Returns:
+        Dict[str, Any]: Todas las opciones del trabajo, con la ruta absoluta de la carpeta en
+                        'folder' y el texto del prompt en 'prompt'.
+
+    Raises:
+        ValueError: Si el trabajo no es válido.
+    """
+    unknown = set(request) - {"folder", "prompt", *JOB_OPTIONS}
+    if unknown:
+        raise ValueError(f"Opciones desconocidas: {', '.join(sorted(unknown))} (admitidas: {', '.join(JOB_OPTIONS)}).")
+    folder = request.get("folder")
+    if not isinstance(folder, str) or not os.path.isdir(folder):
+        raise ValueError(f"La ruta de la carpeta no es válida: {folder}")
+    prompt_content = request.get("prompt")
+    if not isinstance(prompt_content, str) or not prompt_content.strip():
+        raise ValueError("El prompt está vacío.")
+
+    options = {"folder": os.path.abspath(folder), "prompt": prompt_content.strip(),
+               "chunk_tokens": None, "pack_tokens": None, "include": [], "exclude": [], "max_size": None}
+    for name in JOB_FLAGS:
+        options[name] = request.get(name, False)
+        if not isinstance(options[name], bool):
+            raise ValueError(f"{name} debe ser true o false.")
+    for name in ("chunk_tokens", "pack_tokens"):
+        value = request.get(name)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+            raise ValueError(f"{name} debe ser un entero positivo.")
+        options[name] = value
+    for name in ("include", "exclude"):
+        value = request.get(name, [])
+        if not isinstance(value, list) or not all(isinstance(glob, str) for glob in value):
+            raise ValueError(f"{name} debe ser una lista de globs.")
+        options[name] = value
+    if request.get("max_size") is not None:
+        try:
+            options["max_size"] = _parse_size(str(request["max_size"]))
+        except argparse.ArgumentTypeError as e:
+            raise ValueError(str(e)) from None
+    if options["patch"] and options["divide"]:
+        raise ValueError("patch no se puede combinar con divide.")
+    if options["pack"] and options["patch"]:
+        raise ValueError("pack no se puede combinar con patch.")
+    if options["pack_tokens"] is not None and not options["pack"]:
+        raise ValueError("pack_tokens requiere pack.")
+    return options
+
+
+def _run_server_job(job: Job, shared: ProcessingContext):
+    """
+    Ejecuta un trabajo del servidor con los recursos de `shared` (el grupo de trabajadores, el
+    cliente HTTP, el limitador, las cachés, el enrutador y las métricas), que comparten todos los
+    trabajos. Emite un evento 'file' por cada archivo (o paquete) terminado, con sus rutas, las
+    salidas escritas y sus mensajes de registro, y un evento 'summary' al terminar.
+    """
+    options = job.options
+    written = threading.local()  # Salidas escritas por el archivo que procesa cada hilo
+
+    def on_write(file_path: str):
+        written.paths = getattr(written, "paths", []) + [file_path]
+        job.count("written")
+
+    def on_file_done(work_item: List[Dict], log_lines: List[str]):
+        written_paths = getattr(written, "paths", [])
+        written.paths = []
+        job.count("processed", len(work_item))
+        job.emit({"event": "file", "files": [file_info['full_path'] for file_info in work_item],
+                  "written": written_paths, "log": log_lines})
+
+    context = ProcessingContext(workers=shared.workers, client=shared.client, stream=shared.stream, cache=shared.cache,
+                                chunk_tokens=options["chunk_tokens"] or shared.chunk_tokens, patch=options["patch"],
+                                limiter=shared.limiter, metrics=shared.metrics, context_cache=shared.context_cache,
+                                hedge=shared.hedge, router=shared.router, root=job.folder, on_write=on_write,
+                                executor=shared.executor, cancel=job.cancel_event, on_file_done=on_file_done)
+    if options["pack"]:
+        context.pack_tokens = options["pack_tokens"] or context.chunk_tokens
+    scan_filter = ScanFilter(include=options["include"], exclude=options["exclude"], max_size=options["max_size"],
+                             use_gitignore=not options["no_ignore"])
+    if options["resume"]:
+        # Siempre en la ruta por defecto: una ruta del cliente permitiría truncar cualquier archivo del servidor
+        context.manifest = RunManifest(default_manifest_path(job.folder), options["prompt"],
+                                       resume=True, mode="patch" if options["patch"] else "rewrite")
+    try:
+        file_count = process_files_with_gemini(scan_folder(job.folder, scan_filter), options["prompt"],
+                                               options["divide"], context)
+    finally:
+        if context.manifest is not None:
+            context.manifest.close()
+    job.emit({"event": "summary", "files": file_count, "processed": job.counters["processed"],
+              "written": job.counters["written"], "shared": context.dedup.shared})
+
+
+def _serve_main(argv: List[str]):
+    """
+    Subcomando `serve`: servidor local de trabajos (HTTP en host:puerto o en un socket Unix) con
+    un único grupo de trabajadores, limitador, cliente HTTP y cachés para todos los trabajos.
+    """
+    parser = argparse.ArgumentParser(prog="cambiacosas serve", description="Servidor local de trabajos: recibe carpetas y prompts por HTTP y los procesa con un grupo de trabajadores, un limitador y unas cachés compartidos.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Dirección en la que escucha el servidor (por defecto: {DEFAULT_HOST}).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Puerto en el que escucha el servidor (por defecto: {DEFAULT_PORT}).")
+    parser.add_argument("--socket", metavar="RUTA", help="Escucha en un socket Unix (accesible solo para el usuario actual) en lugar de en --host y --port.")
+    parser.add_argument("--token-file", metavar="RUTA", help=f"Archivo con el token que deben enviar los clientes (Authorization: Bearer <token>); también se puede indicar con la variable de entorno {TOKEN_ENV_VAR}. Es obligatorio si --host no es una dirección local.")
+    parser.add_argument("--jobs", type=int, default=2, help="Trabajos que se procesan a la vez; los demás esperan en la cola (por defecto: 2).")
+    _add_gemini_arguments(parser)
+
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs debe ser un entero positivo.")
+    if args.socket and not hasattr(socket, "AF_UNIX"):
+        parser.error("--socket no está disponible en este sistema.")
+    token = os.environ.get(TOKEN_ENV_VAR) or None
+    if args.token_file:
+        try:
+            with open(args.token_file, 'r', encoding='utf-8') as f:
+                token = f.read()
+        except OSError as e:
+            parser.error(f"No se pudo leer --token-file: {e}")
+    if token is not None and not token.strip():
+        parser.error("El token está vacío.")
+    if not args.socket and token is None and not is_loopback_host(args.host):
+        parser.error(f"--host {args.host} no es una dirección local: indique un token con --token-file o {TOKEN_ENV_VAR}.")
+    router = _validate_gemini_arguments(parser, args)
+
+    context = _create_gemini_context(args, router)
+    # Un único grupo de `workers` hilos para los archivos de todos los trabajos
+    context.executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="cambiacosas-worker")
+    job_server = JobServer(lambda job: _run_server_job(job, context), _parse_job_request, max_active_jobs=args.jobs)
+    address = args.socket or f"http://{args.host}:{args.port}"
+    try:
+        httpd = create_http_server(job_server, args.host, args.port, args.socket, token=token)
+    except OSError as e:
+        print(f"Error: No se pudo escuchar en {address}: {e}")
+        job_server.close()
+        context.executor.shutdown()
+        _close_context(context)
+        sys.exit(1)
+
+    print(f"Servidor de trabajos escuchando en {address}; pulse Ctrl+C para terminar.")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("Deteniendo el servidor: se cancelan los trabajos y se esperan los archivos en curso...")
+    finally:
+        httpd.server_close()
+        job_server.close()
+        context.executor.shutdown()
+        if args.socket:
+            with contextlib.suppress(OSError):
+                os.remove(args.socket)
+        _close_context(context)
+        _print_run_summary(context)
+        if context.metrics is not None:
+            _write_metrics(context.metrics, args.report, args.prometheus)
+
+
+def main():
+    if sys.argv[1:2] == ["batch"]:
+        _batch_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["watch"]:
+        _watch_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["serve"]:
+        _serve_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description="Procesa archivos usando la API de Gemini, con fragmentación opcional para archivos grandes.")
+    parser.add_argument("folder_name", help="Ruta a la carpeta que contiene los archivos para procesar.")
+    parser.add_argument("prompt_file", nargs="?", help="Ruta al archivo que contiene el prompt de procesamiento (no se usa con --rollback).")
+    parser.add_argument("--divide", action="store_true", help="Divide archivos grandes (que superan el presupuesto de tokens por petición) en archivos de fragmentos procesados separados en lugar de fusionarlos.")
+    parser.add_argument("--stage", action="store_true", help="Prepara todas las salidas en un directorio junto a la carpeta y las confirma juntas al terminar, en lugar de escribir cada archivo al procesarlo.")
+    parser.add_argument("--staging-dir", help="Directorio de preparación (por defecto: .<carpeta>.cambiacosas-staging junto a la carpeta).")
+    parser.add_argument("--fsync", action="store_true", help="Con --stage, fuerza a disco las salidas y los directorios al confirmar.")
+    parser.add_argument("--rollback", action="store_true", help="Deshace la última confirmación de --stage en la carpeta y termina.")
+    _add_processing_arguments(parser)
+
+    args = parser.parse_args()
+
+    staging_dir = args.staging_dir or default_staging_dir(args.folder_name)
+    if args.rollback:
+        _rollback(staging_dir)
+        return
+    if args.prompt_file is None:
+        parser.error("falta el argumento prompt_file.")
+    if args.fsync and not args.stage:
+        parser.error("--fsync requiere --stage.")
+    if args.patch and args.divide:
+        parser.error("--patch no se puede combinar con --divide.")
+    router = _validate_processing_arguments(parser, args)
+
+    folder_name = args.folder_name
+    divide_flag = args.divide
+    prompt_content = _read_prompt_file(args.prompt_file)
+    context = _create_context(args, router, prompt_content)
 
     try:
         print(f"Escaneando carpeta: {folder_name}...")
-        file_info_results = scan_folder(folder_name)
-        print(f"Se encontraron {len(file_info_results)} archivos.")
+        scan_filter = ScanFilter(include=args.include, exclude=args.exclude, max_size=args.max_size,
+                                 use_gitignore=not args.no_ignore)
+        file_records = scan_folder(folder_name, scan_filter)
 
-        if file_info_results:
-             print("Procesando archivos con Gemini...")
-             process_files_with_gemini(file_info_results, prompt_content, divide_flag)  # Pasar la bandera de división
-             print("Procesamiento de archivos finalizado.")
+        # Con --stage el manifiesto es el que permite continuar con --stage --resume
+        if args.manifest or args.resume or args.stage:
+            manifest_path = args.manifest or default_manifest_path(folder_name)
+            context.manifest = RunManifest(manifest_path, prompt_content, resume=args.resume,
+                                           mode="patch" if args.patch else "rewrite")
+            print(f"Registrando el progreso en {manifest_path}.")
+
+        if args.stage:
+            context.staging = StagingArea(staging_dir, resume=args.resume, fsync=args.fsync)
+            print(f"Preparando las salidas en {staging_dir}; se confirmarán al terminar.")
+
+        print("Procesando archivos con Gemini...")
+        file_count = process_files_with_gemini(file_records, prompt_content, divide_flag, context)  # Pasar la bandera de división
+        if file_count:
+             print(f"Procesamiento de archivos finalizado. Se encontraron {file_count} archivos.")
+             _print_run_summary(context)
         else:
              print("No se encontraron archivos para procesar.")
+        if context.staging is not None and len(context.staging):
+            print(f"Confirmando {len(context.staging)} cambios preparados...")
+            committed = context.staging.commit()
+            print(f"Se confirmaron {committed} cambios. Use --rollback para deshacerlos.")
 
     except ValueError as ve:
         print(f"Error: {ve}")
@@ -288,7 +1975,15 @@ def main():
     except Exception as e:
         print(f"Ocurrió un error inesperado: {e}")
         sys.exit(1)
+    finally:
+        _close_context(context)
+        if context.staging is not None:
+            if len(context.staging):
+                print(f"Los cambios preparados no se confirmaron; se conservan en {staging_dir} (use --stage --resume para continuar).")
+            context.staging.close()
+        if context.metrics is not None:
+            _write_metrics(context.metrics, args.report, args.prometheus)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
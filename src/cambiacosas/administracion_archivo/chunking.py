@@ -0,0 +1,188 @@
+import ast
+import math
+import os
+from array import array
+from typing import Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from .file_info import LineIndexedFile
+
+# Caracteres por token aproximados para código y texto (estimación local, sin llamar a la API)
+CHARS_PER_TOKEN = 4
+
+# Presupuesto de tokens de entrada por fragmento para cada modelo. El modelo reescribe el
+# fragmento completo, así que el presupuesto deja margen bajo el límite de tokens de salida.
+MODEL_CHUNK_TOKEN_BUDGETS = {
+    "gemini-2.0-flash": 6000,
+    "gemini-2.0-flash-lite": 6000,
+    "gemini-2.0-flash-thinking-exp-01-21": 6000,
+    "gemini-2.5-flash": 48000,
+    "gemini-2.5-pro": 48000,
+}
+DEFAULT_CHUNK_TOKEN_BUDGET = 6000
+
+# Fracción mínima del presupuesto que debe llenar un fragmento para cortar en un límite preferido
+MIN_FILL_RATIO = 0.5
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima el número de tokens de un texto (aproximadamente CHARS_PER_TOKEN caracteres por token).
+
+    Args:
+        text: El texto.
+
+    Returns:
+        El número estimado de tokens.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def token_budget_for_model(model_id: str) -> int:
+    """Devuelve el presupuesto de tokens por fragmento para un modelo (o el valor por defecto)."""
+    return MODEL_CHUNK_TOKEN_BUDGETS.get(model_id, DEFAULT_CHUNK_TOKEN_BUDGET)
+
+
+def _python_boundaries(content: str) -> Optional[Set[int]]:
+    """
+    Devuelve los índices (basados en 0) de las líneas donde empieza una definición de nivel
+    superior de un archivo Python, incluidos sus decoradores, o None si no se puede analizar.
+    """
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+    boundaries = set()
+    for node in tree.body:
+        start_line = node.lineno
+        for decorator in getattr(node, "decorator_list", []):
+            start_line = min(start_line, decorator.lineno)
+        boundaries.add(start_line - 1)
+    return boundaries
+
+
+def _scan_lines(lines: Iterable[Union[str, bytes]]) -> Tuple[array, Set[int], Set[int]]:
+    """
+    Recorre las líneas una sola vez y devuelve los tokens estimados de cada una, los índices de
+    las líneas que siguen a una línea en blanco y, entre ellos, los de las líneas sin sangría: el
+    inicio probable de un bloque de nivel superior en la mayoría de lenguajes (los límites
+    heurísticos). Las líneas pueden ser texto o bytes (las de un LineIndexedFile).
+    """
+    line_tokens = array('Q')
+    after_blank = set()
+    heuristic_boundaries = set()
+    previous_blank = False
+    for index, line in enumerate(lines):
+        line_tokens.append(estimate_tokens(line))
+        blank = not line.strip()
+        if previous_blank and index > 0:
+            after_blank.add(index)
+            if not blank and not line[:1].isspace():
+                heuristic_boundaries.add(index)
+        previous_blank = blank
+    return line_tokens, after_blank, heuristic_boundaries
+
+
+def _split_lines(content: str) -> List[str]:
+    """
+    Divide un contenido en líneas que conservan su '\\n'. Solo '\\n' separa líneas, igual que en
+    la numeración del modo parche, splice_file_lines y LineIndexedFile (str.splitlines también
+    cortaría en '\\r', '\\x0c', '\\u2028'...).
+    """
+    lines = content.split("\n")
+    return [line + "\n" for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+
+
+def split_into_chunks(content: str, token_budget: int, file_name: Optional[str] = None) -> List[str]:
+    """
+    Divide un contenido en fragmentos de líneas consecutivas de hasta token_budget tokens estimados.
+
+    Los fragmentos se llenan tanto como permite el presupuesto y, al cortar, se prefiere (en
+    este orden) el inicio de una definición de nivel superior (con `ast` para archivos .py o
+    una heurística de sangría para el resto) y después una línea en blanco, siempre que el
+    fragmento quede al menos a la mitad del presupuesto. Una línea que por sí sola supera el
+    presupuesto forma su propio fragmento. Unir los fragmentos reproduce el contenido original.
+
+    Args:
+        content: El contenido a dividir.
+        token_budget: El máximo de tokens estimados por fragmento.
+        file_name: El nombre del archivo, para elegir el analizador de límites por su extensión.
+
+    Returns:
+        La lista de fragmentos (vacía si el contenido está vacío).
+    """
+    if token_budget <= 0:
+        raise ValueError("token_budget debe ser un entero positivo.")
+    lines = _split_lines(content)
+
+    line_tokens, after_blank, boundaries = _scan_lines(lines)
+    if file_name is not None and os.path.splitext(file_name)[1] == ".py":
+        python_boundaries = _python_boundaries(content)
+        if python_boundaries is not None:
+            boundaries = python_boundaries
+    return ["".join(lines[start:end]) for start, end in _chunk_ranges(line_tokens, after_blank, boundaries, token_budget)]
+
+
+def split_into_line_ranges(lines: LineIndexedFile, token_budget: int) -> List[Tuple[int, int]]:
+    """
+    Divide un archivo abierto con get_file_info(..., lazy=True) como split_into_chunks, sin
+    materializar su contenido: devuelve los rangos de líneas (inicio, fin), basados en 0 y con el
+    fin excluido, de cada fragmento, que se obtiene con lines.lines(inicio, fin) cuando se necesita.
+
+    Los tokens de cada línea se estiman por su tamaño en bytes (una cota superior de la estimación
+    por caracteres) y los cortes usan la heurística de sangría para cualquier extensión, porque
+    `ast` necesitaría el contenido completo.
+
+    Args:
+        lines: El archivo indexado por líneas.
+        token_budget: El máximo de tokens estimados por fragmento.
+
+    Returns:
+        La lista de rangos (vacía si el archivo está vacío).
+    """
+    if token_budget <= 0:
+        raise ValueError("token_budget debe ser un entero positivo.")
+    line_tokens, after_blank, boundaries = _scan_lines(lines)
+    return _chunk_ranges(line_tokens, after_blank, boundaries, token_budget)
+
+
+def _chunk_ranges(line_tokens: Sequence[int], after_blank: Set[int], boundaries: Set[int],
+                  token_budget: int) -> List[Tuple[int, int]]:
+    """Calcula los rangos de líneas (inicio, fin) de los fragmentos de split_into_chunks."""
+    chunks = []
+    chunk_start = 0
+    chunk_tokens = 0
+    best_boundary = None  # Último inicio de definición dentro del fragmento actual
+    blank_boundary = None  # Última línea tras una línea en blanco dentro del fragmento actual
+    min_fill = token_budget * MIN_FILL_RATIO
+    prefix_tokens = {}  # Tokens acumulados del fragmento actual antes de cada línea
+
+    index = 0
+    while index < len(line_tokens):
+        tokens = line_tokens[index]
+        if chunk_tokens + tokens > token_budget and index > chunk_start:
+            if best_boundary is not None and prefix_tokens[best_boundary] >= min_fill:
+                cut = best_boundary
+            elif blank_boundary is not None and prefix_tokens[blank_boundary] >= min_fill:
+                cut = blank_boundary
+            else:
+                cut = index
+            chunks.append((chunk_start, cut))
+            chunk_start = cut
+            index = cut
+            chunk_tokens = 0
+            best_boundary = blank_boundary = None
+            prefix_tokens = {}
+            continue
+
+        if index > chunk_start:
+            if index in boundaries:
+                best_boundary = index
+            if index in after_blank:
+                blank_boundary = index
+        prefix_tokens[index] = chunk_tokens
+        chunk_tokens += tokens
+        index += 1
+
+    if chunk_start < len(line_tokens):
+        chunks.append((chunk_start, len(line_tokens)))
+    return chunks
@@ -1,11 +1,25 @@
-from typing import Union, List, Tuple, Optional
-from . import file_info
+import mmap
+import os
+import tempfile
+from typing import Any, Dict, Union, List, Tuple, Optional, Sequence
 
-def modify_file_lines(file_path: str, line_range: Optional[Union[Tuple[int, int], slice]], new_content: Union[str, List[str]]):
+# Tamaño (en bytes) a partir del cual el archivo se indexa con mmap en lugar de leerse en memoria
+MMAP_MIN_BYTES = 1024 * 1024
+# Tamaño de los bloques en los que se cuentan los saltos de línea al localizar un rango
+LINE_INDEX_BLOCK_BYTES = 1024 * 1024
+
+# Un rango de líneas: una tupla (start_line, end_line), un slice o None (el archivo completo)
+LineRange = Optional[Union[Tuple[int, int], slice]]
+
+
+def modify_file_lines(file_path: str, line_range: LineRange, new_content: Union[str, List[str]],
+                      output_path: Optional[str] = None):
     """
     Modifica un archivo de texto, reemplazando un rango de líneas especificado con nuevo contenido.
     Si no se proporciona line_range, se modificará el archivo completo.
 
+    Es un atajo de splice_file_lines para un único rango.
+
     Args:
         file_path (str): La ruta al archivo que se va a modificar.
         line_range (tuple o slice, opcional): Una tupla (start_line, end_line) o un objeto slice
@@ -14,6 +28,8 @@ def modify_file_lines(file_path: str, line_range: Optional[Union[Tuple[int, int]
         new_content (str o list de str): El contenido para reemplazar las líneas especificadas.
                                           Si es una cadena, se trata como un solo bloque de texto.
                                           Si es una lista de cadenas, cada cadena es una línea de nuevo contenido.
+        output_path (str, opcional): Si se proporciona, el resultado se escribe en esta ruta y
+                                     file_path no se modifica.
 
     Raises:
         FileNotFoundError: Si el file_path especificado no existe.
@@ -26,57 +42,239 @@ def modify_file_lines(file_path: str, line_range: Optional[Union[Tuple[int, int]
         modify_file_lines("my_file.txt", slice(2, 5), ["New line 2", "New line 3", "New line 4"])
         modify_file_lines("my_file.txt", "This replaces the entire file content") # Replaces entire file
     """
+    splice_file_lines(file_path, [(line_range, new_content)], output_path)
+
+
+def splice_file_lines(file_path: str, replacements: Sequence[Tuple[LineRange, Union[str, List[str]]]],
+                      output_path: Optional[str] = None):
+    """
+    Reemplaza varios rangos de líneas de un archivo en una sola pasada.
+
+    El archivo se lee una sola vez (con mmap si ocupa al menos MMAP_MIN_BYTES) y los rangos se
+    localizan con un índice de desplazamientos de las líneas afectadas, que solo recorre el
+    archivo hasta la última de ellas. El resultado se escribe en un archivo temporal junto al original, copiando los
+    bytes no modificados sin decodificarlos, y sustituye al original con un renombrado atómico:
+    una interrupción nunca deja el archivo a medio escribir. Las líneas se delimitan por '\\n'
+    (los finales '\\r\\n' se conservan en las líneas no modificadas).
+
+    Args:
+        file_path (str): La ruta al archivo que se va a modificar.
+        replacements (lista de tuplas): Pares (line_range, new_content) con el mismo significado
+                                        que en modify_file_lines. Los rangos no pueden solaparse
+                                        y un rango None (el archivo completo) debe ser el único.
+        output_path (str, opcional): Si se proporciona, el resultado se escribe en esta ruta (con
+                                     los permisos de file_path) y file_path no se modifica.
+
+    Raises:
+        FileNotFoundError: Si el file_path especificado no existe.
+        ValueError: Si algún rango no es válido para el archivo o si los rangos se solapan.
+        TypeError: Si los parámetros son de tipos incorrectos.
+    """
     if not isinstance(file_path, str):
         raise TypeError("file_path debe ser una cadena de texto.")
-    if line_range is not None and not isinstance(line_range, (tuple, slice)):
-        raise TypeError("line_range debe ser una tupla o un slice.")
-    if not isinstance(new_content, (str, list)):
-        raise TypeError("new_content debe ser una cadena de texto o una lista de cadenas de texto.")
+    ranges = []
+    for line_range, new_content in replacements:
+        if not isinstance(new_content, (str, list)):
+            raise TypeError("new_content debe ser una cadena de texto o una lista de cadenas de texto.")
+        ranges.append((_normalize_line_range(line_range), _content_to_bytes(new_content)))
+    if any(line_range is None for line_range, _ in ranges) and len(ranges) > 1:
+        raise ValueError("Un rango que abarca el archivo completo no se puede combinar con otros rangos.")
+    ranges.sort(key=lambda item: item[0][0] if item[0] is not None else 0)
+    for (previous, _), (current, _) in zip(ranges, ranges[1:]):
+        if current[0] <= previous[1]:
+            raise ValueError(f"Los rangos de líneas {previous[0]}-{previous[1]} y {current[0]}-{current[1]} se solapan.")
+
+    try:
+        source = open(file_path, 'rb')
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Archivo no encontrado: {file_path}")
+    with source:
+        size = os.fstat(source.fileno()).st_size
+        data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) if size >= MMAP_MIN_BYTES else source.read()
+        try:
+            segments = _byte_segments(data, size, ranges)
+            _write_spliced(file_path, output_path or file_path, data, size, segments)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
 
-    if line_range is not None and isinstance(line_range, tuple):
+def _normalize_line_range(line_range: LineRange) -> Optional[Tuple[int, int]]:
+    """Valida un rango de líneas y lo devuelve como (start_line, end_line), o None para el archivo completo."""
+    if line_range is None:
+        return None
+    if isinstance(line_range, tuple):
         if len(line_range) != 2:
             raise ValueError("La tupla line_range debe contener exactamente dos enteros (start_line, end_line).")
         start_line, end_line = line_range
-    elif line_range is not None and isinstance(line_range, slice):
+    elif isinstance(line_range, slice):
         start_line = line_range.start
         end_line = line_range.stop
         if line_range.step is not None:
             raise ValueError("El paso de slice no está soportado para line_range.")
-    elif line_range is None:
-        start_line = 1
-        end_line = None  # Se determinará después de leer el archivo
     else:
-        raise TypeError("line_range debe ser una tupla, un slice o None.")
+        raise TypeError("line_range debe ser una tupla o un slice.")
+
+    if not isinstance(start_line, int) or not isinstance(end_line, int):
+        raise TypeError("Las líneas de inicio y fin deben ser enteros.")
+    if start_line <= 0 or end_line <= 0:
+        raise ValueError("Las líneas de inicio y fin deben ser enteros positivos.")
+    if start_line > end_line:
+        raise ValueError("start_line no puede ser mayor que end_line.")
+    return start_line, end_line
+
+
+def _content_to_bytes(new_content: Union[str, List[str]]) -> bytes:
+    """Convierte el nuevo contenido en bytes UTF-8, terminando cada línea en '\\n'."""
+    if isinstance(new_content, str):
+        lines = new_content.split('\n')  # Solo '\n' separa líneas, como en la numeración de las líneas
+        if not lines[-1]:
+            lines.pop()
+    else:
+        lines = new_content
+    return "".join(line if line.endswith('\n') else line + '\n' for line in lines).encode('utf-8')
 
-    if line_range is not None:
-        if not isinstance(start_line, int) or not isinstance(end_line, int):
-            raise TypeError("Las líneas de inicio y fin deben ser enteros.")
-        if start_line <= 0 or end_line <= 0:
-            raise ValueError("Las líneas de inicio y fin deben ser enteros positivos.")
-        if start_line > end_line:
-            raise ValueError("start_line no puede ser mayor que end_line.")
 
+def _line_offsets(data: Union[bytes, mmap.mmap], size: int, line_numbers: Sequence[int]) -> Dict[int, int]:
+    """
+    Devuelve el desplazamiento en bytes del inicio de cada línea pedida (basada en 1) que exista.
+
+    Los saltos de línea se cuentan por bloques de LINE_INDEX_BLOCK_BYTES con bytes.count (en C) y
+    solo se buscan uno a uno dentro del bloque donde está la línea pedida; el archivo se recorre hasta la última de ellas.
+    """
+    offsets = {}
+    newlines_seen = 0  # Saltos de línea antes de scan_position
+    scan_position = 0
+    for line_number in sorted(set(line_numbers)):
+        needed = line_number - 1 - newlines_seen  # La línea n empieza tras el salto de línea n - 1
+        while needed > 0 and scan_position < size:
+            block = data[scan_position:scan_position + LINE_INDEX_BLOCK_BYTES]  # mmap no tiene count()
+            block_newlines = block.count(b'\n')
+            if block_newlines < needed:
+                newlines_seen += block_newlines
+                needed -= block_newlines
+                scan_position += len(block)
+                continue
+            block_position = 0
+            for _ in range(needed):
+                block_position = block.find(b'\n', block_position) + 1
+            scan_position += block_position
+            newlines_seen += needed
+            needed = 0
+        if needed > 0:
+            break  # El archivo termina antes de esta línea
+        offsets[line_number] = scan_position
+    return offsets
+
+
+def _byte_segments(data: Union[bytes, mmap.mmap], size: int,
+                   ranges: List[Tuple[Optional[Tuple[int, int]], bytes]]) -> List[Tuple[int, int, bytes]]:
+    """Traduce los rangos de líneas a tramos de bytes (inicio, fin, contenido nuevo) del archivo."""
+    if ranges[0][0] is None:
+        return [(0, size, ranges[0][1])]
+    offsets = _line_offsets(data, size, [line for (start_line, end_line), _ in ranges
+                                          for line in (start_line, end_line, end_line + 1)])
+    segments = []
+    for (start_line, end_line), new_bytes in ranges:
+        # Una línea existe si empieza antes del final del archivo
+        if offsets.get(end_line, size) >= size:
+            raise ValueError("El rango de líneas especificado excede el número de líneas en el archivo.")
+        # Si la última línea no termina en '\n', el tramo llega hasta el final del archivo
+        segments.append((offsets[start_line], offsets.get(end_line + 1, size), new_bytes))
+    return segments
+
+
+def _write_spliced(file_path: str, output_path: str, data: Union[bytes, mmap.mmap], size: int,
+                   segments: List[Tuple[int, int, bytes]]):
+    """Escribe el archivo con los tramos reemplazados en un temporal y lo renombra sobre output_path."""
+    directory, name = os.path.split(os.path.abspath(output_path))
+    descriptor, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    view = memoryview(data)
     try:
-        file_info_dict = file_info.get_file_info(file_path)
-        total_lines = file_info_dict['line_count']
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Archivo no encontrado: {file_path}")
+        with os.fdopen(descriptor, 'wb') as temp_file:
+            position = 0
+            for start_offset, end_offset, new_bytes in segments:
+                temp_file.write(view[position:start_offset])  # Bytes sin cambios, sin copiarlos ni decodificarlos
+                temp_file.write(new_bytes)
+                position = end_offset
+            temp_file.write(view[position:size])
+        os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        view.release()
 
-    if line_range is None:
-        end_line = total_lines  # Establecer end_line al final del archivo si line_range es None
-    elif start_line > total_lines or end_line > total_lines:
-        raise ValueError("El rango de líneas especificado excede el número de líneas en el archivo.")
 
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
+def validate_line_edits(edits: List[Dict[str, Any]], last_line: Optional[int], first_line: int = 1) -> List[Dict[str, Any]]:
+    """
+    Valida una lista de ediciones por rango de líneas y la devuelve ordenada por start_line.
 
-    if isinstance(new_content, str):
-        new_lines = [line + '\n' if not line.endswith('\n') else line for line in new_content.splitlines()]
-    else:  # lista de cadenas de texto
-        new_lines = [line + '\n' if not line.endswith('\n') else line for line in new_content]
+    Cada edición es un diccionario con 'start_line' y 'end_line' (basados en 1, inclusivos) y
+    'replacement' (el texto que sustituye a esas líneas; una cadena vacía las elimina).
 
-    modified_lines = lines[:start_line-1] + new_lines + lines[end_line:]
+    Args:
+        edits (list de dict): Las ediciones a validar.
+        last_line (int): La última línea que pueden tocar las ediciones. None no limita el rango
+                         por arriba (se comprueba al aplicarlas).
+        first_line (int): La primera línea que pueden tocar las ediciones.
+
+    Returns:
+        list de dict: Las ediciones normalizadas y ordenadas por start_line.
 
-    print("líneas_modificadas:", modified_lines)
-    with open(file_path, 'w') as file:
-        file.writelines(modified_lines)
\ No newline at end of file
+    Raises:
+        ValueError: Si una edición está mal formada, se sale del rango [first_line, last_line]
+                    o se solapa con otra.
+    """
+    if not isinstance(edits, list):
+        raise ValueError("Las ediciones deben ser una lista.")
+    normalized = []
+    for edit in edits:
+        if not isinstance(edit, dict):
+            raise ValueError(f"Edición no válida: {edit}")
+        start_line, end_line, replacement = edit.get('start_line'), edit.get('end_line'), edit.get('replacement')
+        if (not isinstance(start_line, int) or isinstance(start_line, bool)
+                or not isinstance(end_line, int) or isinstance(end_line, bool)
+                or not isinstance(replacement, str)):
+            raise ValueError(f"Edición no válida: {edit}")
+        if not first_line <= start_line <= end_line or (last_line is not None and end_line > last_line):
+            raise ValueError(f"La edición {start_line}-{end_line} está fuera del rango de líneas {first_line}-{last_line}.")
+        normalized.append({'start_line': start_line, 'end_line': end_line, 'replacement': replacement})
+
+    normalized.sort(key=lambda edit: edit['start_line'])
+    for previous, current in zip(normalized, normalized[1:]):
+        if current['start_line'] <= previous['end_line']:
+            raise ValueError(f"Las ediciones {previous['start_line']}-{previous['end_line']} y "
+                             f"{current['start_line']}-{current['end_line']} se solapan.")
+    return normalized
+
+
+def apply_line_edits(file_path: str, edits: List[Dict[str, Any]], output_path: Optional[str] = None) -> int:
+    """
+    Aplica una lista de ediciones por rango de líneas a un archivo.
+
+    Las ediciones se validan y se aplican todas juntas con splice_file_lines, en una sola pasada
+    sobre el archivo; los números de línea se refieren al archivo antes de aplicar ninguna.
+
+    Args:
+        file_path (str): La ruta al archivo que se va a modificar.
+        edits (list de dict): Ediciones con 'start_line', 'end_line' y 'replacement' (ver validate_line_edits).
+        output_path (str, opcional): Si se proporciona, el resultado se escribe en esta ruta y
+                                     file_path no se modifica.
+
+    Returns:
+        int: El número de ediciones aplicadas.
+
+    Raises:
+        FileNotFoundError: Si el file_path especificado no existe.
+        ValueError: Si alguna edición no es válida para el archivo.
+    """
+    edits = validate_line_edits(edits, None)
+    if edits:
+        splice_file_lines(file_path, [((edit['start_line'], edit['end_line']), edit['replacement']) for edit in edits],
+                          output_path)
+    return len(edits)
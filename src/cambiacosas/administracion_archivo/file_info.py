@@ -1,18 +1,111 @@
+import mmap
 import os
+from array import array
 from typing import Dict, Any
 
-def get_file_info(file_path: str) -> Dict[str, Any]:
+
+class LineIndexedFile:
+    """
+    Acceso perezoso por líneas a un archivo de texto UTF-8, sin leerlo entero en memoria.
+
+    El archivo se proyecta con mmap y se recorre una vez para construir un índice compacto
+    (array('Q'), 8 bytes por línea) con el desplazamiento en bytes del inicio de cada línea. Las
+    líneas se delimitan por '\n' y solo se decodifican las que se piden, con los finales de línea
+    normalizados a '\n' como al leer el archivo en modo texto (lines(0, line_count) es igual a
+    get_file_info(...)["content"]). Se comporta como una secuencia de líneas en bytes, sin
+    decodificar, para recorrerlas sin copiar el archivo.
+
+    Mientras está abierto, el archivo no debe modificarse en su sitio; se cierra con close() o
+    usándolo como gestor de contexto.
+
+    Attributes:
+        line_count (int): El número de líneas del archivo.
+        size (int): El tamaño del archivo en bytes.
+    """
+    def __init__(self, file_path: str):
+        with open(file_path, 'rb') as file:
+            self.size = os.fstat(file.fileno()).st_size
+            # mmap no admite archivos vacíos
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self._offsets = array('Q', [0])
+        position = self._data.find(b'\n')
+        while position != -1:
+            self._offsets.append(position + 1)
+            position = self._data.find(b'\n', position + 1)
+        if self._offsets[-1] != self.size:
+            self._offsets.append(self.size)  # Última línea sin salto de línea final
+        self.line_count = len(self._offsets) - 1
+        self._has_cr = self._data.find(b'\r') != -1
+
+    def __len__(self) -> int:
+        return self.line_count
+
+    def __getitem__(self, index: int) -> bytes:
+        """Devuelve la línea index (basada en 0) en bytes, con su salto de línea."""
+        if index < 0:
+            index += self.line_count
+        if not 0 <= index < self.line_count:
+            raise IndexError("índice de línea fuera de rango")
+        return self._data[self._offsets[index]:self._offsets[index + 1]]
+
+    def __iter__(self):
+        data, offsets = self._data, self._offsets
+        for index in range(self.line_count):
+            yield data[offsets[index]:offsets[index + 1]]
+
+    def line_offset(self, index: int) -> int:
+        """Devuelve el desplazamiento en bytes del inicio de la línea index (line_count: el final)."""
+        return self._offsets[index]
+
+    def byte_range(self, start: int, end: int) -> bytes:
+        """Devuelve los bytes del archivo entre los desplazamientos start y end."""
+        return self._data[start:end]
+
+    def lines(self, start: int, end: int) -> str:
+        """
+        Devuelve las líneas start a end - 1 (basadas en 0) como texto, con sus saltos de línea.
+
+        Raises:
+            UnicodeDecodeError: Si las líneas no son UTF-8 válido.
+        """
+        start = max(0, min(start, self.line_count))
+        end = max(start, min(end, self.line_count))
+        text = self._data[self._offsets[start]:self._offsets[end]].decode('utf-8')
+        if self._has_cr:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    @property
+    def closed(self) -> bool:
+        return isinstance(self._data, mmap.mmap) and self._data.closed
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def __enter__(self) -> "LineIndexedFile":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_file_info(file_path: str, lazy: bool = False) -> Dict[str, Any]:
     """Obtiene información sobre un archivo.
 
    Args:
         file_path: La ruta al archivo.
+        lazy: Si es True, el contenido no se lee: en lugar de 'content' se devuelve 'lines', un
+              LineIndexedFile con acceso por líneas sobre mmap (que el llamador debe cerrar). Para
+              archivos grandes que se procesan por fragmentos.
 
     Returns:
         Un diccionario que contiene información del archivo, incluyendo:
         - name: El nombre del archivo sin la ruta.
         - metadata: Un diccionario que contiene metadatos del archivo (tamaño, fecha de modificación, tipo de archivo).
         - full_path: La ruta absoluta al archivo.
-        - content: El contenido del archivo como una cadena de texto.
+        - content: El contenido del archivo como una cadena de texto (decodificado como UTF-8).
+          Con lazy, 'lines' (LineIndexedFile) en su lugar.
         - line_count: El número de líneas del archivo.
 
     Raises:
@@ -31,7 +124,17 @@ def get_file_info(file_path: str) -> Dict[str, Any]:
             "file_type": "file", # Determinar el tipo de archivo con mayor precisión si es necesario (ej., usando mimetypes)
         }
 
-        with open(file_path, 'r') as file: # Asumiendo archivos de texto, manejar binarios si es necesario
+        if lazy:
+            lines = LineIndexedFile(file_path)
+            return {
+                "name": file_name,
+                "metadata": metadata,
+                "full_path": full_path,
+                "lines": lines,
+                "line_count": lines.line_count,
+            }
+
+        with open(file_path, 'r', encoding='utf-8') as file: # Archivos de texto UTF-8; los binarios se filtran en el escaneo
             content = file.read()
 
         return {
@@ -0,0 +1,301 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .scan_filter import IgnoreRules, ScanFilter
+
+# Segundos sin cambios nuevos tras los que se da por terminada una ráfaga de cambios
+DEFAULT_DEBOUNCE_SECONDS = 0.5
+# Segundos entre dos recorridos de la carpeta con el vigilante por sondeo
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Eventos de inotify (linux/inotify.h)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+# Un archivo cambió cuando se cierra tras escribirlo o cuando se mueve a la carpeta (lo que hacen
+# los editores y edit_file al sustituirlo); IN_CREATE solo se usa para vigilar las carpetas nuevas
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_ONLYDIR
+# Cabecera de cada evento: descriptor de la vigilancia, máscara, cookie y longitud del nombre
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_BYTES = 64 * 1024
+
+
+def _load_inotify():
+    """Devuelve la libc con las funciones de inotify, o None si no está disponible (fuera de Linux)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """
+    Vigila una carpeta e informa de los archivos creados o modificados en ella.
+
+    En Linux usa inotify: una vigilancia por carpeta, que se añade también a las carpetas que se
+    crean después. Si inotify no está disponible (otros sistemas) o se agota el límite de
+    vigilancias del sistema, recorre la carpeta cada poll_interval segundos y compara el tamaño y
+    la fecha de modificación de cada archivo. En ambos casos se aplican los filtros del escaneo
+    (ScanFilter), así que solo se informa de los archivos que scan_folder procesaría.
+
+    Los cambios se agrupan: wait() devuelve cuando pasan debounce segundos sin cambios nuevos, de
+    modo que guardar varios archivos a la vez o cambiar de rama produce una sola tanda. No se
+    distinguen las escrituras propias de las ajenas; quien las haga debe reconocerlas (p. ej.,
+    comparando el hash del contenido).
+
+    Attributes:
+        backend (str): "inotify" o "polling".
+    """
+    def __init__(self, folder_path: str, scan_filter: Optional[ScanFilter] = None,
+                 debounce: float = DEFAULT_DEBOUNCE_SECONDS, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 use_inotify: bool = True):
+        """
+        Empieza a vigilar la carpeta. Los cambios posteriores a esta llamada no se pierden aunque
+        wait() se llame más tarde.
+
+        Args:
+            folder_path: La carpeta que se vigila (con sus subcarpetas).
+            scan_filter: Filtros del escaneo. Si no se proporciona, se usan los filtros por defecto.
+            debounce: Segundos sin cambios nuevos tras los que wait() devuelve la tanda.
+            poll_interval: Segundos entre dos recorridos de la carpeta si no se usa inotify.
+            use_inotify: Si es False, se vigila siempre por sondeo.
+
+        Raises:
+            ValueError: Si folder_path no es una carpeta o los tiempos no son positivos.
+        """
+        if not os.path.isdir(folder_path):
+            raise ValueError(f"Ruta de carpeta no válida: {folder_path}")
+        if debounce < 0 or poll_interval <= 0:
+            raise ValueError("debounce no puede ser negativo y poll_interval debe ser positivo.")
+        self.folder_path = os.path.abspath(folder_path)
+        self.scan_filter = scan_filter or ScanFilter()
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = "polling"
+        self._fd = None
+        self._watches: Dict[int, Tuple[str, IgnoreRules]] = {}  # descriptor -> (carpeta, reglas)
+        self._snapshot: Dict[str, Tuple[int, int]] = {}  # ruta -> (fecha de modificación en ns, tamaño)
+        self._libc = _load_inotify() if use_inotify else None
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+                self.backend = "inotify"
+                # Si se agota el límite de vigilancias, _watch_tree pasa a vigilar por sondeo
+                self._watch_tree(self.folder_path, self.scan_filter.root_rules(self.folder_path))
+                return
+        self._start_polling()
+
+    def wait(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        Espera a que cambien archivos y devuelve sus rutas (ordenadas) cuando pasan debounce
+        segundos sin cambios nuevos.
+
+        Args:
+            timeout: Segundos máximos de espera del primer cambio. None espera indefinidamente.
+
+        Returns:
+            List[str]: Las rutas absolutas de los archivos que cambiaron, o [] si pasó timeout.
+                       Un archivo puede aparecer aunque su contenido no cambiara (p. ej., si se
+                       guardó sin modificarlo) o haberse eliminado después.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed: Set[str] = set()
+        while not changed:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+            changed |= self._read_changes(remaining)
+        # Agrupar la ráfaga: seguir leyendo hasta que pasen `debounce` segundos sin cambios (los
+        # eventos que no son cambios de archivos objetivo no alargan la espera)
+        quiet_until = time.monotonic() + self.debounce
+        while True:
+            remaining = quiet_until - time.monotonic()
+            if remaining <= 0:
+                return sorted(changed)
+            more = self._read_changes(remaining)
+            if more:
+                changed |= more
+                quiet_until = time.monotonic() + self.debounce
+
+    def close(self):
+        """Deja de vigilar la carpeta."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._watches.clear()
+
+    def __enter__(self) -> "FileWatcher":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_changes(self, timeout: Optional[float]) -> Set[str]:
+        """Espera como mucho timeout segundos (None: sin límite) y devuelve los archivos que cambiaron."""
+        if self.backend == "inotify":
+            return self._read_events(timeout)
+        return self._poll(timeout)
+
+    # --- Recorrido de la carpeta ---
+
+    def _walk_dirs(self, root_dir: str, rules: IgnoreRules) -> Iterator[Tuple[str, IgnoreRules]]:
+        """Genera root_dir y cada subcarpeta en la que entraría el escaneo, con sus reglas de exclusión."""
+        pending_dirs = [(root_dir, rules)]
+        while pending_dirs:
+            current_dir, current_rules = pending_dirs.pop()
+            yield current_dir, current_rules
+            try:
+                with os.scandir(current_dir) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False) and self.scan_filter.should_descend(
+                                entry.path, self._relative_path(entry.path), current_rules):
+                            pending_dirs.append((entry.path, self.scan_filter.rules_for(entry.path, current_rules)))
+            except OSError:
+                continue  # La carpeta se eliminó o no se puede leer
+
+    def _relative_path(self, path: str) -> str:
+        return os.path.relpath(path, self.folder_path).replace(os.sep, "/")
+
+    def _is_target(self, file_path: str, rules: IgnoreRules) -> bool:
+        """Indica si file_path es un archivo regular que el escaneo procesaría."""
+        try:
+            file_stats = os.stat(file_path, follow_symlinks=False)
+            return stat.S_ISREG(file_stats.st_mode) and self.scan_filter.should_include(
+                file_path, self._relative_path(file_path), file_stats.st_size, rules)
+        except OSError:
+            return False  # Se eliminó antes de comprobarlo
+
+    def _files_in(self, root_dir: str, rules: IgnoreRules) -> Set[str]:
+        """Los archivos objetivo de root_dir y sus subcarpetas."""
+        files = set()
+        for dir_path, dir_rules in self._walk_dirs(root_dir, rules):
+            try:
+                with os.scandir(dir_path) as entries:
+                    files.update(entry.path for entry in entries
+                                 if not entry.is_dir(follow_symlinks=False) and self._is_target(entry.path, dir_rules))
+            except OSError:
+                continue
+        return files
+
+    # --- inotify ---
+
+    def _watch_tree(self, root_dir: str, rules: IgnoreRules) -> Optional[Set[str]]:
+        """
+        Añade una vigilancia a root_dir y a sus subcarpetas. Devuelve las carpetas vigiladas, o
+        None si se agotó el límite de vigilancias (y se pasó a vigilar por sondeo).
+        """
+        watched = set()
+        for dir_path, dir_rules in self._walk_dirs(root_dir, rules):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), _WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    print(f"Aviso: se agotó el límite de vigilancias de inotify en {dir_path}; se vigila la carpeta por sondeo.")
+                    self.close()
+                    self._start_polling()
+                    return None
+                continue  # La carpeta se eliminó o no se puede leer
+            self._watches[wd] = (dir_path, dir_rules)
+            watched.add(dir_path)
+        return watched
+
+    def _read_events(self, timeout: Optional[float]) -> Set[str]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, _READ_BYTES)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_length].rstrip(b"\0"))
+            offset += _EVENT_HEADER.size + name_length
+            if mask & _IN_Q_OVERFLOW:
+                # Se perdieron eventos: se informa de todos los archivos (quien llama compara el contenido)
+                changed |= self._files_in(self.folder_path, self.scan_filter.root_rules(self.folder_path))
+                continue
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)  # Se eliminó la carpeta
+                continue
+            if wd not in self._watches or not name:
+                continue
+            dir_path, rules = self._watches[wd]
+            path = os.path.join(dir_path, name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO) and self.scan_filter.should_descend(path, self._relative_path(path), rules):
+                    # Los archivos creados antes de vigilar la carpeta nueva no generan eventos
+                    path_rules = self.scan_filter.rules_for(path, rules)
+                    if self._watch_tree(path, path_rules) is None:
+                        return changed | self._files_in(path, path_rules)
+                    changed |= self._files_in(path, path_rules)
+            elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO) and self._is_target(path, rules):
+                changed.add(path)
+        return changed
+
+    # --- Sondeo ---
+
+    def _start_polling(self):
+        self.backend = "polling"
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """Fecha de modificación y tamaño de cada archivo en las carpetas en las que entraría el escaneo."""
+        snapshot = {}
+        for dir_path, _ in self._walk_dirs(self.folder_path, self.scan_filter.root_rules(self.folder_path)):
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            file_stats = entry.stat(follow_symlinks=False)
+                            snapshot[entry.path] = (file_stats.st_mtime_ns, file_stats.st_size)
+            except OSError:
+                continue
+        return snapshot
+
+    def _poll(self, timeout: Optional[float]) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            time.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+            snapshot = self._take_snapshot()
+            # Los filtros (que pueden leer el archivo) se aplican solo a los archivos que cambiaron
+            changed = {path for path, signature in snapshot.items()
+                       if self._snapshot.get(path) != signature
+                       and self._is_target(path, self._rules_for_file(path))}
+            self._snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def _rules_for_file(self, file_path: str) -> IgnoreRules:
+        """Las reglas de exclusión de la carpeta de file_path (acumulando los .gitignore desde la raíz)."""
+        rules = self.scan_filter.root_rules(self.folder_path)
+        relative_dir = os.path.relpath(os.path.dirname(file_path), self.folder_path)
+        current_dir = self.folder_path
+        if relative_dir != os.curdir:
+            for part in relative_dir.split(os.sep):
+                current_dir = os.path.join(current_dir, part)
+                rules = self.scan_filter.rules_for(current_dir, rules)
+        return rules
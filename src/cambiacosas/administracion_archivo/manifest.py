@@ -0,0 +1,261 @@
+import hashlib
+import contextlib
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Any, Optional, Union
+
+from . import file_info
+
+# Líneas que se decodifican de cada vez al calcular el hash de un LineIndexedFile
+HASH_BLOCK_LINES = 65536
+
+
+def default_manifest_path(folder_path: str) -> str:
+    """
+    Devuelve la ruta por defecto del manifiesto de una carpeta: un archivo oculto junto a la
+    carpeta (no dentro de ella, para que el escaneo no lo procese).
+
+    Args:
+        folder_path: La ruta a la carpeta que se procesa.
+
+    Returns:
+        La ruta al archivo de manifiesto.
+    """
+    folder = os.path.abspath(folder_path)
+    return os.path.join(os.path.dirname(folder), f".{os.path.basename(folder)}.cambiacosas-manifest.jsonl")
+
+
+def content_hash(content: Union[str, file_info.LineIndexedFile]) -> str:
+    """
+    Devuelve el hash SHA-256 (hexadecimal) de un contenido de texto. Un LineIndexedFile se recorre
+    por bloques de líneas, sin leerlo entero, y da el mismo hash que su contenido como texto.
+    """
+    if isinstance(content, file_info.LineIndexedFile):
+        digest = hashlib.sha256()
+        for start in range(0, content.line_count, HASH_BLOCK_LINES):
+            digest.update(content.lines(start, start + HASH_BLOCK_LINES).encode("utf-8"))
+        return digest.hexdigest()
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class RunManifest:
+    """
+    Manifiesto persistente del progreso de una ejecución.
+
+    Registra, por archivo y por fragmento de archivo grande, la ruta, el tamaño, la fecha de
+    modificación, el hash del contenido y el estado. Se guarda como JSON Lines de solo
+    anexado: cada actualización es una línea nueva, por lo que escribirla cuesta lo mismo sin
+    importar el tamaño de la ejecución y una interrupción solo puede dañar la última línea.
+
+    Con resume=True se cargan los registros de la ejecución anterior (si usó el mismo prompt y
+    el mismo modo) para omitir los archivos terminados y reutilizar los fragmentos ya procesados.
+
+    Las salidas de los fragmentos se guardan aparte, en un archivo por archivo original dentro de
+    la carpeta `<manifiesto>.chunks`, que se elimina cuando el archivo se registra como terminado:
+    solo se conservan en disco las de los archivos en curso o fallidos.
+    """
+    def __init__(self, manifest_path: str, prompt_content: str, resume: bool = False, mode: str = "rewrite"):
+        """
+        Abre el manifiesto.
+
+        Args:
+            manifest_path: Ruta al archivo de manifiesto.
+            prompt_content: El prompt de la ejecución; los registros de otro prompt no se reutilizan.
+            resume: Si es True, carga el manifiesto existente y continúa anexando a él.
+                    Si es False, empieza un manifiesto nuevo.
+            mode: El modo de procesamiento ("rewrite" o "patch"). Las salidas de fragmentos de un
+                  modo no sirven en el otro, así que los registros de otro modo no se reutilizan.
+        """
+        self.path = manifest_path
+        self.chunks_dir = manifest_path + ".chunks"
+        self.prompt_hash = content_hash(prompt_content)
+        self.mode = mode
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._chunks: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        loaded = resume and self._load()
+        if loaded:
+            self._load_chunks()
+        else:
+            shutil.rmtree(self.chunks_dir, ignore_errors=True)  # Salidas de otra ejecución
+        self._file = open(manifest_path, "a" if loaded else "w", encoding="utf-8")
+        if not loaded:
+            self._append({"type": "run", "prompt_hash": self.prompt_hash, "mode": self.mode})
+
+    def _load(self) -> bool:
+        """Carga los registros existentes. Devuelve False si no hay manifiesto reutilizable."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                lines = manifest_file.readlines()
+        except FileNotFoundError:
+            return False
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Línea incompleta de una ejecución interrumpida
+            record_type = record.get("type")
+            if record_type == "run":
+                if record.get("prompt_hash") != self.prompt_hash or record.get("mode", "rewrite") != self.mode:
+                    print(f"Advertencia: El manifiesto {self.path} corresponde a otro prompt o modo; se empieza desde cero.")
+                    self._files.clear()
+                    self._chunks.clear()
+                    return False
+            elif record_type == "file":
+                self._files[record["path"]] = record
+            elif record_type == "chunk":  # Manifiestos que guardaban las salidas en el propio archivo
+                self._chunks[(record["path"], record["chunk"])] = record
+        return True
+
+    def _load_chunks(self):
+        """Carga las salidas de fragmentos guardadas de los archivos que no se terminaron."""
+        try:
+            names = os.listdir(self.chunks_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            with open(os.path.join(self.chunks_dir, name), "r", encoding="utf-8") as chunks_file:
+                for line in chunks_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._chunks[(record["path"], record["chunk"])] = record
+
+    def _chunks_path(self, file_path: str) -> str:
+        name = hashlib.sha256(file_path.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.chunks_dir, name + ".jsonl")
+
+    def _append(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def is_file_done(self, file_info_dict: Dict[str, Any]) -> bool:
+        """
+        Indica si un archivo ya se procesó en una ejecución anterior y no ha cambiado desde entonces.
+
+        Args:
+            file_info_dict: Información del archivo obtenida de get_file_info (también con lazy=True).
+
+        Returns:
+            True si el manifiesto registra el archivo como terminado con el mismo tamaño y contenido.
+        """
+        with self._lock:
+            record = self._files.get(file_info_dict["full_path"])
+        if record is None or record["status"] != "done":
+            return False
+        if record["size"] != file_info_dict["metadata"]["size"]:
+            return False
+        content = file_info_dict["content"] if "content" in file_info_dict else file_info_dict["lines"]
+        return record["hash"] == content_hash(content)
+
+    def record_file(self, file_path: str, status: str,
+                    content: Optional[Union[str, file_info.LineIndexedFile]] = None):
+        """
+        Registra el estado de un archivo.
+
+        Args:
+            file_path: La ruta al archivo.
+            status: El estado ("done" tras escribirlo con éxito, "failed" si falló).
+            content: El contenido con el que se calcula el hash. Si no se proporciona, se lee el
+                     archivo desde el disco (el resultado que quedó escrito). Si se proporciona y el
+                     archivo aún no existe (una salida preparada con StagingArea), el tamaño se
+                     calcula a partir del contenido. Puede ser un LineIndexedFile (el original de
+                     un archivo grande leído con get_file_info(..., lazy=True)).
+        """
+        if content is None:
+            # Se lee por líneas con mmap: el hash no necesita el contenido completo en memoria
+            info = file_info.get_file_info(file_path, lazy=True)
+            with info["lines"] as lines:
+                digest = content_hash(lines)
+            size, mtime = info["metadata"]["size"], info["metadata"]["modification_date"]
+        elif os.path.exists(file_path):
+            file_stats = os.stat(file_path)
+            size, mtime = file_stats.st_size, file_stats.st_mtime
+        else:
+            size, mtime = len(content.encode("utf-8")), None
+        if content is not None:
+            digest = content_hash(content)
+        record = {
+            "type": "file",
+            "path": os.path.abspath(file_path),
+            "size": size,
+            "mtime": mtime,
+            "hash": digest,
+            "status": status,
+        }
+        with self._lock:
+            self._files[record["path"]] = record
+            self._append(record)
+        if status == "done":
+            self.forget_chunks(record["path"])  # El archivo está escrito: sus fragmentos ya no hacen falta
+
+    def chunk_output(self, file_path: str, chunk_num: int, chunk_content: str) -> Optional[Any]:
+        """
+        Devuelve la salida guardada de un fragmento si ya se procesó con el mismo contenido.
+
+        Args:
+            file_path: La ruta absoluta al archivo original.
+            chunk_num: El número del fragmento (basado en 1).
+            chunk_content: El contenido original del fragmento.
+
+        Returns:
+            La salida del fragmento (el texto modificado o, en modo parche, su lista de ediciones),
+            o None si hay que procesarlo.
+        """
+        with self._lock:
+            record = self._chunks.get((file_path, chunk_num))
+        if record is None or record["status"] != "done" or record["hash"] != content_hash(chunk_content):
+            return None
+        return record["output"]
+
+    def record_chunk(self, file_path: str, chunk_num: int, chunk_content: str, output: Any):
+        """
+        Registra un fragmento procesado con éxito y guarda su salida en el archivo de fragmentos
+        del archivo original hasta que este se registre como terminado.
+
+        Args:
+            file_path: La ruta absoluta al archivo original.
+            chunk_num: El número del fragmento (basado en 1).
+            chunk_content: El contenido original del fragmento.
+            output: La salida del fragmento (el texto modificado o su lista de ediciones).
+        """
+        record = {
+            "type": "chunk",
+            "path": file_path,
+            "chunk": chunk_num,
+            "size": len(chunk_content.encode("utf-8")),
+            "hash": content_hash(chunk_content),
+            "status": "done",
+            "output": output,
+        }
+        with self._lock:
+            self._chunks[(file_path, chunk_num)] = record
+            os.makedirs(self.chunks_dir, exist_ok=True)
+            with open(self._chunks_path(file_path), "a", encoding="utf-8") as chunks_file:
+                chunks_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def forget_chunks(self, file_path: str):
+        """
+        Elimina las salidas guardadas de los fragmentos de un archivo (p. ej., tras escribir sus
+        partes con divide y eliminar el original).
+
+        Args:
+            file_path: La ruta absoluta al archivo original.
+        """
+        with self._lock:
+            for key in [key for key in self._chunks if key[0] == file_path]:
+                del self._chunks[key]
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._chunks_path(file_path))
+
+    def close(self):
+        """Cierra el archivo de manifiesto (y elimina la carpeta de fragmentos si quedó vacía)."""
+        with self._lock:
+            self._file.close()
+            with contextlib.suppress(OSError):
+                os.rmdir(self.chunks_dir)
@@ -0,0 +1,217 @@
+import fnmatch
+import os
+import re
+from typing import List, Optional, Sequence, Tuple
+
+# Carpetas que nunca contienen archivos objetivo: control de versiones, dependencias y cachés
+DEFAULT_IGNORED_DIRS = frozenset({
+    ".git", ".hg", ".svn",
+    "node_modules", "__pycache__",
+    ".venv", "venv", ".tox", ".nox",
+    ".mypy_cache", ".pytest_cache", ".ruff_cache",
+})
+
+# Bytes iniciales que se leen para decidir si un archivo es binario
+BINARY_SNIFF_BYTES = 8192
+
+
+def is_binary_file(file_path: str, sniff_bytes: int = BINARY_SNIFF_BYTES) -> bool:
+    """
+    Indica si un archivo parece binario: contiene un byte NUL en sus primeros bytes.
+
+    Args:
+        file_path: La ruta al archivo.
+        sniff_bytes: Número de bytes iniciales que se examinan.
+
+    Returns:
+        True si el archivo parece binario.
+    """
+    with open(file_path, "rb") as file:
+        return b"\0" in file.read(sniff_bytes)
+
+
+def _gitignore_pattern_to_regex(pattern: str) -> str:
+    """Traduce un patrón glob de .gitignore (con soporte para '**') a una expresión regular."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                char_class = pattern[i + 1:end]
+                if char_class.startswith("!"):
+                    char_class = "^" + char_class[1:]
+                regex += f"[{char_class}]"
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex + r"\Z"
+
+
+class _GitIgnorePattern:
+    """Un patrón de un archivo .gitignore, relativo a la carpeta que lo contiene."""
+    def __init__(self, base_dir: str, pattern: str):
+        self.base_dir = base_dir
+        self.negated = pattern.startswith("!")
+        if self.negated:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\!") or pattern.startswith("\\#"):
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # Un patrón con '/' (salvo al final) se ancla a su carpeta; si no, se compara con el nombre
+        self.anchored = "/" in pattern
+        self.regex = re.compile(_gitignore_pattern_to_regex(pattern.lstrip("/")))
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        prefix = self.base_dir.rstrip(os.sep) + os.sep
+        if not path.startswith(prefix):
+            return False
+        relative_path = path[len(prefix):].replace(os.sep, "/")
+        target = relative_path if self.anchored else relative_path.rsplit("/", 1)[-1]
+        return self.regex.match(target) is not None
+
+
+class IgnoreRules:
+    """
+    Reglas de exclusión acumuladas de los archivos .gitignore de una carpeta y sus ancestros
+    dentro del escaneo. Es inmutable: child() devuelve las reglas de una subcarpeta.
+    """
+    def __init__(self, patterns: Tuple[_GitIgnorePattern, ...] = ()):
+        self.patterns = patterns
+
+    def child(self, dir_path: str) -> "IgnoreRules":
+        """
+        Devuelve las reglas que aplican dentro de dir_path, añadiendo las de su .gitignore si existe.
+
+        Args:
+            dir_path: La ruta a la subcarpeta.
+
+        Returns:
+            IgnoreRules: Las reglas para la subcarpeta (las mismas si no tiene .gitignore).
+        """
+        try:
+            with open(os.path.join(dir_path, ".gitignore"), "r", encoding="utf-8", errors="replace") as gitignore:
+                lines = gitignore.read().splitlines()
+        except OSError:
+            return self
+        new_patterns = []
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            new_patterns.append(_GitIgnorePattern(dir_path, line))
+        if not new_patterns:
+            return self
+        return IgnoreRules(self.patterns + tuple(new_patterns))
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        """Indica si path está excluido: gana el último patrón que coincide, como en git."""
+        ignored = False
+        for pattern in self.patterns:
+            if pattern.matches(path, is_dir):
+                ignored = not pattern.negated
+        return ignored
+
+
+class ScanFilter:
+    """
+    Filtros del escaneo de carpetas.
+
+    Poda carpetas completas antes de descender en ellas (carpetas conocidas como .git o
+    node_modules, entornos virtuales, reglas de .gitignore y globs de exclusión) y descarta
+    archivos que no son objetivos (globs de inclusión/exclusión, tamaño máximo y binarios).
+    """
+    def __init__(self, include: Optional[Sequence[str]] = None, exclude: Optional[Sequence[str]] = None,
+                 max_size: Optional[int] = None, use_gitignore: bool = True, skip_binary: bool = True):
+        """
+        Args:
+            include: Globs de inclusión. Si se proporcionan, solo se incluyen los archivos cuya ruta
+                     relativa o nombre coincide con alguno.
+            exclude: Globs de exclusión para archivos y carpetas (ruta relativa o nombre).
+            max_size: Tamaño máximo de archivo en bytes. None no limita el tamaño.
+            use_gitignore: Si es True, se aplican los archivos .gitignore y se omiten las carpetas
+                           de DEFAULT_IGNORED_DIRS y los entornos virtuales.
+            skip_binary: Si es True, se omiten los archivos con un byte NUL en sus primeros bytes.
+        """
+        self.include: List[str] = list(include or [])
+        self.exclude: List[str] = list(exclude or [])
+        self.max_size = max_size
+        self.use_gitignore = use_gitignore
+        self.skip_binary = skip_binary
+
+    def root_rules(self, root_dir: str) -> IgnoreRules:
+        """Devuelve las reglas de exclusión de la carpeta raíz del escaneo."""
+        return IgnoreRules().child(root_dir) if self.use_gitignore else IgnoreRules()
+
+    def rules_for(self, dir_path: str, parent_rules: IgnoreRules) -> IgnoreRules:
+        """Devuelve las reglas de exclusión dentro de dir_path."""
+        return parent_rules.child(dir_path) if self.use_gitignore else parent_rules
+
+    @staticmethod
+    def _matches_any(globs: Sequence[str], relative_path: str, name: str) -> bool:
+        return any(fnmatch.fnmatch(relative_path, glob) or fnmatch.fnmatch(name, glob) for glob in globs)
+
+    def should_descend(self, dir_path: str, relative_path: str, rules: IgnoreRules) -> bool:
+        """
+        Indica si el escaneo debe entrar en una carpeta.
+
+        Args:
+            dir_path: La ruta a la carpeta.
+            relative_path: La ruta relativa a la raíz del escaneo, con '/' como separador.
+            rules: Las reglas de exclusión de la carpeta que la contiene.
+        """
+        name = os.path.basename(dir_path)
+        if self.use_gitignore:
+            if name in DEFAULT_IGNORED_DIRS or os.path.exists(os.path.join(dir_path, "pyvenv.cfg")):
+                return False
+            if rules.is_ignored(dir_path, is_dir=True):
+                return False
+        return not self._matches_any(self.exclude, relative_path, name)
+
+    def should_include(self, file_path: str, relative_path: str, size: int, rules: IgnoreRules) -> bool:
+        """
+        Indica si un archivo es un objetivo del escaneo.
+
+        Args:
+            file_path: La ruta al archivo.
+            relative_path: La ruta relativa a la raíz del escaneo, con '/' como separador.
+            size: El tamaño del archivo en bytes.
+            rules: Las reglas de exclusión de la carpeta que lo contiene.
+        """
+        name = os.path.basename(file_path)
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.use_gitignore and rules.is_ignored(file_path, is_dir=False):
+            return False
+        if self.include and not self._matches_any(self.include, relative_path, name):
+            return False
+        if self._matches_any(self.exclude, relative_path, name):
+            return False
+        # Se comprueba al final: es el único filtro que lee el archivo
+        return not (self.skip_binary and is_binary_file(file_path))
@@ -0,0 +1,239 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+# Número de operaciones de archivo (fsync y os.replace) que se ejecutan en paralelo al confirmar
+COMMIT_WORKERS = 8
+
+
+def default_staging_dir(folder_path: str) -> str:
+    """
+    Devuelve el directorio de preparación por defecto de una carpeta: un directorio oculto junto
+    a la carpeta (no dentro de ella, para que el escaneo no lo procese y para que os.replace
+    funcione en el mismo sistema de archivos).
+
+    Args:
+        folder_path: La ruta a la carpeta que se procesa.
+
+    Returns:
+        La ruta al directorio de preparación.
+    """
+    folder = os.path.abspath(folder_path)
+    return os.path.join(os.path.dirname(folder), f".{os.path.basename(folder)}.cambiacosas-staging")
+
+
+def _fsync_path(path: str):
+    """Fuerza a disco un archivo o un directorio."""
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class StagingArea:
+    """
+    Área de preparación con diario para confirmar todas las salidas de una ejecución a la vez.
+
+    Durante la ejecución, las salidas se escriben en el subdirectorio `staged/` y cada operación
+    (escribir un archivo o eliminarlo) se anexa al diario `journal.jsonl`; los archivos de la
+    carpeta procesada no se tocan. commit() aplica todas las operaciones al final con os.replace
+    en paralelo, guardando antes los originales en `last-commit/backup/`, de modo que rollback()
+    puede deshacer la última confirmación. Interrumpir la ejecución antes de confirmar deja la
+    carpeta intacta y, con resume=True, las salidas preparadas se conservan.
+
+    El directorio de preparación debe estar en el mismo sistema de archivos que la carpeta.
+    """
+    def __init__(self, staging_dir: str, resume: bool = False, fsync: bool = False):
+        """
+        Abre el área de preparación.
+
+        Args:
+            staging_dir: El directorio de preparación.
+            resume: Si es True, conserva las operaciones preparadas por una ejecución anterior que
+                    no se confirmó. Si es False, las descarta.
+            fsync: Si es True, commit() fuerza a disco las salidas antes de sustituir los
+                   originales y los directorios afectados después.
+        """
+        self.path = staging_dir
+        self.fsync = fsync
+        self._staged_dir = os.path.join(staging_dir, "staged")
+        self._journal_path = os.path.join(staging_dir, "journal.jsonl")
+        self._pending_commit_dir = os.path.join(staging_dir, "commit-pending")
+        self._last_commit_dir = os.path.join(staging_dir, "last-commit")
+        self._operations: Dict[str, Dict[str, Any]] = {}  # Última operación por ruta de destino
+        self._lock = threading.Lock()
+
+        if not resume:
+            shutil.rmtree(self._staged_dir, ignore_errors=True)
+        os.makedirs(self._staged_dir, exist_ok=True)
+        if resume:
+            self._load()
+        self._journal = open(self._journal_path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self):
+        """Carga las operaciones del diario cuyas salidas preparadas siguen existiendo."""
+        try:
+            with open(self._journal_path, "r", encoding="utf-8") as journal_file:
+                lines = journal_file.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                operation = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Línea incompleta de una ejecución interrumpida
+            if operation["op"] == "write" and not os.path.exists(os.path.join(self._staged_dir, operation["staged"])):
+                continue
+            self._operations[operation["path"]] = operation
+
+    def _record(self, operation: Dict[str, Any]):
+        with self._lock:
+            self._operations[operation["path"]] = operation
+            self._journal.write(json.dumps(operation, ensure_ascii=False) + "\n")
+            self._journal.flush()
+
+    def __len__(self) -> int:
+        """Número de operaciones preparadas pendientes de confirmar."""
+        with self._lock:
+            return len(self._operations)
+
+    def stage(self, target_path: str, write: Callable[[str], None]):
+        """
+        Prepara una nueva versión de un archivo.
+
+        Args:
+            target_path: La ruta del archivo que se sustituirá (o creará) al confirmar.
+            write: Una función que recibe la ruta de la salida preparada y escribe en ella.
+        """
+        target_path = os.path.abspath(target_path)
+        descriptor, staged_path = tempfile.mkstemp(prefix=f"{os.path.basename(target_path)}.", dir=self._staged_dir)
+        os.close(descriptor)
+        try:
+            write(staged_path)
+            if os.path.exists(target_path):
+                os.chmod(staged_path, os.stat(target_path).st_mode & 0o7777)
+        except BaseException:
+            os.remove(staged_path)
+            raise
+        # Solo se registra cuando la salida está completa
+        self._record({"op": "write", "path": target_path, "staged": os.path.basename(staged_path)})
+
+    def stage_write(self, target_path: str, content: str):
+        """Prepara un archivo con el contenido de texto indicado (UTF-8)."""
+        def write(staged_path):
+            with open(staged_path, "w", encoding="utf-8") as staged_file:
+                staged_file.write(content)
+        self.stage(target_path, write)
+
+    def stage_remove(self, target_path: str):
+        """Prepara la eliminación de un archivo."""
+        self._record({"op": "remove", "path": os.path.abspath(target_path)})
+
+    def commit(self, workers: int = COMMIT_WORKERS) -> int:
+        """
+        Aplica todas las operaciones preparadas.
+
+        Primero se escribe el diario de la confirmación (con las rutas de las copias de seguridad)
+        y después, en paralelo, cada original se mueve a la copia de seguridad y la salida
+        preparada ocupa su lugar; ambas son operaciones os.replace, atómicas y sin copiar datos.
+        Si la confirmación se interrumpe, rollback() restaura lo que se llegó a sustituir.
+
+        Args:
+            workers: Número de operaciones de archivo que se ejecutan en paralelo.
+
+        Returns:
+            El número de operaciones aplicadas.
+
+        Raises:
+            ValueError: Si hay una confirmación interrumpida sin deshacer.
+        """
+        with self._lock:
+            operations = list(self._operations.values())
+        if not operations:
+            return 0
+
+        if os.path.isdir(self._pending_commit_dir):
+            raise ValueError(f"Hay una confirmación interrumpida en {self.path}; deshágala con rollback() antes de confirmar.")
+        shutil.rmtree(self._last_commit_dir, ignore_errors=True)  # Solo se puede deshacer la última
+        os.makedirs(os.path.join(self._pending_commit_dir, "backup"))
+        entries = []
+        for index, operation in enumerate(operations):
+            entry = dict(operation)
+            entry["backup"] = str(index)
+            entry["had_original"] = os.path.exists(operation["path"])
+            entries.append(entry)
+        commit_journal_path = os.path.join(self._pending_commit_dir, "commit.jsonl")
+        with open(commit_journal_path, "w", encoding="utf-8") as commit_journal:
+            for entry in entries:
+                commit_journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            if self.fsync:
+                commit_journal.flush()
+                os.fsync(commit_journal.fileno())
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            if self.fsync:
+                staged_paths = [os.path.join(self._staged_dir, entry["staged"]) for entry in entries if entry["op"] == "write"]
+                list(executor.map(_fsync_path, staged_paths))
+            list(executor.map(self._commit_entry, entries))
+            if self.fsync:
+                list(executor.map(_fsync_path, {os.path.dirname(entry["path"]) for entry in entries}))
+
+        os.replace(self._pending_commit_dir, self._last_commit_dir)
+        with self._lock:
+            self._operations.clear()
+            self._journal.seek(0)
+            self._journal.truncate()
+        return len(entries)
+
+    def _commit_entry(self, entry: Dict[str, Any]):
+        target_path = entry["path"]
+        if entry["had_original"]:
+            os.replace(target_path, os.path.join(self._pending_commit_dir, "backup", entry["backup"]))
+        if entry["op"] == "write":
+            os.replace(os.path.join(self._staged_dir, entry["staged"]), target_path)
+
+    def rollback(self) -> int:
+        """
+        Deshace la última confirmación (o la parte aplicada de una confirmación interrumpida):
+        restaura los originales desde las copias de seguridad y elimina los archivos que la
+        confirmación creó.
+
+        Returns:
+            El número de archivos restaurados o eliminados.
+
+        Raises:
+            ValueError: Si no hay ninguna confirmación que deshacer.
+        """
+        if os.path.isdir(self._pending_commit_dir):
+            commit_dir = self._pending_commit_dir
+        elif os.path.isdir(self._last_commit_dir):
+            commit_dir = self._last_commit_dir
+        else:
+            raise ValueError(f"No hay ninguna confirmación que deshacer en {self.path}.")
+
+        with open(os.path.join(commit_dir, "commit.jsonl"), "r", encoding="utf-8") as commit_journal:
+            entries: List[Dict[str, Any]] = [json.loads(line) for line in commit_journal if line.strip()]
+
+        undone = 0
+        for entry in entries:
+            target_path = entry["path"]
+            backup_path = os.path.join(commit_dir, "backup", entry["backup"])
+            if os.path.exists(backup_path):
+                os.replace(backup_path, target_path)
+                undone += 1
+            elif (not entry["had_original"] and entry["op"] == "write" and os.path.exists(target_path)
+                  and not os.path.exists(os.path.join(self._staged_dir, entry["staged"]))):
+                os.remove(target_path)  # Archivo creado por la confirmación
+                undone += 1
+        shutil.rmtree(commit_dir)
+        return undone
+
+    def close(self):
+        """Cierra el diario. Las operaciones no confirmadas se conservan para reanudar."""
+        with self._lock:
+            self._journal.close()
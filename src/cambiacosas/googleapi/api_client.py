@@ -1,13 +1,37 @@
 # src/cambiacosas/googleapi/api_client.py  (ES)
-import requests
+import json
+import time
 from .gemini_options import GeminisOptions, GeminiOptionsError
+from .hedging import NO_RACE, HedgeCancelled
 
-def call_gemini_api(gemini_config):
+# Caracteres por token aproximados, para estimar el consumo de TPM de una petición
+CHARS_PER_TOKEN = 4
+
+class StreamInterruptedError(Exception):
+    """El stream falló después de entregar texto; no se reintenta para no duplicarlo."""
+    pass
+
+def estimate_request_tokens(gemini_config):
+    """Estima los tokens de entrada de una petición a partir del tamaño de su cuerpo JSON."""
+    return len(gemini_config.body_bytes()) // CHARS_PER_TOKEN + 1
+
+def call_gemini_api(gemini_config, client=None, limiter=None, on_first_byte=None, on_usage=None, hedge=None):
     """
     Llama a la API de Google Gemini utilizando la configuración proporcionada.
 
     Args:
         gemini_config: Un objeto GeminisOptions que contiene la configuración de la API de Gemini.
+        client: Un GeminiHTTPClient opcional compartido por la ejecución. Si se proporciona, la
+                petición reutiliza sus conexiones keep-alive y sus tiempos de espera; si no, se
+                abre una conexión nueva para esta petición.
+        limiter: Un RateLimiter opcional compartido por la ejecución. Si se proporciona, la petición
+                 espera a que lo permitan los límites del modelo y se reintenta ante 429 y 5xx.
+        on_first_byte: Una función opcional que se llama con los segundos transcurridos hasta
+                       recibir las cabeceras de la respuesta correcta (tiempo hasta el primer byte).
+        on_usage: Una función opcional que se llama con el usageMetadata de la respuesta (el
+                  recuento de tokens de entrada y de salida), si la respuesta lo incluye.
+        hedge: Una HedgePolicy opcional compartida por la ejecución. Si se proporciona y la
+               respuesta tarda, se envía un duplicado y se usa la primera respuesta completa.
 
     Returns:
         Un diccionario que representa los datos de respuesta de la API en caso de éxito.
@@ -16,6 +40,7 @@ def call_gemini_api(gemini_config):
         GeminiOptionsError: Si hay un error en la configuración de Gemini.
         requests.exceptions.RequestException: Si hay un error durante la solicitud a la API.
     """
+    import requests  # Diferido: importar requests cuesta ~100 ms y no hace falta para --help
     try:
         if not isinstance(gemini_config, GeminisOptions):
             raise GeminiOptionsError("Invalid gemini_config type. Must be a GeminisOptions object.")
@@ -23,11 +48,32 @@ def call_gemini_api(gemini_config):
         url = gemini_config.url
         headers = gemini_config.headers
         method = gemini_config.method
-        body = gemini_config.body
+        body = gemini_config.body_bytes()
 
-        response = requests.request(method, url, headers=headers, json=body)
-        response.raise_for_status() # Lanza HTTPError para respuestas incorrectas (4xx o 5xx)
-        return response.json() # O procesa la respuesta según sea necesario
+        @_abandoned_on_loss
+        def send_request(ticket):
+            ticket.sent()
+            # En una carrera con un duplicado, el cuerpo se lee por partes para poder abandonarlo
+            if client is not None:
+                response = client.send(method, url, headers, body, stream=ticket.racing,
+                                       abort=ticket.on_abort if ticket.racing else None)
+            else:
+                response = requests.request(method, url, headers=headers, data=body, stream=ticket.racing)
+            with response:
+                response.raise_for_status() # Lanza HTTPError para respuestas incorrectas (4xx o 5xx)
+                ticket.first_byte(response.elapsed.total_seconds())
+                json_response = _read_json(response, ticket) # O procesa la respuesta según sea necesario
+                if not ticket.claim():
+                    raise HedgeCancelled("El duplicado de la petición respondió antes.")
+            if on_first_byte is not None:
+                on_first_byte(response.elapsed.total_seconds())
+            if on_usage is not None:
+                usage = gemini_usage_metadata(json_response)
+                if usage is not None:
+                    on_usage(usage)
+            return json_response
+
+        return _run_attempts(gemini_config, send_request, limiter, hedge)
 
     except GeminiOptionsError as e:
         raise GeminiOptionsError(f"Gemini configuration error: {e}") from e
@@ -36,6 +82,177 @@ def call_gemini_api(gemini_config):
     except Exception as e:
         raise Exception(f"An unexpected error occurred: {e}") from e
 
+def stream_gemini_api(gemini_config, client=None, sink=None, on_text=None, limiter=None, on_first_byte=None, on_usage=None,
+                      hedge=None):
+    """
+    Llama a la API de Google Gemini en modo streaming (Server-Sent Events, `alt=sse`) y consume
+    la respuesta de forma incremental, sin esperar al array completo.
+
+    Cada evento SSE se decodifica y se descarta en cuanto se extrae su texto, por lo que la
+    memoria usada no depende del tamaño de la respuesta JSON sino solo del texto generado.
+
+    Args:
+        gemini_config: Un objeto GeminisOptions que contiene la configuración de la API de Gemini.
+        client: Un GeminiHTTPClient opcional compartido por la ejecución. Su tiempo de espera de
+                lectura se aplica entre eventos, de modo que un stream detenido lanza un error.
+        sink: Un objeto tipo archivo opcional (p. ej., un archivo temporal) donde se escribe
+              cada fragmento de texto según llega. Con sink, el texto no se acumula en memoria.
+        on_text: Una función opcional que se llama con cada fragmento de texto recibido.
+        limiter: Un RateLimiter opcional compartido por la ejecución. Los errores se reintentan
+                 solo si ocurren antes de recibir texto (después lanzan StreamInterruptedError).
+        on_first_byte: Una función opcional que se llama con los segundos transcurridos desde el
+                       envío de la petición hasta el primer evento de datos.
+        on_usage: Una función opcional que se llama al terminar con el último usageMetadata
+                  recibido (cada evento lleva el recuento acumulado), si lo hay.
+        hedge: Una HedgePolicy opcional compartida por la ejecución. Si el primer evento tarda,
+               se envía un duplicado; el primero que recibe datos es el que entrega el texto.
+
+    Returns:
+        La cadena de texto completa generada por el modelo o, con sink, el número de caracteres
+        escritos en él.
+
+    Raises:
+        GeminiOptionsError: Si hay un error en la configuración de Gemini.
+        requests.exceptions.RequestException: Si hay un error durante la solicitud a la API.
+    """
+    import requests  # Diferido, como en call_gemini_api
+    try:
+        if not isinstance(gemini_config, GeminisOptions):
+            raise GeminiOptionsError("Invalid gemini_config type. Must be a GeminisOptions object.")
+
+        url = gemini_config.url
+        if "alt=sse" not in url:
+            url += ("&" if "?" in url else "?") + "alt=sse"
+        headers = gemini_config.headers
+        method = gemini_config.method
+        body = gemini_config.body_bytes()
+
+        @_abandoned_on_loss
+        def send_request(ticket):
+            ticket.sent()
+            start_time = time.monotonic()
+            if client is not None:
+                response = client.send(method, url, headers, body, stream=True,
+                                       abort=ticket.on_abort if ticket.racing else None)
+            else:
+                response = requests.request(method, url, headers=headers, data=body, stream=True)
+
+            text_fragments = []  # Solo sin sink
+            fragment_count = 0
+            char_count = 0
+            usage = None
+            first_event = True
+            with response:
+                response.raise_for_status() # Lanza HTTPError para respuestas incorrectas (4xx o 5xx)
+                try:
+                    for line in response.iter_lines():
+                        if not line.startswith(b"data:"):
+                            continue # Ignora líneas vacías, comentarios y otros campos SSE
+                        if first_event:
+                            ticket.first_byte(time.monotonic() - start_time)
+                            if not ticket.claim(): # El texto se entrega según llega: gana el primero con datos
+                                raise HedgeCancelled("El duplicado de la petición recibió datos antes.")
+                            if on_first_byte is not None:
+                                on_first_byte(time.monotonic() - start_time)
+                        first_event = False
+                        item = json.loads(line[len(b"data:"):].decode("utf-8"))
+                        usage = item.get("usageMetadata") or usage
+                        for text in _iter_item_texts(item):
+                            fragment_count += 1
+                            char_count += len(text)
+                            if sink is not None:
+                                sink.write(text)
+                            else:
+                                text_fragments.append(text)
+                            if on_text is not None:
+                                on_text(text)
+                except requests.exceptions.RequestException as e:
+                    if fragment_count:
+                        raise StreamInterruptedError(f"Stream interrupted after {fragment_count} fragments: {e}") from e
+                    raise
+            if usage is not None and on_usage is not None:
+                on_usage(usage)
+            return char_count if sink is not None else "".join(text_fragments)
+
+        return _run_attempts(gemini_config, send_request, limiter, hedge)
+
+    except GeminiOptionsError as e:
+        raise GeminiOptionsError(f"Gemini configuration error: {e}") from e
+    except requests.exceptions.RequestException as e:
+        raise requests.exceptions.RequestException(f"API request failed: {e}") from e
+    except Exception as e:
+        raise Exception(f"An unexpected error occurred: {e}") from e
+
+def _run_attempts(gemini_config, send_request, limiter, hedge):
+    """
+    Ejecuta send_request(ticket) a través del limitador (si lo hay) y, con una HedgePolicy, en una
+    carrera con un posible duplicado. El duplicado consume los presupuestos RPM y TPM del
+    limitador, pero no espera un hueco de concurrencia: lo ocupa su original, que lo libera en
+    cuanto pierde la carrera.
+    """
+    def attempt(ticket):
+        if limiter is not None:
+            return limiter.call(gemini_config.model_id, lambda: send_request(ticket), estimate_request_tokens(gemini_config),
+                                use_slot=not ticket.is_hedge, on_abort=ticket.on_abort if ticket.racing else None)
+        return send_request(ticket)
+
+    if hedge is not None:
+        return hedge.run(attempt)
+    return attempt(NO_RACE)
+
+def _abandoned_on_loss(send_request):
+    """
+    Convierte el error de un intento que perdió la carrera (su conexión se cerró al ganar el otro)
+    en HedgeCancelled, para que el limitador no lo reintente.
+    """
+    def wrapper(ticket):
+        try:
+            return send_request(ticket)
+        except HedgeCancelled:
+            raise
+        except Exception as e:
+            if ticket.lost():
+                raise HedgeCancelled("El otro intento de la petición respondió antes.") from e
+            raise
+    return wrapper
+
+def _read_json(response, ticket):
+    """Lee el cuerpo JSON de la respuesta; en una carrera, por partes, y lo abandona si el otro intento gana."""
+    if not ticket.racing:
+        return response.json()
+    chunks = []
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        if ticket.lost():
+            raise HedgeCancelled("El duplicado de la petición respondió antes.")
+        chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+def _iter_item_texts(item):
+    """Genera los textos de las partes del primer candidato de un elemento de respuesta."""
+    if 'candidates' in item and item['candidates']:
+        candidate = item['candidates'][0]
+        if 'content' in candidate and candidate['content'] and 'parts' in candidate['content']:
+            for part in candidate['content']['parts']:
+                if 'text' in part:
+                    yield part['text']
+
+def gemini_usage_metadata(json_response):
+   """
+   Devuelve el usageMetadata (promptTokenCount, candidatesTokenCount, totalTokenCount...) de una
+   respuesta de Gemini: el del último elemento que lo incluye, que lleva el recuento final.
+
+   Args:
+       json_response: La respuesta JSON fragmentada de la API de Gemini.
+
+   Returns:
+       El diccionario usageMetadata, o None si la respuesta no lo incluye.
+   """
+   usage = None
+   for item in json_response if isinstance(json_response, list) else [json_response]:
+       if isinstance(item, dict) and item.get("usageMetadata"):
+           usage = item["usageMetadata"]
+   return usage
+
 def parse_gemini_response(json_response):
    """
    Analiza la respuesta JSON de la API de Gemini para extraer y reconstruir el contenido JSON.
@@ -46,30 +263,43 @@ def parse_gemini_response(json_response):
    Returns:
        Una cadena que contiene la respuesta JSON completa con el contenido 'response', o None en caso de error.
    """
-   full_response_content = ""
-   extracted_json = ""
-   try:
-       for item in json_response:
-           if 'candidates' in item and item['candidates']:
-               candidate = item['candidates'][0]
-               if 'content' in candidate and candidate['content'] and 'parts' in candidate['content']:
-                   for part in candidate['content']['parts']:
-                       if 'text' in part:
-                           full_response_content += part['text']
-
-       # Intenta extraer JSON si la respuesta es una cadena JSON
-       try:
-           import json
-           start_index = full_response_content.find('{')
-           if start_index != -1:
-               json_fragment = full_response_content[start_index:]
-               extracted_json = json.loads(json_fragment)
-               return extracted_json
-           else:
-               return full_response_content # Devuelve como cadena si no se encuentra JSON
-       except json.JSONDecodeError:
-           return full_response_content # Devuelve como cadena si falla la decodificación de JSON
+   full_response_content = gemini_response_text(json_response)
+   if full_response_content is None:
+       return None
+   return parse_gemini_text(full_response_content)
+
+def gemini_response_text(json_response):
+   """
+   Reconstruye el texto completo generado por Gemini a partir de la respuesta JSON fragmentada.
 
+   Args:
+       json_response: La respuesta JSON fragmentada de la API de Gemini.
+
+   Returns:
+       El texto completo de la respuesta, o None en caso de error.
+   """
+   try:
+       return "".join(text for item in json_response for text in _iter_item_texts(item))
    except (TypeError, ValueError, KeyError) as e:
        print(f"Error parsing Gemini response: {e}")
        return None
+
+def parse_gemini_text(full_response_content):
+   """
+   Extrae el contenido JSON del texto completo generado por Gemini (p. ej., el devuelto por
+   stream_gemini_api).
+
+   Args:
+       full_response_content: El texto completo de la respuesta.
+
+   Returns:
+       El objeto JSON extraído, o el texto tal cual si no contiene JSON válido.
+   """
+   # Intenta extraer JSON si la respuesta es una cadena JSON
+   start_index = full_response_content.find('{')
+   if start_index == -1:
+       return full_response_content # Devuelve como cadena si no se encuentra JSON
+   try:
+       return json.loads(full_response_content[start_index:])
+   except json.JSONDecodeError:
+       return full_response_content # Devuelve como cadena si falla la decodificación de JSON
@@ -0,0 +1,98 @@
+# src/cambiacosas/googleapi/batch_jobs.py  (ES)
+import json
+import re
+
+from .api_client import gemini_response_text
+
+# Longitud del prefijo del hash del contenido que se incluye en cada clave
+KEY_HASH_LENGTH = 16
+
+_KEY_PATTERN = re.compile(r"(?P<path>.+)#(?P<chunk>\d+)/(?P<total>\d+)@(?P<hash>[0-9a-f]+)")
+
+
+def batch_key(relative_path, chunk_num, total_chunks, file_hash):
+    """
+    Construye la clave estable de una petición de un trabajo por lotes.
+
+    La clave identifica el archivo (ruta relativa a la carpeta, con '/' como separador), el
+    fragmento y el contenido del que se generó la petición, de modo que los mismos archivos
+    producen siempre las mismas claves y batch apply puede comprobar que el archivo no cambió.
+
+    Args:
+        relative_path (str): La ruta del archivo relativa a la carpeta procesada.
+        chunk_num (int): El número del fragmento (basado en 1; 1 para un archivo completo).
+        total_chunks (int): El número total de fragmentos del archivo.
+        file_hash (str): El hash SHA-256 (hexadecimal) del contenido completo del archivo.
+
+    Returns:
+        str: La clave, p. ej. "src/app.py#1/3@3f2a9c0d1b4e5f60".
+    """
+    return f"{relative_path}#{chunk_num}/{total_chunks}@{file_hash[:KEY_HASH_LENGTH]}"
+
+
+def parse_batch_key(key):
+    """
+    Descompone una clave generada por batch_key.
+
+    Returns:
+        tuple: (ruta relativa, número de fragmento, total de fragmentos, prefijo del hash).
+
+    Raises:
+        ValueError: Si la clave no tiene el formato de batch_key.
+    """
+    match = _KEY_PATTERN.fullmatch(key) if isinstance(key, str) else None
+    if match is None:
+        raise ValueError(f"Clave de lote no válida: {key!r}")
+    chunk_num, total_chunks = int(match.group("chunk")), int(match.group("total"))
+    if not 1 <= chunk_num <= total_chunks:
+        raise ValueError(f"Clave de lote no válida: {key!r}")
+    return match.group("path"), chunk_num, total_chunks, match.group("hash")
+
+
+def batch_request_line(key, gemini_config):
+    """
+    Serializa una petición como una línea del archivo de entrada de un trabajo por lotes de
+    Gemini: {"key": ..., "request": <cuerpo de GenerateContentRequest>}. Las claves JSON se
+    ordenan, así que la misma petición produce siempre la misma línea.
+
+    Args:
+        key (str): La clave de la petición (ver batch_key).
+        gemini_config: Un objeto GeminisOptions.
+
+    Returns:
+        str: La línea JSON, con el salto de línea final.
+    """
+    return json.dumps({"key": key, "request": gemini_config.body}, ensure_ascii=False, sort_keys=True) + "\n"
+
+
+def read_batch_results(results_path):
+    """
+    Lee el archivo de resultados de un trabajo por lotes (JSON Lines), línea a línea.
+
+    Cada línea tiene la forma {"key": ..., "response": <GenerateContentResponse>} o, si la
+    petición falló, {"key": ..., "error": {...}}, como en los resultados de la API de lotes de
+    Gemini. Cualquier otra herramienta puede generar el mismo formato.
+
+    Args:
+        results_path (str): Ruta al archivo de resultados.
+
+    Yields:
+        tuple: (clave, texto de la respuesta o None, error o None) por cada línea no vacía. Las
+               líneas que no son JSON válido o no tienen clave se devuelven con clave None.
+    """
+    with open(results_path, "r", encoding="utf-8") as results_file:
+        for line_num, line in enumerate(results_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield None, None, f"línea {line_num}: JSON no válido ({e})"
+                continue
+            if not isinstance(result, dict) or not isinstance(result.get("key"), str):
+                yield None, None, f"línea {line_num}: falta la clave"
+                continue
+            if result.get("error") is not None or not isinstance(result.get("response"), dict):
+                yield result["key"], None, result.get("error") or "sin respuesta"
+                continue
+            yield result["key"], gemini_response_text([result["response"]]), None
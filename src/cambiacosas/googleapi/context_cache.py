@@ -0,0 +1,169 @@
+# src/cambiacosas/googleapi/context_cache.py  (ES)
+import threading
+import time
+
+from .api_client import CHARS_PER_TOKEN
+
+# Tiempo de vida por defecto (en segundos) de un contexto en caché
+DEFAULT_TTL_SECONDS = 600
+# Segundos antes de su expiración a partir de los cuales un contexto ya no se usa y se crea otro,
+# para que ninguna petición en curso haga referencia a un contexto que acaba de expirar
+EXPIRY_MARGIN_SECONDS = 30
+# Tokens estimados mínimos de las instrucciones para cachearlas: la API rechaza los contextos más
+# pequeños, y por debajo de este tamaño el ahorro no compensa la petición de creación
+MIN_CACHE_TOKENS = 1024
+# Códigos HTTP con los que la API rechaza una petición que hace referencia a un contexto que ya no
+# existe o que no se puede usar; la petición se repite con las instrucciones en línea
+CONTEXT_ERROR_STATUS_CODES = frozenset({400, 403, 404})
+
+
+class _CachedContext:
+    def __init__(self, name, expires_at):
+        self.name = name
+        self.expires_at = expires_at
+
+
+class ContextCache:
+    """
+    Contextos en caché de Gemini (cachedContents) para las instrucciones del sistema de una ejecución.
+
+    Todas las peticiones de una ejecución comparten las mismas instrucciones del sistema (el prompt
+    y el preámbulo). La primera petición que las usa crea un contexto en caché con ellas y las
+    siguientes hacen referencia a él por su nombre (GeminisOptions.set_cached_content), así que no
+    se vuelven a enviar ni se facturan como tokens de entrada completos en cada archivo o fragmento.
+
+    Cada contexto dura ttl_seconds y se vuelve a crear cuando está a punto de expirar. Si no se puede
+    crear (modelo sin soporte, instrucciones demasiado cortas, error de la API), las peticiones con
+    esas instrucciones las envían en línea durante el resto de la ejecución. Es segura para usarse
+    desde varios hilos: si varios hilos necesitan el mismo contexto, solo uno lo crea.
+
+    Attributes:
+        created (int): Número de contextos creados durante esta ejecución.
+    """
+    def __init__(self, client=None, ttl_seconds=DEFAULT_TTL_SECONDS, min_tokens=MIN_CACHE_TOKENS, log=print):
+        """
+        Inicializa la caché de contextos.
+
+        Args:
+            client: Un GeminiHTTPClient opcional con el que se crean y eliminan los contextos.
+            ttl_seconds (int): Tiempo de vida de cada contexto, en segundos.
+            min_tokens (int): Tokens estimados mínimos de las instrucciones para crear un contexto.
+            log (callable): Función con la que se informa de los contextos creados y de los errores.
+        """
+        if ttl_seconds <= EXPIRY_MARGIN_SECONDS:
+            raise ValueError(f"ttl_seconds debe ser mayor que {EXPIRY_MARGIN_SECONDS}.")
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.log = log
+        self.created = 0
+        self._contexts = {}  # (base_url, model_id, instrucciones) -> _CachedContext, o None si no está disponible
+        self._creation_locks = {}
+        self._names = []  # Todos los contextos creados, para eliminarlos en close
+        self._lock = threading.Lock()
+
+    def apply(self, gemini_config):
+        """
+        Hace que la petición use el contexto en caché de sus instrucciones del sistema, creándolo si
+        no existe o está a punto de expirar.
+
+        Args:
+            gemini_config: Un objeto GeminisOptions.
+
+        Returns:
+            bool: True si la petición usa un contexto en caché; False si envía las instrucciones en línea.
+        """
+        instruction = gemini_config.system_instruction
+        if not instruction.strip() or len(instruction) // CHARS_PER_TOKEN < self.min_tokens:
+            return False
+        name = self._context_name(gemini_config)
+        if name is None:
+            return False
+        gemini_config.set_cached_content(name)
+        return True
+
+    def invalidate(self, name):
+        """Descarta un contexto que la API ya no acepta; la siguiente petición crea otro."""
+        with self._lock:
+            for key, context in list(self._contexts.items()):
+                if context is not None and context.name == name:
+                    del self._contexts[key]
+
+    def _context_name(self, gemini_config):
+        key = (gemini_config.base_url, gemini_config.model_id, gemini_config.system_instruction)
+        with self._lock:
+            creation_lock = self._creation_locks.setdefault(key, threading.Lock())
+        with creation_lock:
+            with self._lock:
+                if key in self._contexts:
+                    context = self._contexts[key]
+                    if context is None:
+                        return None
+                    if context.expires_at - EXPIRY_MARGIN_SECONDS > time.monotonic():
+                        return context.name
+            try:
+                context = self._create(gemini_config)
+            except Exception as e:
+                self.log(f"  No se pudo crear el contexto en caché de Gemini ({e}); "
+                         "las instrucciones se envían en cada petición.")
+                context = None
+            else:
+                self.log(f"  Contexto en caché de Gemini creado: {context.name} (TTL {self.ttl_seconds} s).")
+            with self._lock:
+                self._contexts[key] = context
+                if context is not None:
+                    self.created += 1
+                    self._names.append((gemini_config.base_url, gemini_config.api_key, context.name))
+            return context.name if context is not None else None
+
+    def _create(self, gemini_config):
+        """Crea un contexto con las instrucciones del sistema (POST cachedContents) y lo devuelve."""
+        import requests  # Diferido, como en api_client
+        body = {
+            "model": f"models/{gemini_config.model_id}",
+            "systemInstruction": {"parts": [{"text": gemini_config.system_instruction}]},
+            "ttl": f"{self.ttl_seconds}s",
+        }
+        url = f"{gemini_config.base_url}/v1beta/cachedContents?key={gemini_config.api_key}"
+        start_time = time.monotonic()
+        if self.client is not None:
+            response = self.client.send("POST", url, gemini_config.headers, body)
+        else:
+            response = requests.request("POST", url, headers=gemini_config.headers, json=body)
+        response.raise_for_status()
+        name = response.json().get("name")
+        if not isinstance(name, str) or not name:
+            raise ValueError("la respuesta no contiene el nombre del contexto")
+        return _CachedContext(name, start_time + self.ttl_seconds)
+
+    def close(self):
+        """
+        Elimina los contextos creados durante la ejecución (DELETE), para no pagar su almacenamiento
+        hasta que expiren. Los errores se ignoran: el contexto expira igualmente al terminar su TTL.
+        """
+        import requests
+        with self._lock:
+            names, self._names = self._names, []
+            self._contexts.clear()
+        for base_url, api_key, name in names:
+            url = f"{base_url}/v1beta/{name}?key={api_key}"
+            try:
+                if self.client is not None:
+                    self.client.session.delete(url, timeout=self.client.timeout)
+                else:
+                    requests.delete(url, timeout=10)
+            except requests.exceptions.RequestException:
+                pass
+
+
+def is_context_error(error):
+    """
+    Indica si un error de una petición se debe (probablemente) al contexto en caché al que hacía
+    referencia: una respuesta 400, 403 o 404, aunque esté envuelta en otras excepciones.
+    """
+    while error is not None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if status is not None:
+            return status in CONTEXT_ERROR_STATUS_CODES
+        error = error.__cause__
+    return False
@@ -1,5 +1,68 @@
+import json
 import os
 
+# Modelo de Gemini que se usa si no se llama a set_model
+DEFAULT_MODEL_ID = "gemini-2.0-flash"
+# Modelos que no admiten respuestas JSON con esquema (responseSchema): set_model les pide texto plano
+TEXT_ONLY_MODELS = frozenset({"gemini-2.0-flash-thinking-exp-01-21"})
+
+# URL base de la API. La variable de entorno GEMINI_API_BASE_URL la sustituye (p. ej., para
+# apuntar a un servidor simulado local en los benchmarks)
+DEFAULT_API_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# Esquema de respuesta del modo parche: una lista de ediciones por rango de líneas (basadas en 1,
+# inclusivas) en lugar del archivo completo reescrito
+LINE_EDITS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "edits": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "start_line": {"type": "integer"},
+                    "end_line": {"type": "integer"},
+                    "replacement": {"type": "string"},
+                },
+                "required": ["start_line", "end_line", "replacement"],
+            },
+        }
+    },
+    "required": ["edits"],
+}
+
+# Esquema de respuesta de una petición con varios archivos pequeños: cada archivo completo
+# reescrito, identificado por la ruta con la que se envió
+PACKED_FILES_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "files": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string"},
+                    "content": {"type": "string"},
+                },
+                "required": ["path", "content"],
+            },
+        }
+    },
+    "required": ["files"],
+}
+
+# Esquema de respuesta por defecto: el archivo completo reescrito en la propiedad 'response'
+DEFAULT_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "response": {
+            "type": "string" # La propiedad 'response' debe ser de tipo string
+        }
+    }
+}
+
+# Instrucciones del sistema por defecto (actualmente vacías)
+DEFAULT_SYSTEM_INSTRUCTION = "    "
 
 class GeminiOptionsError(Exception):
     """Excepción base para errores en las opciones de Gemini."""
@@ -9,6 +72,79 @@ class GeminiAPIKeyError(GeminiOptionsError):
     """Excepción para errores relacionados con la clave de API de Gemini."""
     pass
 
+# Número máximo de plantillas derivadas que guarda cada plantilla (ver _RequestTemplate.derive)
+MAX_DERIVED_TEMPLATES = 64
+
+# Marcador que ocupa el lugar del texto de entrada al serializar una plantilla
+_INPUT_PLACEHOLDER = "\0cambiacosas-input\0"
+
+def _request_body(input_text, system_instruction, generation_config, cached_content=None):
+    """
+    Construye el cuerpo de una petición (el texto de entrada va primero, ver _RequestTemplate).
+    Con cached_content, las instrucciones del sistema no se envían: ya están en el contexto en caché.
+    """
+    body = {
+        "contents": [
+            {
+                "role": "user", # Rol del contenido: usuario
+                "parts": [{"text": input_text}] # Texto de entrada del usuario
+            }
+        ],
+    }
+    if cached_content is None:
+        body["systemInstruction"] = {"parts": [{"text": system_instruction}]} # Instrucciones para el sistema
+    else:
+        body["cachedContent"] = cached_content # Contexto en caché con las instrucciones del sistema
+    body["generationConfig"] = generation_config # Configuración de generación
+    return body
+
+class _RequestTemplate:
+    """
+    Partes constantes del cuerpo de una petición: las instrucciones del sistema (o el contexto en
+    caché que las contiene) y la configuración de generación, ya serializadas como JSON (UTF-8)
+    antes y después del texto de entrada.
+
+    Es inmutable y se comparte entre todas las peticiones con las mismas opciones, de modo que cada
+    petición solo serializa su texto de entrada. Los set_* de GeminisOptions obtienen las variantes
+    con derive, que las guarda para reutilizarlas.
+    """
+    __slots__ = ("system_instruction", "generation_config", "cached_content", "prefix", "suffix", "_derived")
+
+    def __init__(self, system_instruction, generation_config, cached_content=None):
+        self.system_instruction = system_instruction
+        self.generation_config = generation_config
+        self.cached_content = cached_content
+        serialized = json.dumps(_request_body(_INPUT_PLACEHOLDER, system_instruction, generation_config, cached_content),
+                                ensure_ascii=False)
+        # El texto de entrada es el primer valor del cuerpo: la primera aparición del marcador es la suya
+        prefix, suffix = serialized.split(json.dumps(_INPUT_PLACEHOLDER, ensure_ascii=False), 1)
+        self.prefix = prefix.encode("utf-8")
+        self.suffix = suffix.encode("utf-8")
+        self._derived = {}
+
+    def derive(self, key, build, is_current=None):
+        """
+        Devuelve la plantilla derivada identificada por key, creándola con build() si no existe (o
+        si is_current, cuando se indica, la descarta). Se guardan como mucho MAX_DERIVED_TEMPLATES.
+        """
+        template = self._derived.get(key)
+        if template is None or (is_current is not None and not is_current(template)):
+            template = build()
+            if len(self._derived) >= MAX_DERIVED_TEMPLATES:
+                self._derived.clear()
+            self._derived[key] = template
+        return template
+
+    def with_generation_config(self, key, generation_config, is_current=None):
+        return self.derive(key, lambda: _RequestTemplate(self.system_instruction, generation_config, self.cached_content),
+                           is_current)
+
+# Plantilla de las opciones por defecto, compartida por todas las instancias de GeminisOptions
+_DEFAULT_TEMPLATE = _RequestTemplate(DEFAULT_SYSTEM_INSTRUCTION, {
+    "responseMimeType": "application/json", # Tipo MIME de la respuesta esperado: JSON
+    "responseSchema": DEFAULT_RESPONSE_SCHEMA, # Esquema de la respuesta esperado
+})
+
 class GeminisOptions:
     """
     Opciones para la API de Gemini.
@@ -16,6 +152,10 @@ class GeminisOptions:
     Esta clase configura las opciones necesarias para interactuar con la API de Gemini,
     incluyendo la clave de API, el modelo a utilizar, la URL de la API, las cabeceras,
     el método HTTP y el cuerpo de la petición.
+
+    Las partes constantes del cuerpo (instrucciones del sistema y configuración de generación) se
+    guardan en una plantilla inmutable y ya serializada que comparten todas las instancias con las
+    mismas opciones; body_bytes solo serializa el texto de entrada de cada petición.
     """
     def __init__(self):
         """
@@ -29,40 +169,54 @@ class GeminisOptions:
         if not api_key:
             raise GeminiAPIKeyError("Error: La variable de entorno 'GEMINI_API_KEY' no está configurada. Por favor, configura tu clave de API de Gemini.")
         self.api_key = api_key
-        self.model_id = "gemini-2.0-flash" # Modelo por defecto
-        self.url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_id}:streamGenerateContent?key={self.api_key}" # URL de la API
+        self.model_id = DEFAULT_MODEL_ID # Modelo por defecto
+        self.base_url = (os.environ.get("GEMINI_API_BASE_URL") or DEFAULT_API_BASE_URL).rstrip("/") # URL base de la API
+        self.url = f"{self.base_url}/v1beta/models/{self.model_id}:streamGenerateContent?key={self.api_key}" # URL de la API
         self.headers = {"Content-Type": "application/json"} # Cabeceras para la petición JSON
         self.method = "POST" # Método HTTP POST
-        self.body = { # Cuerpo de la petición
-            "contents": [
-                {
-                    "role": "user", # Rol del contenido: usuario
-                    "parts": [
-                        {
-                            "text": "INSERT_INPUT_HERE" # Texto de entrada del usuario (se reemplaza dinámicamente)
-                        }
-                    ]
-                }
-            ],
-            "systemInstruction": { # Instrucciones para el sistema (actualmente vacías)
-                "parts": [
-                    {
-                        "text": "    "
-                    }
-                ]
-            },
-            "generationConfig": { # Configuración de generación
-                "responseMimeType": "application/json", # Tipo MIME de la respuesta esperado: JSON
-                "responseSchema": { # Esquema de la respuesta esperado
-                    "type": "object",
-                    "properties": {
-                        "response": {
-                            "type": "string" # La propiedad 'response' debe ser de tipo string
-                        }
-                    }
-                }
-            }
-        }
+        self._template = _DEFAULT_TEMPLATE # Partes constantes del cuerpo, compartidas
+        self._input_text = "INSERT_INPUT_HERE" # Texto de entrada del usuario (se reemplaza dinámicamente)
+        self._body_bytes = None # Cuerpo serializado (se calcula en body_bytes)
+
+    @property
+    def body(self):
+        """
+        El cuerpo de la petición como diccionario. Se construye en cada acceso y comparte con la
+        plantilla las instrucciones del sistema y la configuración de generación, así que no debe
+        modificarse: para cambiar la petición se usan los métodos set_*.
+        """
+        return _request_body(self._input_text, self._template.system_instruction, self._template.generation_config,
+                             self._template.cached_content)
+
+    @property
+    def input_text(self):
+        """El texto de entrada de la petición."""
+        return self._input_text
+
+    @property
+    def system_instruction(self):
+        """Las instrucciones del sistema de la petición (aunque se envíen en un contexto en caché)."""
+        return self._template.system_instruction
+
+    @property
+    def cached_content(self):
+        """El nombre del contexto en caché al que hace referencia la petición, o None."""
+        return self._template.cached_content
+
+    def body_bytes(self):
+        """
+        Devuelve el cuerpo de la petición serializado como JSON en UTF-8, listo para enviarse.
+
+        Solo se serializa el texto de entrada; el resto se copia de la plantilla. El resultado se
+        guarda hasta el siguiente cambio de las opciones.
+
+        Returns:
+            bytes: El cuerpo JSON de la petición.
+        """
+        if self._body_bytes is None:
+            text = json.dumps(self._input_text, ensure_ascii=False).encode("utf-8")
+            self._body_bytes = self._template.prefix + text + self._template.suffix
+        return self._body_bytes
 
     def set_input_text(self, input_text):
         """
@@ -71,10 +225,10 @@ class GeminisOptions:
         Args:
             input_text (str): El texto de entrada del usuario.
         """
-        try:
-            self.body["contents"][0]["parts"][0]["text"] = input_text # Actualiza el texto de entrada en el cuerpo de la petición
-        except Exception as e:
-            raise GeminiOptionsError(f"Error al establecer el texto de entrada: {e}") from e
+        if not isinstance(input_text, str):
+            raise GeminiOptionsError(f"Error al establecer el texto de entrada: se esperaba str, no {type(input_text).__name__}")
+        self._input_text = input_text # Actualiza el texto de entrada del cuerpo de la petición
+        self._body_bytes = None
 
     def set_model(self, model):
         """
@@ -85,22 +239,17 @@ class GeminisOptions:
         """
         try:
             self.model_id = model # Actualiza el ID del modelo
-            self.url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_id}:streamGenerateContent?key={self.api_key}" # Reconstruye la URL con el nuevo modelo
-            if model == "gemini-2.0-flash": # Configuración específica para el modelo 'gemini-2.0-flash'
-                self.body["generationConfig"]["responseMimeType"] = "application/json" # Espera respuesta en JSON
-                if "responseSchema" not in self.body["generationConfig"]: # Asegura que el esquema de respuesta esté definido
-                    self.body["generationConfig"]["responseSchema"] = {
-                        "type": "object",
-                        "properties": {
-                            "response": {
-                                "type": "string"
-                            }
-                        }
-                    }
-            else:  # model == "gemini-2.0-flash-thinking-exp-01-21" # Configuración para otros modelos (ej. 'gemini-2.0-flash-thinking-exp-01-21')
-                self.body["generationConfig"]["responseMimeType"] = "text/plain" # Espera respuesta en texto plano
-                if "responseSchema" in self.body["generationConfig"]: # Elimina el esquema de respuesta si existe
-                    del self.body["generationConfig"]["responseSchema"]
+            self.url = f"{self.base_url}/v1beta/models/{self.model_id}:streamGenerateContent?key={self.api_key}" # Reconstruye la URL con el nuevo modelo
+            generation_config = dict(self._template.generation_config)
+            structured = model not in TEXT_ONLY_MODELS
+            if structured: # Modelos con respuestas JSON (p. ej., 'gemini-2.0-flash', 'gemini-2.0-flash-lite', 'gemini-2.5-pro')
+                generation_config["responseMimeType"] = "application/json" # Espera respuesta en JSON
+                generation_config.setdefault("responseSchema", DEFAULT_RESPONSE_SCHEMA) # Conserva el esquema establecido, o usa el predeterminado
+            else:  # Modelos de TEXT_ONLY_MODELS (ej. 'gemini-2.0-flash-thinking-exp-01-21')
+                generation_config["responseMimeType"] = "text/plain" # Espera respuesta en texto plano
+                generation_config.pop("responseSchema", None) # Elimina el esquema de respuesta si existe
+            self._template = self._template.with_generation_config(("model", structured), generation_config)
+            self._body_bytes = None
         except Exception as e:
             raise GeminiOptionsError(f"Error al establecer el modelo: {e}") from e
 
@@ -108,12 +257,21 @@ class GeminisOptions:
         """
         Establece el esquema de respuesta esperado para la API de Gemini.
 
+        El esquema pasa a formar parte de una plantilla compartida, así que no debe modificarse
+        después de establecerlo.
+
         Args:
             response_schema (dict): El esquema de respuesta en formato diccionario.
         """
         try:
-            self.body["generationConfig"]["responseMimeType"] = "application/json" # Asegura que el tipo MIME sea JSON
-            self.body["generationConfig"]["responseSchema"] = response_schema # Establece el esquema de respuesta
+            generation_config = dict(self._template.generation_config)
+            generation_config["responseMimeType"] = "application/json" # Asegura que el tipo MIME sea JSON
+            generation_config["responseSchema"] = response_schema # Establece el esquema de respuesta
+            # Las plantillas se guardan por identidad del esquema (los esquemas del módulo son constantes)
+            self._template = self._template.with_generation_config(
+                ("schema", id(response_schema)), generation_config,
+                lambda template: template.generation_config["responseSchema"] is response_schema)
+            self._body_bytes = None
         except Exception as e:
             raise GeminiOptionsError(f"Error al establecer el esquema de respuesta: {e}") from e
 
@@ -125,6 +283,28 @@ class GeminisOptions:
             system_instruction (str): Las instrucciones del sistema en formato string.
         """
         try:
-            self.body["systemInstruction"]["parts"][0]["text"] = system_instruction # Actualiza las instrucciones del sistema en el cuerpo de la petición
+            template = self._template
+            # Un contexto en caché contiene otras instrucciones: la petición vuelve a enviarlas en línea
+            self._template = template.derive(("system", system_instruction),
+                                             lambda: _RequestTemplate(system_instruction, template.generation_config))
+            self._body_bytes = None
+        except Exception as e:
+            raise GeminiOptionsError(f"Error al establecer las instrucciones del sistema: {e}") from e
+
+    def set_cached_content(self, cached_content):
+        """
+        Hace que la petición use un contexto en caché de Gemini (cachedContents) que contiene sus
+        instrucciones del sistema, en lugar de enviarlas en cada petición.
+
+        Args:
+            cached_content (str): El nombre del contexto (p. ej., "cachedContents/abc123"), creado
+                                  para el mismo modelo y las mismas instrucciones. None vuelve a
+                                  enviar las instrucciones en la petición.
+        """
+        try:
+            template = self._template
+            self._template = template.derive(("cached", cached_content), lambda: _RequestTemplate(
+                template.system_instruction, template.generation_config, cached_content))
+            self._body_bytes = None
         except Exception as e:
-            raise GeminiOptionsError(f"Error al establecer las instrucciones del sistema: {e}") from e
\ No newline at end of file
+            raise GeminiOptionsError(f"Error al establecer el contexto en caché: {e}") from e
@@ -0,0 +1,289 @@
+# src/cambiacosas/googleapi/hedging.py  (ES)
+import collections
+import math
+import threading
+
+# Fracción máxima por defecto de las peticiones que se pueden duplicar
+DEFAULT_MAX_FRACTION = 0.05
+# Percentil por defecto del tiempo hasta el primer byte a partir del cual se duplica una petición
+DEFAULT_PERCENTILE = 95
+# Tiempos hasta el primer byte necesarios antes de usar el percentil observado (sin retraso fijo
+# no se duplica nada hasta tenerlos)
+MIN_SAMPLES = 20
+# Número de tiempos recientes con los que se calcula el percentil
+SAMPLE_WINDOW = 200
+
+
+class HedgeCancelled(Exception):
+    """La petición perdió la carrera frente a su duplicado y se abandonó."""
+    pass
+
+
+class _NoRace:
+    """Intento sin duplicado: nunca pierde (lo usa api_client cuando no hay HedgePolicy)."""
+    racing = False
+    is_hedge = False
+
+    def sent(self):
+        pass
+
+    def first_byte(self, seconds):
+        pass
+
+    def claim(self):
+        return True
+
+    def lost(self):
+        return False
+
+    def on_abort(self, callback):
+        pass
+
+
+NO_RACE = _NoRace()
+
+
+class _Ticket:
+    """La vista que tiene cada intento (original o duplicado) de la carrera en la que participa."""
+    racing = True
+
+    def __init__(self, race, index):
+        self._race = race
+        self._index = index
+        self.is_hedge = index == 1
+
+    def sent(self):
+        """Se llama justo antes de enviar la petición; lanza HedgeCancelled si el otro intento ya ganó."""
+        if self.lost():
+            raise HedgeCancelled("otro intento ya respondió")
+        self._race.on_sent(self._index)
+
+    def first_byte(self, seconds):
+        """Se llama al recibir el primer byte de la respuesta, con los segundos desde el envío."""
+        self._race.on_first_byte(seconds)
+
+    def claim(self):
+        """Reclama la victoria; devuelve False si el otro intento ganó antes (y este debe abandonarse)."""
+        return self._race.claim(self._index)
+
+    def lost(self):
+        return self._race.winner not in (None, self._index)
+
+    def on_abort(self, callback):
+        """
+        Registra una función que libera un recurso del intento (su conexión o su hueco del
+        limitador) en cuanto el otro intento gana; si ya ganó, la llama al momento.
+        """
+        self._race.add_abort(self._index, callback)
+
+
+class _Race:
+    """Una petición y, si tarda, su duplicado: gana la primera que reclama la victoria."""
+    def __init__(self, policy, attempt):
+        self.policy = policy
+        self.attempt = attempt
+        self.condition = threading.Condition()
+        self.winner = None
+        self.running = 0
+        self.outcome = None  # (valor, excepción) del intento ganador
+        self.errors = []
+        self.first_byte_seen = False
+        self.timer = None
+        self.abort_callbacks = ([], [])  # Por intento: se llaman cuando el otro gana
+
+    def run(self):
+        """
+        Ejecuta el intento original en otro hilo y devuelve el resultado del ganador en cuanto lo
+        hay, sin esperar al perdedor: al ganar un intento se cierra la conexión del otro y se
+        libera su hueco del limitador, y su hilo termina en cuanto la lectura falla.
+        """
+        self.running = 1
+        threading.Thread(target=self._run_attempt, args=(0,), daemon=True).start()
+        try:
+            with self.condition:
+                # Si el original falla o pierde, espera al duplicado que sigue en curso
+                while self.outcome is None and self.running > 0:
+                    self.condition.wait()
+        finally:
+            if self.timer is not None:
+                self.timer.cancel()
+        if self.outcome is None:
+            raise next((e for e in self.errors if not isinstance(e, HedgeCancelled)), self.errors[0])
+        value, error = self.outcome
+        if error is not None:
+            raise error
+        return value
+
+    def on_sent(self, index):
+        delay = self.policy.hedge_delay() if index == 0 else None
+        with self.condition:
+            # Solo el primer envío del original (no sus reintentos) programa el duplicado
+            if delay is None or self.timer is not None:
+                return
+            self.timer = threading.Timer(delay, self._hedge)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def on_first_byte(self, seconds):
+        self.policy.record_first_byte(seconds)
+        with self.condition:
+            self.first_byte_seen = True
+
+    def add_abort(self, index, callback):
+        with self.condition:
+            if self.winner in (None, index):
+                self.abort_callbacks[index].append(callback)
+                return
+        callback()  # El otro intento ya ganó
+
+    def claim(self, index):
+        with self.condition:
+            won = self._set_winner(index)
+            self.condition.notify_all()
+            result = self.winner == index
+        self._abort_loser(won)
+        return result
+
+    def _set_winner(self, index):
+        """Fija el ganador si aún no lo hay; devuelve las funciones de abandono del perdedor."""
+        if self.winner is not None:
+            return []
+        self.winner = index
+        callbacks = list(self.abort_callbacks[1 - index])
+        self.abort_callbacks[1 - index].clear()
+        return callbacks
+
+    @staticmethod
+    def _abort_loser(callbacks):
+        for callback in callbacks:
+            callback()
+
+    def _hedge(self):
+        """Hilo del temporizador: envía el duplicado si el original aún no ha recibido nada."""
+        with self.condition:
+            if self.first_byte_seen or self.winner is not None or self.running == 0:
+                return
+            if not self.policy.acquire_hedge():
+                return
+            self.running += 1
+        self._run_attempt(1)
+
+    def _run_attempt(self, index):
+        try:
+            value = self.attempt(_Ticket(self, index))
+        except BaseException as e:
+            with self.condition:
+                self.running -= 1
+                if self.winner == index and self.outcome is None:
+                    self.outcome = (None, e)  # Falló después de ganar (p. ej., un stream interrumpido)
+                else:
+                    self.errors.append(e)
+                self.condition.notify_all()
+            return
+        with self.condition:
+            self.running -= 1
+            won = self._set_winner(index)
+            if self.winner == index:
+                self.outcome = (value, None)
+                if index == 1:
+                    self.policy.record_hedge_win()
+            self.condition.notify_all()
+        self._abort_loser(won)
+
+
+class HedgePolicy:
+    """
+    Duplicado de peticiones lentas (hedging) para recortar la latencia de cola.
+
+    Si una petición no ha recibido su primer byte tras un retraso (fijo, o el percentil observado
+    del tiempo hasta el primer byte), se envía un duplicado. Gana la primera respuesta completa y
+    la otra se abandona en ese momento: se cierra su conexión (aunque aún espere las cabeceras) y
+    se libera su hueco del limitador. En streaming gana el primer
+    intento que recibe datos, porque su texto se entrega según llega. Los duplicados se limitan a
+    una fracción de todas las peticiones para no consumir la cuota. Es segura para usarse desde
+    varios hilos y se comparte por toda la ejecución.
+
+    Attributes:
+        requests (int): Número de peticiones que han pasado por la política.
+        hedges (int): Número de duplicados enviados.
+        hedge_wins (int): Número de duplicados que respondieron antes que la petición original.
+    """
+    def __init__(self, delay=None, percentile=DEFAULT_PERCENTILE, max_fraction=DEFAULT_MAX_FRACTION,
+                 min_samples=MIN_SAMPLES):
+        """
+        Inicializa la política.
+
+        Args:
+            delay (float): Segundos sin primer byte tras los que se duplica una petición. Si es
+                           None, se usa el percentil `percentile` de los tiempos observados.
+            percentile (float): Percentil del tiempo hasta el primer byte que se usa sin delay.
+            max_fraction (float): Fracción máxima de las peticiones que se pueden duplicar.
+            min_samples (int): Tiempos observados necesarios antes de usar el percentil.
+        """
+        if delay is not None and delay <= 0:
+            raise ValueError("delay debe ser positivo.")
+        if not 0 < percentile < 100:
+            raise ValueError("percentile debe estar en (0, 100).")
+        if not 0 <= max_fraction <= 1:
+            raise ValueError("max_fraction debe estar en [0, 1].")
+        self.delay = delay
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._samples = collections.deque(maxlen=SAMPLE_WINDOW)
+        self._lock = threading.Lock()
+
+    def run(self, attempt):
+        """
+        Ejecuta una petición con la posibilidad de duplicarla.
+
+        Args:
+            attempt (callable): Función que recibe un ticket y envía la petición. Debe llamar a
+                                ticket.sent() antes de enviarla, a ticket.first_byte(segundos) al
+                                recibir el primer byte, y a ticket.claim() antes de entregar nada
+                                (al terminar, o en streaming con los primeros datos). Si claim
+                                devuelve False, o ticket.lost() es True mientras lee, debe lanzar
+                                HedgeCancelled. Con ticket.on_abort(función) registra cómo liberar
+                                sus recursos si pierde. Cada intento se ejecuta en su propio hilo.
+
+        Returns:
+            El resultado del intento ganador.
+
+        Raises:
+            La excepción del intento original si ningún intento termina bien.
+        """
+        with self._lock:
+            self.requests += 1
+        return _Race(self, attempt).run()
+
+    def hedge_delay(self):
+        """Devuelve el retraso actual tras el que se duplica una petición, o None si aún no se duplica."""
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, math.ceil(len(samples) * self.percentile / 100) - 1)]
+
+    def record_first_byte(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def acquire_hedge(self):
+        """
+        Reserva un duplicado si no se supera max_fraction de las peticiones (más uno, para que las
+        ejecuciones cortas también puedan duplicar su petición más lenta); devuelve si se reservó.
+        """
+        with self._lock:
+            if self.max_fraction == 0 or self.hedges >= self.max_fraction * self.requests + 1:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
@@ -0,0 +1,144 @@
+# src/cambiacosas/googleapi/http_client.py  (ES)
+import contextlib
+import gzip
+import json
+import socket
+import threading
+
+# Tamaño mínimo (en bytes) del cuerpo JSON a partir del cual se comprime con gzip
+GZIP_MIN_BYTES = 32 * 1024
+
+# Registro de abandono de la petición que envía cada hilo (ver GeminiHTTPClient.send)
+_current_request = threading.local()
+# Protege la asociación entre una conexión y la petición que la puede abandonar
+_abort_lock = threading.Lock()
+
+
+class _ConnectionAbort:
+    """Permite cerrar desde otro hilo la conexión de una petición mientras la petición la usa."""
+    def __init__(self, conn):
+        self._conn = conn
+
+    def abort(self):
+        """Cierra el socket de la conexión; la lectura bloqueada en el hilo de la petición falla al momento."""
+        with _abort_lock:
+            sock = getattr(self._conn, "sock", None) if self._conn is not None else None
+            if sock is not None:
+                with contextlib.suppress(OSError):
+                    sock.shutdown(socket.SHUT_RDWR)
+
+    def detach(self):
+        with _abort_lock:
+            self._conn = None
+
+
+class _AbortableConnections:
+    """
+    Mezcla para los grupos de conexiones de urllib3: cada conexión que toma una petición enviada
+    con `abort` se registra para poder cerrarla, y se desvincula antes de volver al grupo (para
+    no cerrar nunca una conexión que ya usa otra petición).
+    """
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        register = getattr(_current_request, "abort", None)
+        if register is not None:
+            conn._cambiacosas_abort = _ConnectionAbort(conn)
+            register(conn._cambiacosas_abort.abort)
+        return conn
+
+    def _put_conn(self, conn):
+        handle = getattr(conn, "_cambiacosas_abort", None)
+        if handle is not None:
+            handle.detach()
+            conn._cambiacosas_abort = None
+        super()._put_conn(conn)
+
+
+def _abortable_pool_classes():
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class AbortableHTTPConnectionPool(_AbortableConnections, HTTPConnectionPool):
+        pass
+
+    class AbortableHTTPSConnectionPool(_AbortableConnections, HTTPSConnectionPool):
+        pass
+
+    return {"http": AbortableHTTPConnectionPool, "https": AbortableHTTPSConnectionPool}
+
+
+class GeminiHTTPClient:
+    """
+    Cliente HTTP persistente para la API de Gemini.
+
+    Mantiene una única sesión de `requests` con un grupo de conexiones keep-alive, de modo que
+    las llamadas sucesivas reutilizan la conexión TCP+TLS en lugar de abrir una nueva en cada
+    petición. Está pensado para crearse una vez por ejecución y compartirse entre hilos.
+    """
+    def __init__(self, pool_size=10, connect_timeout=10.0, read_timeout=300.0, gzip_min_bytes=GZIP_MIN_BYTES):
+        """
+        Inicializa el cliente y su grupo de conexiones.
+
+        Args:
+            pool_size (int): Número de conexiones que se mantienen abiertas por host. Debe
+                             coincidir con el número de peticiones simultáneas esperadas.
+            connect_timeout (float): Segundos máximos para establecer la conexión.
+            read_timeout (float): Segundos máximos de espera entre bytes recibidos.
+            gzip_min_bytes (int): Tamaño mínimo del cuerpo para enviarlo comprimido con gzip.
+                                  None desactiva la compresión.
+        """
+        if pool_size < 1:
+            raise ValueError("pool_size debe ser un entero positivo.")
+        import requests  # Diferido: importar requests cuesta ~100 ms y no hace falta para --help
+        from requests.adapters import HTTPAdapter
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.gzip_min_bytes = gzip_min_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        adapter.poolmanager.pool_classes_by_scheme = _abortable_pool_classes()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send(self, method, url, headers, body, stream=False, abort=None):
+        """
+        Envía una petición JSON reutilizando las conexiones del grupo.
+
+        Args:
+            method (str): El método HTTP.
+            url (str): La URL de la petición.
+            headers (dict): Las cabeceras de la petición (no se modifican).
+            body (bytes | dict): El cuerpo JSON ya serializado (p. ej., GeminisOptions.body_bytes())
+                                 o un diccionario, que se serializa como JSON.
+            stream (bool): Si es True, el cuerpo de la respuesta se lee de forma incremental.
+            abort (callable): Función opcional con la que se registra, para cada conexión que usa la
+                              petición, una función que la cierra desde otro hilo (la usan los
+                              intentos de HedgePolicy para abandonar al perdedor). Cerrarla hace
+                              fallar la petición, incluso si espera las cabeceras; la conexión no
+                              vuelve al grupo.
+
+        Returns:
+            requests.Response: La respuesta HTTP.
+
+        Raises:
+            requests.exceptions.RequestException: Si falla la petición o se agota un tiempo de espera.
+        """
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        request_headers = dict(headers)
+        if self.gzip_min_bytes is not None and len(data) >= self.gzip_min_bytes:
+            data = gzip.compress(data)
+            request_headers["Content-Encoding"] = "gzip"
+        _current_request.abort = abort
+        try:
+            return self.session.request(method, url, headers=request_headers, data=data, timeout=self.timeout, stream=stream)
+        finally:
+            _current_request.abort = None
+
+    def close(self):
+        """Cierra todas las conexiones del grupo."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,187 @@
+# src/cambiacosas/googleapi/model_router.py  (ES)
+import collections
+import fnmatch
+import json
+import os
+import re
+import threading
+
+from .gemini_options import DEFAULT_MODEL_ID, TEXT_ONLY_MODELS
+
+# Condiciones que admite una ruta, en un archivo de rutas (JSON) o en --route
+ROUTE_KEYS = ("min_tokens", "max_tokens", "paths", "content")
+
+
+class ModelRoute:
+    """
+    Una ruta de ModelRouter: el modelo al que se envían las peticiones que cumplen todas sus
+    condiciones (las que no se indican no se comprueban).
+    """
+    def __init__(self, model, min_tokens=None, max_tokens=None, paths=None, content=None):
+        """
+        Inicializa la ruta.
+
+        Args:
+            model (str): El ID del modelo de Gemini.
+            min_tokens (int): Tokens estimados mínimos del contenido de la petición.
+            max_tokens (int): Tokens estimados máximos del contenido de la petición.
+            paths (list): Patrones glob; la ruta de cada archivo relativa a la carpeta procesada
+                          (p. ej., "src/*.py" o "tests/**") o su nombre debe cumplir alguno.
+            content (str): Expresión regular (multilínea) que debe aparecer en el contenido (una
+                           comprobación local y rápida, p. ej., de si el archivo define clases).
+        """
+        if not isinstance(model, str) or not model:
+            raise ValueError("El modelo de una ruta debe ser un texto no vacío.")
+        if model in TEXT_ONLY_MODELS:
+            raise ValueError(f"El modelo {model} no admite respuestas JSON con esquema y no se puede usar en una ruta.")
+        for name, value in (("min_tokens", min_tokens), ("max_tokens", max_tokens)):
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                raise ValueError(f"{name} debe ser un entero no negativo.")
+        if isinstance(paths, str):
+            paths = [paths]
+        if paths is not None and not all(isinstance(glob, str) for glob in paths):
+            raise ValueError("paths debe ser una lista de patrones glob.")
+        try:
+            self.content = re.compile(content, re.MULTILINE) if content is not None else None
+        except (re.error, TypeError) as e:
+            raise ValueError(f"Expresión regular no válida en content: {e}") from e
+        self.model = model
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.paths = tuple(paths) if paths is not None else None
+
+    def matches(self, file_paths, tokens, text):
+        """
+        Indica si una petición cumple la ruta. file_paths son las rutas de sus archivos relativas a
+        la carpeta procesada, con '/' como separador, como las que compara ScanFilter.
+        """
+        if self.min_tokens is not None and tokens < self.min_tokens:
+            return False
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            return False
+        if self.paths is not None and not all(
+                any(fnmatch.fnmatch(path, glob) or fnmatch.fnmatch(os.path.basename(path), glob) for glob in self.paths)
+                for path in file_paths):
+            return False
+        return self.content is None or self.content.search(text) is not None
+
+
+class ModelRouter:
+    """
+    Elige el modelo de Gemini de cada petición (un archivo, un fragmento o un paquete) según sus
+    tokens estimados, las rutas de sus archivos o su contenido.
+
+    Las rutas se comprueban en orden y se usa el modelo de la primera que se cumple; si no se
+    cumple ninguna, el modelo por defecto. Así, los archivos pequeños o de configuración pueden ir
+    a un modelo rápido y barato, y solo los grandes o complejos a uno más capaz. El formato de la
+    respuesta de cada modelo lo ajusta GeminisOptions.set_model. Es segura para usarse desde
+    varios hilos.
+
+    Attributes:
+        routed (collections.Counter): Número de peticiones enviadas a cada modelo.
+    """
+    def __init__(self, routes=(), default_model=DEFAULT_MODEL_ID):
+        """
+        Inicializa el enrutador.
+
+        Args:
+            routes (list): Las rutas (ModelRoute), en orden de prioridad.
+            default_model (str): El modelo de las peticiones que no cumplen ninguna ruta.
+        """
+        if not isinstance(default_model, str) or not default_model:
+            raise ValueError("El modelo por defecto debe ser un texto no vacío.")
+        if default_model in TEXT_ONLY_MODELS:
+            raise ValueError(f"El modelo {default_model} no admite respuestas JSON con esquema.")
+        self.routes = list(routes)
+        self.default_model = default_model
+        self.routed = collections.Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def models(self):
+        """Todos los modelos a los que se pueden enviar peticiones, empezando por el predeterminado."""
+        return list(dict.fromkeys([self.default_model] + [route.model for route in self.routes]))
+
+    def choose(self, file_paths, tokens, text):
+        """
+        Devuelve el modelo para una petición.
+
+        Args:
+            file_paths (list): Las rutas de los archivos de la petición (varias en un paquete),
+                               relativas a la carpeta procesada.
+            tokens (int): Los tokens estimados del contenido de la petición.
+            text (str): El contenido de la petición.
+        """
+        return next((route.model for route in self.routes if route.matches(file_paths, tokens, text)),
+                    self.default_model)
+
+    def apply(self, gemini_config, file_paths, tokens):
+        """
+        Elige el modelo de una petición y lo establece en gemini_config (con set_model, que ajusta
+        el formato de la respuesta). Debe llamarse antes de calcular la clave de la caché.
+
+        Returns:
+            str: El modelo elegido.
+        """
+        model = self.choose(file_paths, tokens, gemini_config.input_text)
+        if model != gemini_config.model_id:
+            gemini_config.set_model(model)
+        with self._lock:
+            self.routed[model] += 1
+        return model
+
+    @classmethod
+    def from_file(cls, path, default_model=None, extra_routes=()):
+        """
+        Crea un enrutador a partir de un archivo JSON de rutas:
+        {"default": "gemini-2.0-flash", "routes": [{"model": "...", "max_tokens": 500, "paths": ["*.json"]}]}
+
+        Args:
+            path (str): La ruta del archivo.
+            default_model (str): Modelo por defecto que sustituye al del archivo (p. ej., el de --model).
+            extra_routes (list): Rutas que se comprueban antes que las del archivo (p. ej., las de --route).
+
+        Raises:
+            ValueError: Si el archivo no se puede leer o no es un archivo de rutas válido.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"No se pudo leer el archivo de rutas {path}: {e}") from e
+        if not isinstance(data, dict) or not isinstance(data.get("routes", []), list):
+            raise ValueError(f"El archivo de rutas {path} debe ser un objeto JSON con una lista 'routes'.")
+        routes = list(extra_routes)
+        for entry in data.get("routes", []):
+            if not isinstance(entry, dict) or "model" not in entry or set(entry) - {"model", *ROUTE_KEYS}:
+                raise ValueError(f"Ruta no válida en {path}: {entry} (claves admitidas: model, {', '.join(ROUTE_KEYS)}).")
+            routes.append(ModelRoute(**entry))
+        return cls(routes, default_model or data.get("default", DEFAULT_MODEL_ID))
+
+
+def parse_route(spec):
+    """
+    Analiza una ruta escrita en la línea de comandos: MODELO[:clave=valor[;clave=valor...]], con
+    las claves de ROUTE_KEYS y los patrones de paths separados por '|'. Por ejemplo:
+    "gemini-2.0-flash-lite:max_tokens=500;paths=*.json|*.yaml".
+
+    Raises:
+        ValueError: Si la ruta no es válida.
+    """
+    model, _, conditions = spec.partition(":")
+    options = {}
+    for condition in filter(None, conditions.split(";")):
+        key, separator, value = condition.partition("=")
+        key = key.strip()
+        if not separator or key not in ROUTE_KEYS:
+            raise ValueError(f"Condición no válida en la ruta '{spec}': '{condition}' (claves admitidas: {', '.join(ROUTE_KEYS)}).")
+        if key in ("min_tokens", "max_tokens"):
+            try:
+                options[key] = int(value)
+            except ValueError:
+                raise ValueError(f"{key} debe ser un entero en la ruta '{spec}'.") from None
+        elif key == "paths":
+            options[key] = value.split("|")
+        else:
+            options[key] = value
+    return ModelRoute(model.strip(), **options)
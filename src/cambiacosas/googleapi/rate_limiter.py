@@ -0,0 +1,291 @@
+# src/cambiacosas/googleapi/rate_limiter.py  (ES)
+import random
+import re
+import threading
+import time
+
+# Límites (peticiones por minuto, tokens por minuto) de cada modelo en el nivel gratuito de la
+# API de Gemini. Solo se aplican con RateLimiter(free_tier=True); rpm y tpm los sustituyen.
+MODEL_RATE_LIMITS = {
+    "gemini-2.0-flash": (15, 1_000_000),
+    "gemini-2.0-flash-lite": (30, 1_000_000),
+    "gemini-2.0-flash-thinking-exp-01-21": (10, 1_000_000),
+    "gemini-2.5-flash": (10, 250_000),
+    "gemini-2.5-pro": (5, 250_000),
+}
+DEFAULT_RATE_LIMITS = (15, 1_000_000)
+
+# Códigos HTTP que se reintentan; los de sobrecarga además reducen la concurrencia
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+OVERLOAD_STATUS_CODES = frozenset({429, 503})
+
+# Control de concurrencia AIMD: +1/límite por éxito, ×0.5 por sobrecarga y ×0.9 por latencia alta
+DECREASE_FACTOR = 0.5
+LATENCY_DECREASE_FACTOR = 0.9
+LATENCY_BACKOFF_RATIO = 3.0  # Latencia respecto a la media móvil a partir de la cual se reduce
+LATENCY_EWMA_WEIGHT = 0.2
+
+
+class _Budget:
+    """
+    Presupuesto por minuto (cubo de fichas): se recarga de forma continua hasta su capacidad y
+    cada reserva puede dejarlo en negativo, lo que hace esperar a las reservas siguientes.
+    """
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        """Reserva amount unidades y devuelve los segundos que hay que esperar para usarlas."""
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+        self.available -= min(amount, self.capacity)  # Una petición mayor que la capacidad no esperaría nunca
+        return max(0.0, -self.available / self.rate)
+
+
+class _ModelLimiter:
+    """Presupuestos, pausa por Retry-After y límite de concurrencia adaptativo de un modelo."""
+    def __init__(self, rpm, tpm, initial_concurrency, max_concurrency):
+        self.requests = _Budget(rpm) if rpm else None
+        self.tokens = _Budget(tpm) if tpm else None
+        self.paused_until = 0.0
+        self.concurrency = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+
+class _SlotLease:
+    """El hueco de concurrencia que ocupa una petición; se libera una sola vez."""
+    def __init__(self, limiter, model):
+        self._limiter = limiter
+        self._model = model
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self, latency=None):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._limiter._release_slot(self._model, latency=latency)
+
+
+class RateLimiter:
+    """
+    Limitador de peticiones a Gemini compartido por toda la ejecución.
+
+    Por cada modelo aplica un límite de peticiones simultáneas que crece de forma aditiva con cada
+    respuesta correcta y se reduce de forma multiplicativa ante un 429/503 o una latencia muy
+    superior a la habitual (AIMD), y, si se conocen, un presupuesto de peticiones por minuto (RPM)
+    y de tokens por minuto (TPM). Así el ritmo se mantiene justo por debajo de la cuota sin
+    superarla, aunque no se conozca de antemano.
+
+    Las respuestas 429 y 5xx y los errores de conexión se reintentan: se respeta la cabecera
+    Retry-After (o el retryDelay del cuerpo del error) y, si no hay, se espera un tiempo
+    exponencial con jitter. Un 429 pausa todas las peticiones del modelo durante ese tiempo.
+    """
+    def __init__(self, rpm=None, tpm=None, free_tier=False, initial_concurrency=1, max_concurrency=16,
+                 max_retries=6, base_delay=1.0, max_delay=60.0, log=print):
+        """
+        Inicializa el limitador.
+
+        Args:
+            rpm (int): Peticiones por minuto para todos los modelos. None no limita las peticiones
+                       por minuto (salvo con free_tier).
+            tpm (int): Tokens de entrada por minuto para todos los modelos. None no los limita
+                       (salvo con free_tier).
+            free_tier (bool): Si es True, rpm y tpm valen por defecto los del nivel gratuito de cada
+                              modelo (MODEL_RATE_LIMITS).
+            initial_concurrency (int): Peticiones simultáneas permitidas al empezar.
+            max_concurrency (int): Máximo de peticiones simultáneas al que puede crecer el límite.
+            max_retries (int): Reintentos por petición antes de propagar el error.
+            base_delay (float): Espera base (en segundos) del retroceso exponencial.
+            max_delay (float): Espera máxima (en segundos) entre reintentos.
+            log (callable): Función con la que se informa de cada reintento.
+        """
+        if initial_concurrency < 1 or max_concurrency < initial_concurrency:
+            raise ValueError("Se requiere 1 <= initial_concurrency <= max_concurrency.")
+        if max_retries < 0:
+            raise ValueError("max_retries no puede ser negativo.")
+        self.rpm = rpm
+        self.tpm = tpm
+        self.free_tier = free_tier
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.log = log
+        self.retries = 0
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model_id):
+        with self._lock:
+            model = self._models.get(model_id)
+            if model is None:
+                default_rpm, default_tpm = (MODEL_RATE_LIMITS.get(model_id, DEFAULT_RATE_LIMITS)
+                                            if self.free_tier else (None, None))
+                model = _ModelLimiter(self.rpm or default_rpm, self.tpm or default_tpm,
+                                      self.initial_concurrency, self.max_concurrency)
+                self._models[model_id] = model
+            return model
+
+    def concurrency(self, model_id):
+        """Devuelve el límite de peticiones simultáneas actual de un modelo."""
+        return self._model(model_id).concurrency
+
+    def call(self, model_id, request, estimated_tokens=0, use_slot=True, on_abort=None):
+        """
+        Ejecuta una petición respetando los límites del modelo y la reintenta si falla de forma transitoria.
+
+        Args:
+            model_id (str): El modelo al que va la petición.
+            request (callable): Función sin argumentos que envía la petición y devuelve su resultado.
+                                Debe lanzar requests.exceptions.HTTPError (p. ej., con raise_for_status)
+                                para las respuestas de error.
+            estimated_tokens (int): Tokens de entrada estimados de la petición (para el presupuesto TPM).
+            use_slot (bool): Si es False, la petición respeta los presupuestos y los reintentos pero
+                             no ocupa un hueco del límite de concurrencia ni cuenta para su ajuste
+                             (los duplicados de HedgePolicy, que no deben esperar a su original).
+            on_abort (callable): Función opcional con la que se registra, en cada intento, la que
+                                 libera su hueco antes de que termine (la usa HedgePolicy cuando
+                                 el intento pierde la carrera); su latencia no cuenta para el ajuste.
+
+        Returns:
+            El resultado de request.
+
+        Raises:
+            requests.exceptions.RequestException: Si la petición falla de forma no transitoria o
+                                                  se agotan los reintentos.
+        """
+        import requests  # Diferido: importar requests cuesta ~100 ms y no hace falta para --help
+        model = self._model(model_id)
+        attempt = 0
+        while True:
+            self._wait_for_budget(model, estimated_tokens)
+            lease = None
+            if use_slot:
+                self._acquire_slot(model)
+                lease = _SlotLease(self, model)
+                if on_abort is not None:
+                    on_abort(lease.release)
+            start_time = time.monotonic()
+            try:
+                result = request()
+            except requests.exceptions.RequestException as e:
+                if lease is not None:
+                    lease.release()
+                status = _status_code(e)
+                if not _is_retryable(e, status) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                delay = self._retry_delay(e, attempt)
+                with self._lock:
+                    self.retries += 1
+                self.log(f"  Gemini ({model_id}) respondió {status or type(e).__name__}; "
+                         f"reintento {attempt}/{self.max_retries} en {delay:.1f} s.")
+                if status in OVERLOAD_STATUS_CODES:
+                    self._on_overload(model, delay)  # La pausa del modelo se espera en _wait_for_budget
+                else:
+                    time.sleep(delay)
+                continue
+            except BaseException:
+                if lease is not None:
+                    lease.release()
+                raise
+            if lease is not None:
+                lease.release(latency=time.monotonic() - start_time)
+            return result
+
+    def _wait_for_budget(self, model, estimated_tokens):
+        with model.condition:
+            now = time.monotonic()
+            wait = max(0.0, model.paused_until - now)
+            if model.requests is not None:
+                wait = max(wait, model.requests.reserve(1, now))
+            if model.tokens is not None and estimated_tokens:
+                wait = max(wait, model.tokens.reserve(estimated_tokens, now))
+        if wait > 0:
+            time.sleep(wait)
+
+    def _acquire_slot(self, model):
+        with model.condition:
+            while model.in_flight >= max(1, int(model.concurrency)):
+                model.condition.wait()
+            model.in_flight += 1
+
+    def _release_slot(self, model, latency=None):
+        with model.condition:
+            model.in_flight -= 1
+            if latency is not None:
+                if model.latency_ewma is not None and latency > LATENCY_BACKOFF_RATIO * model.latency_ewma:
+                    self._decrease(model, LATENCY_DECREASE_FACTOR)
+                else:
+                    model.concurrency = min(model.max_concurrency, model.concurrency + 1.0 / model.concurrency)
+                model.latency_ewma = latency if model.latency_ewma is None else (
+                    LATENCY_EWMA_WEIGHT * latency + (1 - LATENCY_EWMA_WEIGHT) * model.latency_ewma)
+            model.condition.notify_all()
+
+    def _on_overload(self, model, delay):
+        with model.condition:
+            model.paused_until = max(model.paused_until, time.monotonic() + delay)
+            self._decrease(model, DECREASE_FACTOR)
+
+    @staticmethod
+    def _decrease(model, factor):
+        # Una sola reducción por ráfaga: las peticiones que ya estaban en curso fallan a la vez
+        now = time.monotonic()
+        if now - model.last_decrease < 1.0:
+            return
+        model.last_decrease = now
+        model.concurrency = max(1.0, model.concurrency * factor)
+
+    def _retry_delay(self, error, attempt):
+        retry_after = _retry_after_seconds(getattr(error, "response", None))
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Retroceso exponencial con jitter completo
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def _status_code(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _is_retryable(error, status):
+    if status is not None:
+        return status in RETRY_STATUS_CODES
+    import requests
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def _retry_after_seconds(response):
+    """Devuelve la espera indicada por la respuesta (Retry-After o retryDelay de RetryInfo), o None."""
+    if response is None:
+        return None
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            import email.utils  # Solo para Retry-After con fecha HTTP, que es poco habitual
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(header).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    try:
+        details = response.json()["error"]["details"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    for detail in details if isinstance(details, list) else []:
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)s", str(detail.get("retryDelay", ""))) if isinstance(detail, dict) else None
+        if match:
+            return float(match.group(1))
+    return None
@@ -0,0 +1,108 @@
+# src/cambiacosas/googleapi/request_dedup.py  (ES)
+import collections
+import threading
+
+# Caracteres de respuesta que se conservan, como mucho, de las peticiones ya terminadas
+DEFAULT_MAX_CHARS = 16 * 1024 * 1024
+
+
+class _Entry:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response_text = None  # None mientras está en curso o si la petición falló
+
+
+class RequestDeduplicator:
+    """
+    Deduplicación de peticiones idénticas dentro de una ejecución.
+
+    Las copias incluidas de otros proyectos, los archivos generados y las cabeceras de licencia
+    hacen que muchos archivos y fragmentos sean idénticos. Las peticiones se identifican por su
+    clave (response_cache.cache_key: el modelo y el cuerpo, que contiene el prompt y el
+    contenido): la primera con cada clave se envía y las demás reciben su respuesta. Si una
+    petición idéntica está en curso en otro hilo, se espera a que termine en lugar de enviar otra.
+
+    Solo se comparten las respuestas obtenidas; si la petición falla, la siguiente que espera la
+    vuelve a enviar. De las peticiones terminadas se conservan en memoria las respuestas usadas más
+    recientemente, hasta max_chars caracteres en total, para que la memoria no crezca con el tamaño
+    del árbol; las más antiguas se reutilizan a través de la caché de respuestas. Es segura para
+    usarse desde varios hilos.
+
+    Attributes:
+        shared (int): Número de peticiones que reutilizaron la respuesta de otra idéntica.
+    """
+    def __init__(self, max_chars=DEFAULT_MAX_CHARS):
+        """
+        Args:
+            max_chars (int): Caracteres de respuesta que se conservan de las peticiones terminadas.
+        """
+        self.shared = 0
+        self.max_chars = max_chars
+        self._entries = {}  # clave -> _Entry (en curso o terminada)
+        self._done = collections.OrderedDict()  # clave -> caracteres de las terminadas, de la menos a la más reciente
+        self._done_chars = 0
+        self._lock = threading.Lock()
+
+    def run(self, key, request):
+        """
+        Devuelve la respuesta de la petición con esta clave, enviándola con request() solo si
+        ninguna petición idéntica la ha obtenido o está en curso.
+
+        Args:
+            key (str): La clave de la petición.
+            request (callable): Envía la petición y devuelve el texto de la respuesta, o None si falla.
+
+        Returns:
+            tuple: (texto de la respuesta o None, True si se reutilizó la de otra petición).
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = _Entry()
+                    leader = True
+                else:
+                    leader = False
+                    if key in self._done:
+                        self._done.move_to_end(key)
+            if leader:
+                return self._send(key, entry, request), False
+            entry.done.wait()
+            if entry.response_text is not None:
+                with self._lock:
+                    self.shared += 1
+                return entry.response_text, True
+            # La petición idéntica falló: se vuelve a intentar (quizá enviándola este hilo)
+
+    def clear(self):
+        """
+        Olvida las respuestas guardadas (las peticiones en curso no se ven afectadas). Lo usa el
+        modo watch entre tandas, para que la memoria no crezca durante todo el proceso.
+        """
+        with self._lock:
+            for key in self._done:
+                del self._entries[key]
+            self._done.clear()
+            self._done_chars = 0
+
+    def _send(self, key, entry, request):
+        try:
+            response_text = request()
+            entry.response_text = response_text or None
+        finally:
+            with self._lock:
+                if entry.response_text is None:
+                    del self._entries[key]
+                else:
+                    self._remember(key, len(entry.response_text))
+            entry.done.set()
+        return response_text
+
+    def _remember(self, key, chars):
+        """Conserva la respuesta terminada y olvida las usadas menos recientemente si se supera max_chars."""
+        self._done[key] = chars
+        self._done_chars += chars
+        while self._done_chars > self.max_chars and self._done:
+            old_key, old_chars = self._done.popitem(last=False)
+            del self._entries[old_key]  # Quien ya la esperaba conserva su referencia a la entrada
+            self._done_chars -= old_chars
@@ -0,0 +1,131 @@
+# src/cambiacosas/googleapi/response_cache.py  (ES)
+import hashlib
+import os
+import threading
+import time
+
+# Tamaño máximo por defecto de la caché (en bytes)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def default_cache_dir():
+    """Devuelve el directorio de caché por defecto ($XDG_CACHE_HOME/cambiacosas o ~/.cache/cambiacosas)."""
+    base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base_dir, "cambiacosas")
+
+
+def cache_key(gemini_config):
+    """
+    Calcula la clave de caché de una petición a Gemini.
+
+    La clave es un hash SHA-256 del modelo y del cuerpo completo de la petición tal como se envía
+    (GeminisOptions.body_bytes()), que incluye la instrucción del sistema, el texto de entrada
+    (prompt y contenido) y la configuración de generación.
+
+    Args:
+        gemini_config: Un objeto GeminisOptions.
+
+    Returns:
+        str: La clave en hexadecimal.
+    """
+    digest = hashlib.sha256(gemini_config.model_id.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(gemini_config.body_bytes())
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Caché en disco de respuestas de Gemini direccionada por contenido.
+
+    Guarda el texto completo de cada respuesta en una base de datos SQLite dentro del directorio
+    indicado. Cuando el tamaño total supera `max_bytes`, se eliminan las entradas usadas menos
+    recientemente (LRU). Es segura para usarse desde varios hilos.
+
+    Attributes:
+        hits (int): Número de consultas encontradas en la caché durante esta ejecución.
+        misses (int): Número de consultas no encontradas durante esta ejecución.
+    """
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Abre (o crea) la caché en cache_dir.
+
+        Args:
+            cache_dir (str): Directorio donde se guarda la base de datos de la caché.
+            max_bytes (int): Tamaño máximo total de las respuestas almacenadas.
+        """
+        if max_bytes <= 0:
+            raise ValueError("max_bytes debe ser un entero positivo.")
+        import sqlite3  # Diferido: solo se necesita si se usa la caché
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "responses.sqlite3")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """
+        Busca una respuesta en la caché y, si existe, la marca como usada recientemente.
+
+        Args:
+            key (str): La clave calculada con cache_key.
+
+        Returns:
+            str: El texto de la respuesta, o None si no está en la caché.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._connection:
+                self._connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response_text):
+        """
+        Guarda una respuesta en la caché y elimina las entradas menos usadas si se supera el tamaño máximo.
+
+        Args:
+            key (str): La clave calculada con cache_key.
+            response_text (str): El texto completo de la respuesta.
+        """
+        size = len(response_text.encode("utf-8"))
+        if size > self.max_bytes:
+            return  # Nunca cabría en la caché
+        with self._lock, self._connection:
+            previous = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response_text, size, time.time()),
+            )
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Elimina las entradas usadas menos recientemente hasta volver por debajo del tamaño máximo."""
+        evicted_keys = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            self._total_bytes -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+
+    def close(self):
+        """Cierra la base de datos de la caché."""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,454 @@
+import collections
+import hmac
+import ipaddress
+import itertools
+import json
+import os
+import queue
+import socketserver
+import stat
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse, urlsplit
+
+# Estados de un trabajo; los tres últimos son finales
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+FINAL_STATES = frozenset({"done", "failed", "cancelled"})
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Variable de entorno con el token de la API (cabecera "Authorization: Bearer <token>")
+TOKEN_ENV_VAR = "CAMBIACOSAS_SERVER_TOKEN"
+# Nombres de host admitidos en las cabeceras Host y Origin además de la dirección del servidor
+LOOPBACK_NAMES = frozenset({"localhost", "127.0.0.1", "::1"})
+# Trabajos terminados que se conservan para consultarlos; los más antiguos se olvidan
+DEFAULT_MAX_FINISHED_JOBS = 100
+# Tamaño máximo del cuerpo de una petición POST /jobs
+MAX_REQUEST_BYTES = 1024 * 1024
+
+
+class JobConflictError(ValueError):
+    """Ya hay un trabajo pendiente o en curso para la misma carpeta, una que la contiene o una contenida en ella."""
+
+
+def _folders_overlap(first: str, second: str) -> bool:
+    """Indica si dos carpetas (rutas reales) son la misma o una contiene a la otra."""
+    try:
+        return os.path.commonpath([first, second]) in (first, second)
+    except ValueError:  # Unidades distintas en Windows
+        return False
+
+
+class Job:
+    """
+    Un trabajo del servidor: una carpeta, un prompt y sus opciones.
+
+    Registra su estado, sus contadores y sus eventos (cambios de estado y progreso por archivo),
+    que se pueden leer mientras se producen con events(). Es segura para usarse desde varios hilos.
+
+    Attributes:
+        id (str): Identificador del trabajo.
+        folder (str): Ruta absoluta de la carpeta.
+        real_folder (str): La misma ruta con los enlaces simbólicos resueltos.
+        options (Dict): Opciones ya validadas (incluidos la carpeta y el prompt).
+        state (str): Uno de JOB_STATES.
+        counters (collections.Counter): Contadores del progreso (p. ej., archivos procesados y escritos).
+        cancel_event (threading.Event): Se activa al cancelar el trabajo.
+    """
+    def __init__(self, job_id: str, options: Dict[str, Any]):
+        self.id = job_id
+        self.folder = options["folder"]
+        self.real_folder = os.path.realpath(self.folder)
+        self.options = options
+        self.state = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.counters = collections.Counter()
+        self.cancel_event = threading.Event()
+        self._events: List[Dict[str, Any]] = [{"event": "state", "state": "queued", "seq": 0}]
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINAL_STATES
+
+    def emit(self, event: Dict[str, Any]):
+        """Añade un evento (se numera con 'seq') y despierta a quienes leen los eventos."""
+        with self._condition:
+            self._events.append(dict(event, seq=len(self._events)))
+            self._condition.notify_all()
+
+    def count(self, name: str, amount: int = 1):
+        with self._condition:
+            self.counters[name] += amount
+
+    def set_state(self, state: str, error: Optional[str] = None):
+        """Cambia el estado, registra sus tiempos y emite un evento 'state'."""
+        with self._condition:
+            self.state = state
+            self.error = error
+            if state == "running":
+                self.started_at = time.time()
+            elif state in FINAL_STATES:
+                self.finished_at = time.time()
+            event = {"event": "state", "state": state}
+            if error is not None:
+                event["error"] = error
+            self._events.append(dict(event, seq=len(self._events)))
+            self._condition.notify_all()
+
+    def events(self, start: int = 0) -> Iterator[Dict[str, Any]]:
+        """Genera los eventos desde el número start, esperando los nuevos hasta que el trabajo termina."""
+        index = max(0, start)
+        while True:
+            with self._condition:
+                while index >= len(self._events) and not self.finished:
+                    self._condition.wait()
+                batch = self._events[index:]
+                finished = self.finished
+            yield from batch
+            index += len(batch)
+            if finished and not batch:
+                return
+
+    def to_dict(self) -> Dict[str, Any]:
+        """El estado del trabajo para la API (sin el prompt)."""
+        with self._condition:
+            return {
+                "id": self.id,
+                "folder": self.folder,
+                "state": self.state,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "counters": dict(self.counters),
+                "events": len(self._events),
+                "options": {key: value for key, value in self.options.items() if key not in ("folder", "prompt")},
+            }
+
+
+class JobServer:
+    """
+    Cola de trabajos con un número fijo de trabajos activos a la vez.
+
+    Los trabajos se ejecutan en orden de llegada en max_active_jobs hilos, que llaman a
+    run_job(job). run_job debe usar los recursos compartidos del servidor (grupo de trabajadores,
+    limitador, cliente HTTP y cachés), de modo que todos los trabajos se reparten el mismo
+    presupuesto de peticiones, y debe dejar de empezar archivos cuando se activa
+    job.cancel_event. No se admiten dos trabajos pendientes o en curso sobre los mismos archivos:
+    para la misma carpeta o para una que contiene a la otra.
+    """
+    def __init__(self, run_job: Callable[[Job], None], validate: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 max_active_jobs: int = 2, max_finished_jobs: int = DEFAULT_MAX_FINISHED_JOBS):
+        """
+        Inicializa la cola y arranca sus hilos.
+
+        Args:
+            run_job: Ejecuta un trabajo; si lanza una excepción, el trabajo termina como 'failed'.
+            validate: Valida el cuerpo JSON de un trabajo y devuelve sus opciones, con 'folder' (la
+                      ruta absoluta de la carpeta). Lanza ValueError si no es válido.
+            max_active_jobs: Trabajos que se ejecutan a la vez.
+            max_finished_jobs: Trabajos terminados que se conservan para consultarlos.
+        """
+        if max_active_jobs < 1:
+            raise ValueError("max_active_jobs debe ser un entero positivo.")
+        self.run_job = run_job
+        self.validate = validate
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: Dict[str, Job] = collections.OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue()
+        self._runners = [threading.Thread(target=self._run_jobs, name=f"cambiacosas-job-{index}", daemon=True)
+                         for index in range(max_active_jobs)]
+        for runner in self._runners:
+            runner.start()
+
+    def submit(self, request: Dict[str, Any]) -> Job:
+        """
+        Valida un trabajo y lo pone en la cola.
+
+        Raises:
+            ValueError: Si el trabajo no es válido.
+            JobConflictError: Si ya hay un trabajo pendiente o en curso para la misma carpeta (tras
+                              resolver los enlaces simbólicos), una que la contiene o una contenida en ella.
+        """
+        options = self.validate(request)
+        real_folder = os.path.realpath(options["folder"])
+        with self._lock:
+            for other in self._jobs.values():
+                if not other.finished and _folders_overlap(other.real_folder, real_folder):
+                    raise JobConflictError(f"Ya hay un trabajo pendiente o en curso para la carpeta {other.folder}, "
+                                           f"que coincide con {options['folder']} o la contiene o está contenida en ella.")
+            job = Job(f"{next(self._ids)}-{os.urandom(3).hex()}", options)
+            self._jobs[job.id] = job
+            self._prune()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancela un trabajo: si está en la cola, no llega a ejecutarse; si está en curso, no empieza
+        más archivos y termina cuando acaban los que están en curso. Devuelve el trabajo, o None si no existe.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        with self._lock:
+            if job.state == "queued":
+                job.set_state("cancelled")
+        return job
+
+    def close(self):
+        """Cancela todos los trabajos y espera a que terminen los que están en curso."""
+        for job in self.jobs():
+            self.cancel(job.id)
+        for _ in self._runners:
+            self._queue.put(None)
+        for runner in self._runners:
+            runner.join()
+
+    def _run_jobs(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.finished:  # Se canceló en la cola
+                    continue
+                job.set_state("running")
+            try:
+                self.run_job(job)
+            except Exception as e:
+                job.set_state("failed", error=str(e))
+            else:
+                job.set_state("cancelled" if job.cancel_event.is_set() else "done")
+            with self._lock:
+                self._prune()
+
+    def _prune(self):
+        """Olvida los trabajos terminados más antiguos que superan max_finished_jobs."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+
+def is_loopback_host(host: str) -> bool:
+    """Indica si host (un nombre o una dirección IP) es la interfaz local."""
+    if host.lower() == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _host_name(value: Optional[str]) -> Optional[str]:
+    """El nombre de host de una cabecera Host ('h', 'h:puerto', '[::1]:puerto') o Origin ('http://h:puerto')."""
+    if not value:
+        return None
+    try:
+        return urlsplit(value if "//" in value else "//" + value).hostname
+    except ValueError:  # Puerto o corchetes no válidos
+        return None
+
+
+class _JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    API HTTP de JobServer:
+        POST /jobs                  Crea un trabajo (cuerpo JSON) y devuelve su estado (201).
+        GET /jobs                   Lista los trabajos.
+        GET /jobs/<id>              Devuelve el estado de un trabajo.
+        GET /jobs/<id>/events       Transmite sus eventos en NDJSON hasta que termina (?from=N
+                                    empieza en el evento N).
+        DELETE /jobs/<id>           Cancela un trabajo.
+
+    Antes de cada petición, _authorize() rechaza las que no llevan el token del servidor (401) y
+    las que llegan con una cabecera Host u Origin ajena (403), como las de una página web que
+    apunta a localhost o que usa un nombre de DNS que resuelve a 127.0.0.1. POST exige además
+    Content-Type: application/json (415), que un formulario HTML no puede enviar.
+    """
+    server_version = "cambiacosas"
+
+    def do_GET(self):
+        if not self._authorize():
+            return
+        parts = self._path_parts()
+        if parts == ["jobs"]:
+            self._send_json(200, {"jobs": [job.to_dict() for job in self.server.job_server.jobs()]})
+            return
+        job = self._job(parts)
+        if job is None:
+            return
+        if len(parts) == 2:
+            self._send_json(200, job.to_dict())
+        elif parts[2:] == ["events"]:
+            self._stream_events(job)
+        else:
+            self._send_json(404, {"error": f"Ruta desconocida: {self.path}"})
+
+    def do_POST(self):
+        if not self._authorize():
+            return
+        if self._path_parts() != ["jobs"]:
+            self._send_json(404, {"error": f"Ruta desconocida: {self.path}"})
+            return
+        if self.headers.get_content_type() != "application/json":
+            self._send_json(415, {"error": "El cuerpo debe enviarse con Content-Type: application/json."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_REQUEST_BYTES:
+                raise ValueError("El cuerpo de la petición es demasiado grande.")
+            request = json.loads(self.rfile.read(length) or b"null")
+            if not isinstance(request, dict):
+                raise ValueError("El cuerpo debe ser un objeto JSON.")
+            job = self.server.job_server.submit(request)
+        except JobConflictError as e:
+            self._send_json(409, {"error": str(e)})
+        except ValueError as e:  # Incluye json.JSONDecodeError
+            self._send_json(400, {"error": str(e)})
+        else:
+            self._send_json(201, job.to_dict())
+
+    def do_DELETE(self):
+        if not self._authorize():
+            return
+        parts = self._path_parts()
+        job = self._job(parts)
+        if job is None:
+            return
+        if len(parts) != 2:
+            self._send_json(404, {"error": f"Ruta desconocida: {self.path}"})
+            return
+        self._send_json(202, self.server.job_server.cancel(job.id).to_dict())
+
+    def _authorize(self) -> bool:
+        """Comprueba el token y las cabeceras Host y Origin; si no son válidos, responde y devuelve False."""
+        token = self.server.token
+        if token is not None:
+            scheme, _, credentials = self.headers.get("Authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not hmac.compare_digest(credentials.strip().encode("utf-8"),
+                                                                     token.encode("utf-8")):
+                self._send_json(401, {"error": "Falta el token del servidor o no es válido."},
+                                {"WWW-Authenticate": "Bearer"})
+                return False
+        allowed = self.server.allowed_hosts
+        host = _host_name(self.headers.get("Host"))
+        if allowed is not None and host not in allowed:
+            self._send_json(403, {"error": f"Host no admitido: {self.headers.get('Host')}"})
+            return False
+        origin = self.headers.get("Origin")
+        if origin is not None and _host_name(origin) not in (allowed or LOOPBACK_NAMES):
+            self._send_json(403, {"error": f"Origen no admitido: {origin}"})
+            return False
+        return True
+
+    def _path_parts(self) -> List[str]:
+        return [part for part in urlparse(self.path).path.split("/") if part]
+
+    def _job(self, parts: List[str]) -> Optional[Job]:
+        """El trabajo de /jobs/<id>[/...], o None (tras responder 404) si no existe."""
+        job = self.server.job_server.get(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+        if job is None:
+            self._send_json(404, {"error": f"No existe el trabajo: {self.path}"})
+        return job
+
+    def _stream_events(self, job: Job):
+        try:
+            start = int(parse_qs(urlparse(self.path).query).get("from", ["0"])[0])
+        except ValueError:
+            self._send_json(400, {"error": "from debe ser un entero."})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")  # Sin Content-Length: el final del trabajo cierra la conexión
+        self.end_headers()
+        try:
+            for event in job.events(start):
+                self.wfile.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # El cliente dejó de leer; el trabajo continúa
+        self.close_connection = True
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # En un socket Unix la dirección del cliente es una cadena vacía
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_http_server(job_server: JobServer, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                       socket_path: Optional[str] = None, token: Optional[str] = None) -> socketserver.BaseServer:
+    """
+    Crea el servidor HTTP de la API de job_server, en host:port o, si se indica socket_path, en un
+    socket Unix (accesible solo para el usuario actual). Quien lo llama ejecuta serve_forever() y,
+    al terminar, server_close().
+
+    Con token, todas las peticiones deben llevar "Authorization: Bearer <token>". Sin él, solo se
+    admite una dirección local (127.0.0.1, ::1 o localhost) o un socket Unix. La cabecera Host
+    debe nombrar la interfaz local o host; si host es una dirección comodín (0.0.0.0 o ::),
+    cualquier Host vale y la protección es el token.
+
+    Raises:
+        ValueError: Si host no es local y no hay token.
+        OSError: Si no se puede abrir la dirección o el socket.
+    """
+    if socket_path is None and token is None and not is_loopback_host(host):
+        raise ValueError(f"Para escuchar en {host} (una dirección no local) hace falta un token.")
+    if token is not None and not token.strip():
+        raise ValueError("El token está vacío.")
+    allowed_hosts: Optional[frozenset] = LOOPBACK_NAMES
+    if socket_path is None:
+        try:
+            wildcard = not host or ipaddress.ip_address(host).is_unspecified
+        except ValueError:
+            wildcard = False
+        allowed_hosts = None if wildcard else LOOPBACK_NAMES | {host.lower()}
+    if socket_path is not None:
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)  # Socket de un servidor anterior que no se cerró
+        # El socket se crea ya con permisos 0600: con chmod después de bind, otro usuario podría
+        # conectarse entre ambos pasos
+        previous_umask = os.umask(0o177)
+        try:
+            httpd = _ThreadingUnixHTTPServer(socket_path, _JobRequestHandler)
+        finally:
+            os.umask(previous_umask)
+    else:
+        httpd = ThreadingHTTPServer((host, port), _JobRequestHandler)
+        httpd.daemon_threads = True
+    httpd.job_server = job_server
+    httpd.token = token.strip() if token is not None else None
+    httpd.allowed_hosts = allowed_hosts
+    return httpd
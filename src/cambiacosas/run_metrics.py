@@ -0,0 +1,232 @@
+import collections
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Fases instrumentadas de una ejecución
+PHASES = ("scan", "request", "ttfb", "parse", "write", "file")
+
+# Eventos de petición que se conservan para el informe; los más antiguos se descartan
+DEFAULT_MAX_EVENTS = 100_000
+# Archivos con estadísticas propias en el informe; se descartan los que llevan más tiempo sin peticiones
+DEFAULT_MAX_FILES = 100_000
+
+# Campos de usageMetadata que se acumulan, y su nombre en el informe
+USAGE_FIELDS = {
+    "promptTokenCount": "prompt",
+    "candidatesTokenCount": "candidates",
+    "cachedContentTokenCount": "cached",
+    "thoughtsTokenCount": "thoughts",
+    "totalTokenCount": "total",
+}
+
+
+class _PhaseStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "total_s": round(self.total, 6), "max_s": round(self.max, 6)}
+
+
+class RunMetrics:
+    """
+    Métricas de una ejecución: tiempo por fase y tokens por petición, archivo y fragmento.
+
+    Las fases (PHASES) son el escaneo de la carpeta, las peticiones a Gemini (tiempo total y
+    tiempo hasta el primer byte), el análisis de las respuestas, la escritura de las salidas y el
+    procesamiento completo de cada archivo. Cada petición a Gemini se registra además como un
+    evento con sus tiempos y su usageMetadata. Es segura para usarse desde varios hilos.
+
+    El informe se puede escribir como JSON (write_json), como NDJSON con un evento por línea
+    (write_ndjson) o como archivo de texto de Prometheus (write_prometheus).
+
+    La memoria está acotada aunque la instancia dure tanto como un servidor (serve): se conservan
+    los últimos max_events eventos y las estadísticas de max_files archivos. Los totales por fase,
+    por estado y de tokens incluyen siempre todo lo registrado.
+    """
+    def __init__(self, max_events: int = DEFAULT_MAX_EVENTS, max_files: int = DEFAULT_MAX_FILES):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._phases = {phase: _PhaseStats() for phase in PHASES}
+        self._tokens = {name: 0 for name in USAGE_FIELDS.values()}
+        self.max_files = max_files
+        self._files: "collections.OrderedDict[str, Dict[str, Any]]" = collections.OrderedDict()
+        self._events: "collections.deque[Dict[str, Any]]" = collections.deque(maxlen=max_events)
+        self._dropped = {"events": 0, "files": 0}
+        self._requests = {"ok": 0, "cached": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def record_phase(self, phase: str, seconds: float):
+        """Suma una duración (en segundos) a una fase."""
+        with self._lock:
+            self._phases.setdefault(phase, _PhaseStats()).add(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, phase: str):
+        """Gestor de contexto que suma a la fase el tiempo de su bloque (aunque lance una excepción)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(phase, time.perf_counter() - start)
+
+    def timed_iter(self, iterable: Iterable, phase: str) -> Iterator:
+        """
+        Recorre un iterable sumando a la fase solo el tiempo que tarda en producir cada elemento
+        (p. ej., el escaneo perezoso de scan_folder, que se intercala con el procesamiento).
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.record_phase(phase, elapsed)
+
+    def record_request(self, source: Optional[Dict[str, Any]], status: str, total_s: Optional[float] = None,
+                       ttfb_s: Optional[float] = None, usage: Optional[Dict[str, Any]] = None):
+        """
+        Registra una petición a Gemini.
+
+        Args:
+            source: Qué se envió: {"file": ruta, "chunk": n} (chunk solo en los fragmentos) o
+                    {"files": [rutas]} en un paquete. None si no se conoce.
+            status: "ok", "cached" (respuesta de la caché o de una petición idéntica de la misma
+                    ejecución) o "failed".
+            total_s: Duración total de la petición (incluidas las esperas y los reintentos).
+            ttfb_s: Tiempo hasta el primer byte de la respuesta correcta.
+            usage: El usageMetadata de la respuesta.
+        """
+        event = {"type": "request", "time": round(time.time(), 3), "status": status}
+        event.update(source or {})
+        if total_s is not None:
+            event["total_s"] = round(total_s, 6)
+        if ttfb_s is not None:
+            event["ttfb_s"] = round(ttfb_s, 6)
+        tokens = {name: int(usage[field]) for field, name in USAGE_FIELDS.items()
+                  if usage and isinstance(usage.get(field), (int, float))}
+        if tokens:
+            event["tokens"] = tokens
+
+        paths = (source or {}).get("files") or ([source["file"]] if source and "file" in source else [])
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self._dropped["events"] += 1
+            self._events.append(event)
+            self._requests[status] += 1
+            if total_s is not None:
+                self._phases["request"].add(total_s)
+            if ttfb_s is not None:
+                self._phases["ttfb"].add(ttfb_s)
+            for name, count in tokens.items():
+                self._tokens[name] += count
+            for path in paths:
+                file_stats = self._files.setdefault(path, {"requests": 0, "tokens": {}})
+                self._files.move_to_end(path)
+                file_stats["requests"] += 1
+                # En un paquete los tokens no se pueden repartir por archivo: se asignan al primero
+                if path == paths[0]:
+                    for name, count in tokens.items():
+                        file_stats["tokens"][name] = file_stats["tokens"].get(name, 0) + count
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+                self._dropped["files"] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Devuelve el resumen de la ejecución (fases, peticiones, tokens y tokens por archivo, con
+        los eventos y archivos descartados por los límites en 'dropped').
+        """
+        with self._lock:
+            return {
+                "type": "summary",
+                "started_at": round(self.started_at, 3),
+                "duration_s": round(time.perf_counter() - self._start, 6),
+                "phases": {phase: stats.to_dict() for phase, stats in self._phases.items()},
+                "requests": dict(self._requests),
+                "tokens": dict(self._tokens),
+                "files": {path: {"requests": stats["requests"], "tokens": dict(stats["tokens"])}
+                          for path, stats in sorted(self._files.items())},
+                "dropped": dict(self._dropped),
+            }
+
+    def events(self) -> List[Dict[str, Any]]:
+        """Devuelve una copia de los eventos conservados (los últimos max_events), en orden."""
+        with self._lock:
+            return list(self._events)
+
+    def write_json(self, path: str):
+        """Escribe el resumen y los eventos como un único documento JSON."""
+        report = self.summary()
+        report["events"] = self.events()
+        _write_atomic(path, json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+
+    def write_ndjson(self, path: str):
+        """Escribe un evento por línea y el resumen en la última línea (NDJSON)."""
+        lines = [json.dumps(event, ensure_ascii=False) for event in self.events()]
+        lines.append(json.dumps(self.summary(), ensure_ascii=False))
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+    def write_prometheus(self, path: str):
+        """
+        Escribe el resumen en el formato de texto de Prometheus, para el recolector textfile de
+        node_exporter. El archivo se sustituye de forma atómica, así que nunca se lee a medias.
+        """
+        summary = self.summary()
+        lines = [
+            "# HELP cambiacosas_phase_seconds_total Tiempo acumulado por fase.",
+            "# TYPE cambiacosas_phase_seconds_total counter",
+        ]
+        lines += [f'cambiacosas_phase_seconds_total{{phase="{phase}"}} {stats["total_s"]}'
+                  for phase, stats in summary["phases"].items()]
+        lines += ["# HELP cambiacosas_phase_count_total Número de mediciones por fase.",
+                  "# TYPE cambiacosas_phase_count_total counter"]
+        lines += [f'cambiacosas_phase_count_total{{phase="{phase}"}} {stats["count"]}'
+                  for phase, stats in summary["phases"].items()]
+        lines += ["# HELP cambiacosas_requests_total Peticiones a Gemini por resultado.",
+                  "# TYPE cambiacosas_requests_total counter"]
+        lines += [f'cambiacosas_requests_total{{status="{status}"}} {count}'
+                  for status, count in summary["requests"].items()]
+        lines += ["# HELP cambiacosas_tokens_total Tokens informados por Gemini (usageMetadata).",
+                  "# TYPE cambiacosas_tokens_total counter"]
+        lines += [f'cambiacosas_tokens_total{{kind="{kind}"}} {count}' for kind, count in summary["tokens"].items()]
+        lines += ["# HELP cambiacosas_run_duration_seconds Duración de la ejecución.",
+                  "# TYPE cambiacosas_run_duration_seconds gauge",
+                  f"cambiacosas_run_duration_seconds {summary['duration_s']}",
+                  "# HELP cambiacosas_run_start_timestamp_seconds Inicio de la ejecución (tiempo Unix).",
+                  "# TYPE cambiacosas_run_start_timestamp_seconds gauge",
+                  f"cambiacosas_run_start_timestamp_seconds {summary['started_at']}"]
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _write_atomic(path: str, text: str):
+    """Escribe un archivo de texto en un temporal del mismo directorio y lo sustituye con os.replace."""
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=directory)
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8") as temp_file:
+            temp_file.write(text)
+        os.chmod(temp_path, 0o644)  # mkstemp crea el archivo con 0600; el informe lo leen otros procesos
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+import requests
+
+from benchmarks.mock_gemini_server import MockGeminiConfig, MockGeminiServer
+from benchmarks.run_benchmark import _percentile, compare_with_baseline
+from src.cambiacosas.googleapi.api_client import call_gemini_api, gemini_response_text, stream_gemini_api
+from src.cambiacosas.googleapi.gemini_options import GeminisOptions
+
+
+@pytest.fixture
+def gemini_config(monkeypatch):
+    def make(server):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        monkeypatch.setenv("GEMINI_API_BASE_URL", server.base_url)
+        config = GeminisOptions()
+        config.set_system_instruction("Eres una herramienta...")
+        config.set_input_text("hola mundo\n")
+        return config
+    return make
+
+
+def test_mock_server_answers_json_and_sse(gemini_config):
+    with MockGeminiServer(MockGeminiConfig(latency_ms=0, stream_chunk_chars=4)) as server:
+        config = gemini_config(server)
+        assert config.url.startswith(server.base_url)
+        response = call_gemini_api(config)
+        assert len(response) > 1  # Un elemento por fragmento de 4 caracteres
+        assert json.loads(gemini_response_text(response)) == {"response": "hola mundo\n"}
+        assert json.loads(stream_gemini_api(config)) == {"response": "hola mundo\n"}
+        assert server.requests == 2
+
+
+def test_mock_server_injects_429(gemini_config):
+    with MockGeminiServer(MockGeminiConfig(latency_ms=0, error_rate=0.999)) as server:
+        with pytest.raises(requests.exceptions.RequestException, match="429"):
+            call_gemini_api(gemini_config(server))
+        assert server.injected_errors == 1
+
+
+def test_percentile_and_baseline_comparison():
+    assert _percentile([1, 2, 3, 4], 50) == 2
+    assert _percentile([1, 2, 3, 4], 99) == 4
+    assert _percentile([], 50) is None
+    baseline = {"results": [{"name": "a", "files_per_s": 100.0}, {"name": "b", "files_per_s": 100.0}]}
+    report = {"results": [{"name": "a", "files_per_s": 85.0}, {"name": "b", "files_per_s": 70.0}]}
+    assert compare_with_baseline(report, baseline, 0.2) == ["b: 70.0 archivos/s (antes 100.0)"]
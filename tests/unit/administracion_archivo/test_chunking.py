@@ -0,0 +1,88 @@
+import pytest
+from src.cambiacosas.administracion_archivo.chunking import (estimate_tokens, split_into_chunks, split_into_line_ranges,
+                                                              token_budget_for_model)
+from src.cambiacosas.administracion_archivo.file_info import LineIndexedFile
+
+
+def _python_source(function_count, body_lines):
+    functions = []
+    for i in range(function_count):
+        body = "".join(f"    value_{j} = {j}  # comentario\n" for j in range(body_lines))
+        functions.append(f"@decorador\ndef function_{i}():\n{body}    return None\n")
+    return "import os\n\n\n" + "\n\n".join(functions)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_token_budget_for_model():
+    assert token_budget_for_model("gemini-2.5-pro") > token_budget_for_model("gemini-2.0-flash")
+    assert token_budget_for_model("modelo-desconocido") == token_budget_for_model("gemini-2.0-flash")
+
+
+def test_small_content_is_one_chunk():
+    assert split_into_chunks("a\nb\n", 100) == ["a\nb\n"]
+    assert split_into_chunks("", 100) == []
+
+
+def test_chunks_reassemble_and_respect_budget():
+    content = "".join(f"line {i}\n" for i in range(1000))
+    chunks = split_into_chunks(content, 200)
+    assert "".join(chunks) == content
+    assert all(estimate_tokens(chunk) <= 200 + 3 for chunk in chunks)  # Redondeo por línea
+
+
+def test_python_chunks_start_at_definitions():
+    content = _python_source(function_count=12, body_lines=10)
+    chunks = split_into_chunks(content, 300, "module.py")
+    assert "".join(chunks) == content
+    assert len(chunks) > 1
+    for chunk in chunks[1:]:
+        assert chunk.startswith("@decorador\ndef function_")
+
+
+def test_heuristic_chunks_start_after_blank_lines():
+    blocks = ["function block_%d() {\n%s}\n" % (i, "  statement();\n" * 10) for i in range(12)]
+    content = "\n".join(blocks)
+    chunks = split_into_chunks(content, 200, "script.js")
+    assert "".join(chunks) == content
+    for chunk in chunks[1:]:
+        assert chunk.startswith("function block_")
+
+
+def test_oversized_line_is_its_own_chunk():
+    content = "short\n" + "x" * 1000 + "\nshort\n"
+    chunks = split_into_chunks(content, 50)
+    assert chunks == ["short\n", "x" * 1000 + "\n", "short\n"]
+
+
+def test_line_ranges_match_chunks(tmp_path):
+    blocks = ["function block_%d() {\n%s}\n" % (i, "  statement();\n" * 10) for i in range(12)]
+    content = "\n".join(blocks)
+    file_path = tmp_path / "script.js"
+    file_path.write_text(content)
+    with LineIndexedFile(str(file_path)) as lines:
+        ranges = split_into_line_ranges(lines, 200)
+        assert [lines.lines(start, end) for start, end in ranges] == split_into_chunks(content, 200, "script.js")
+
+
+def test_only_newlines_separate_lines(tmp_path):
+    content = "".join(f"linea {i}\x0cpagina\x0bsigue\x1cfin\n" for i in range(40)) + "sin salto"
+    chunks = split_into_chunks(content, 50)
+    assert "".join(chunks) == content and len(chunks) > 1
+    assert all(chunk.startswith("linea") and chunk.endswith("\n") for chunk in chunks[:-1])
+    assert split_into_chunks("a\u2028b\x85c\r\n", 50) == ["a\u2028b\x85c\r\n"]
+
+    # Los fragmentos coinciden con los rangos de líneas de LineIndexedFile
+    file_path = tmp_path / "raro.txt"
+    file_path.write_bytes(content.encode("utf-8"))
+    with LineIndexedFile(str(file_path)) as lines:
+        assert [lines.lines(start, end) for start, end in split_into_line_ranges(lines, 50)] == chunks
+
+
+def test_invalid_budget():
+    with pytest.raises(ValueError):
+        split_into_chunks("a\n", 0)
@@ -26,6 +26,12 @@ class TestModifyFileLines(unittest.TestCase):
             lines = f.readlines()
         self.assertEqual(lines, ["Line 1\n", "New Line 2\n", "New Line 3\n", "New Line 4\n", "Line 5\n"])
 
+    def test_modify_lines_only_splits_string_content_on_newlines(self):
+        edit_file.modify_file_lines(self.test_file_path, (2, 2), "Página\x0csiguiente\u2028fin\n")
+        with open(self.test_file_path, 'r', encoding='utf-8', newline='') as f:
+            content = f.read()
+        self.assertEqual(content, "Line 1\nPágina\x0csiguiente\u2028fin\nLine 3\nLine 4\nLine 5\n")
+
     def test_modify_lines_at_beginning(self):
         edit_file.modify_file_lines(self.test_file_path, (1, 2), "New Line 1\nNew Line 2")
         with open(self.test_file_path, 'r') as f:
@@ -76,5 +82,92 @@ class TestModifyFileLines(unittest.TestCase):
         with self.assertRaises(ValueError):
             edit_file.modify_file_lines(self.test_file_path, slice(1, 5, 2), "New lines") # Slice step is not None
 
+class TestSpliceFileLines(unittest.TestCase):
+
+    mmap_min_bytes = edit_file.MMAP_MIN_BYTES
+    line_index_block_bytes = edit_file.LINE_INDEX_BLOCK_BYTES
+
+    def setUp(self):
+        self.test_file_path = "test_splice_file.txt"
+        with open(self.test_file_path, 'wb') as f:
+            f.write(b"Line 1\r\nLine 2\r\nLine 3\r\nLine 4\r\nLine 5")
+
+    def tearDown(self):
+        edit_file.MMAP_MIN_BYTES = self.mmap_min_bytes
+        edit_file.LINE_INDEX_BLOCK_BYTES = self.line_index_block_bytes
+        if os.path.exists(self.test_file_path):
+            os.remove(self.test_file_path)
+
+    def _splice_and_read(self):
+        edit_file.splice_file_lines(self.test_file_path, [((4, 5), "New Line 4"), ((1, 2), ["New Line 1"])])
+        with open(self.test_file_path, 'rb') as f:
+            return f.read()
+
+    def test_several_ranges_in_one_pass(self):
+        self.assertEqual(self._splice_and_read(), b"New Line 1\nLine 3\r\nNew Line 4\n")
+
+    def test_several_ranges_with_mmap(self):
+        edit_file.MMAP_MIN_BYTES = 1
+        edit_file.LINE_INDEX_BLOCK_BYTES = 5  # Las líneas cruzan los límites de bloque
+        self.assertEqual(self._splice_and_read(), b"New Line 1\nLine 3\r\nNew Line 4\n")
+
+    def test_no_temporary_files_left_and_mode_kept(self):
+        os.chmod(self.test_file_path, 0o640)
+        self._splice_and_read()
+        self.assertEqual(os.stat(self.test_file_path).st_mode & 0o777, 0o640)
+        self.assertFalse([name for name in os.listdir(".") if name.startswith(".test_splice_file.txt.")])
+
+    def test_overlapping_ranges(self):
+        with self.assertRaises(ValueError):
+            edit_file.splice_file_lines(self.test_file_path, [((1, 3), "a"), ((3, 4), "b")])
+        with self.assertRaises(ValueError):
+            edit_file.splice_file_lines(self.test_file_path, [(None, "a"), ((3, 4), "b")])
+
+    def test_range_past_end_of_file(self):
+        with self.assertRaises(ValueError):
+            edit_file.splice_file_lines(self.test_file_path, [((5, 6), "a")])
+
+class TestApplyLineEdits(unittest.TestCase):
+
+    def setUp(self):
+        self.test_file_path = "test_edits_file.txt"
+        with open(self.test_file_path, 'w') as f:
+            f.write("Line 1\nLine 2\nLine 3\nLine 4\nLine 5\n")
+
+    def tearDown(self):
+        if os.path.exists(self.test_file_path):
+            os.remove(self.test_file_path)
+
+    def test_apply_edits_bottom_up(self):
+        edits = [
+            {"start_line": 4, "end_line": 5, "replacement": ""},
+            {"start_line": 1, "end_line": 1, "replacement": "New Line 1\nInserted"},
+            {"start_line": 3, "end_line": 3, "replacement": "New Line 3"},
+        ]
+        self.assertEqual(edit_file.apply_line_edits(self.test_file_path, edits), 3)
+        with open(self.test_file_path, 'r') as f:
+            lines = f.readlines()
+        self.assertEqual(lines, ["New Line 1\n", "Inserted\n", "Line 2\n", "New Line 3\n"])
+
+    def test_overlapping_edits(self):
+        edits = [
+            {"start_line": 1, "end_line": 3, "replacement": "a"},
+            {"start_line": 3, "end_line": 4, "replacement": "b"},
+        ]
+        with self.assertRaises(ValueError):
+            edit_file.apply_line_edits(self.test_file_path, edits)
+        with open(self.test_file_path, 'r') as f:
+            self.assertEqual(f.read(), "Line 1\nLine 2\nLine 3\nLine 4\nLine 5\n")  # Sin cambios parciales
+
+    def test_invalid_edits(self):
+        with self.assertRaises(ValueError):
+            edit_file.validate_line_edits([{"start_line": 4, "end_line": 6, "replacement": ""}], 5)  # Fuera de rango
+        with self.assertRaises(ValueError):
+            edit_file.validate_line_edits([{"start_line": 2, "end_line": 3, "replacement": ""}], 10, first_line=3)
+        with self.assertRaises(ValueError):
+            edit_file.validate_line_edits([{"start_line": "1", "end_line": 1, "replacement": ""}], 5)
+        with self.assertRaises(ValueError):
+            edit_file.validate_line_edits([{"start_line": 1, "end_line": 1}], 5)  # Falta replacement
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
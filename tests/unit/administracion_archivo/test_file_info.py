@@ -92,4 +92,23 @@ def test_get_file_info_permission_denied(temp_dir):
 
 def test_get_file_info_invalid_path_directory(temp_dir):
     with pytest.raises(Exception): # Or FileNotFoundError, depending on desired behavior
-        get_file_info(temp_dir)
\ No newline at end of file
+        get_file_info(temp_dir)
+
+
+def test_get_file_info_lazy_matches_content(temp_dir):
+    file_path = temp_dir / "large.txt"
+    file_path.write_bytes("uno\r\ndós\rtres\n\ncuatro".encode("utf-8"))
+    eager = get_file_info(file_path)
+    lazy = get_file_info(file_path, lazy=True)
+    with lazy["lines"] as lines:
+        assert "content" not in lazy
+        assert lines.line_count == lazy["line_count"] == 4
+        assert lines.lines(0, lines.line_count) == eager["content"]
+        assert lines.lines(2, 3) == "\n"
+        assert lines[1] == b"d\xc3\xb3s\rtres\n"
+        assert lines.byte_range(lines.line_offset(3), lines.size) == b"cuatro"
+
+def test_get_file_info_lazy_empty(temp_file_empty):
+    with get_file_info(temp_file_empty, lazy=True)["lines"] as lines:
+        assert lines.line_count == 0
+        assert lines.lines(0, 10) == ""
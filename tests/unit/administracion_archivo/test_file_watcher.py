@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+from src.cambiacosas.administracion_archivo.file_watcher import FileWatcher
+from src.cambiacosas.administracion_archivo.scan_filter import ScanFilter
+
+BACKENDS = ["polling"] + (["inotify"] if sys.platform.startswith("linux") else [])
+
+
+@pytest.fixture
+def tree(tmp_path):
+    folder = tmp_path / "tree"
+    (folder / "sub").mkdir(parents=True)
+    (folder / "a.txt").write_text("a\n")
+    (folder / "sub" / "b.txt").write_text("b\n")
+    return folder
+
+
+def _watcher(folder, backend, **options):
+    watcher = FileWatcher(str(folder), debounce=0.2, poll_interval=0.05, use_inotify=backend == "inotify", **options)
+    assert watcher.backend == backend
+    return watcher
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_reports_changed_and_new_files_with_the_scan_filters(tree, backend):
+    with _watcher(tree, backend, scan_filter=ScanFilter(exclude=["*.log"])) as watcher:
+        (tree / "a.txt").write_text("a cambiado\n")
+        (tree / "new" / "deep").mkdir(parents=True)
+        (tree / "new" / "deep" / "c.txt").write_text("c\n")
+        (tree / "node_modules").mkdir()
+        (tree / "node_modules" / "d.txt").write_text("d\n")
+        (tree / "debug.log").write_text("log\n")
+        (tree / "image.bin").write_bytes(b"\0\1")
+        assert watcher.wait(timeout=5) == [str(tree / "a.txt"), str(tree / "new" / "deep" / "c.txt")]
+
+        # Sustituir un archivo con os.replace, como edit_file, también es un cambio
+        (tree / "b.tmp").write_text("b nuevo\n")
+        watcher.wait(timeout=0.5)
+        os.replace(tree / "b.tmp", tree / "sub" / "b.txt")
+        assert str(tree / "sub" / "b.txt") in watcher.wait(timeout=5)
+        assert watcher.wait(timeout=0.3) == []
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_bursts_are_grouped(tree, backend):
+    def save_slowly():
+        for i in range(5):
+            (tree / f"file_{i}.txt").write_text(f"{i}\n")
+            time.sleep(0.05)
+
+    with _watcher(tree, backend) as watcher:
+        thread = threading.Thread(target=save_slowly)
+        thread.start()
+        changed = watcher.wait(timeout=5)
+        thread.join()
+    assert changed == [str(tree / f"file_{i}.txt") for i in range(5)]
+
+
+def test_invalid_folder(tmp_path):
+    with pytest.raises(ValueError):
+        FileWatcher(str(tmp_path / "missing"))
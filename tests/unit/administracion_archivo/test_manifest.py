@@ -0,0 +1,91 @@
+import pytest
+from src.cambiacosas.administracion_archivo.file_info import get_file_info
+from src.cambiacosas.administracion_archivo.manifest import RunManifest, default_manifest_path
+
+
+@pytest.fixture
+def target_file(tmp_path):
+    p = tmp_path / "target.txt"
+    p.write_text("contenido\n")
+    return p
+
+
+def test_default_manifest_path_is_outside_folder(tmp_path):
+    folder = tmp_path / "carpeta"
+    assert default_manifest_path(str(folder)) == str(tmp_path / ".carpeta.cambiacosas-manifest.jsonl")
+
+
+def test_resume_skips_done_file(tmp_path, target_file):
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    manifest = RunManifest(manifest_path, "prompt")
+    target_file.write_text("CONTENIDO\n")
+    manifest.record_file(str(target_file), "done")
+    manifest.close()
+
+    resumed = RunManifest(manifest_path, "prompt", resume=True)
+    assert resumed.is_file_done(get_file_info(str(target_file)))
+    target_file.write_text("cambiado por el usuario\n")
+    assert not resumed.is_file_done(get_file_info(str(target_file)))
+    resumed.close()
+
+
+def test_failed_file_is_not_done(tmp_path, target_file):
+    manifest = RunManifest(str(tmp_path / "manifest.jsonl"), "prompt")
+    manifest.record_file(str(target_file), "failed")
+    assert not manifest.is_file_done(get_file_info(str(target_file)))
+    manifest.close()
+
+
+def test_resume_reuses_chunk_outputs(tmp_path):
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    manifest = RunManifest(manifest_path, "prompt")
+    manifest.record_chunk("/a.txt", 1, "original", "MODIFICADO")
+    manifest.close()
+
+    resumed = RunManifest(manifest_path, "prompt", resume=True)
+    assert resumed.chunk_output("/a.txt", 1, "original") == "MODIFICADO"
+    assert resumed.chunk_output("/a.txt", 1, "otro contenido") is None
+    assert resumed.chunk_output("/a.txt", 2, "original") is None
+    resumed.close()
+
+
+def test_without_resume_starts_fresh(tmp_path):
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    manifest = RunManifest(manifest_path, "prompt")
+    manifest.record_chunk("/a.txt", 1, "original", "MODIFICADO")
+    manifest.close()
+
+    for fresh in (RunManifest(manifest_path, "prompt"), RunManifest(manifest_path, "otro prompt", resume=True)):
+        assert fresh.chunk_output("/a.txt", 1, "original") is None
+        fresh.close()
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    manifest_path = tmp_path / "manifest.jsonl"
+    manifest = RunManifest(str(manifest_path), "prompt")
+    manifest.record_chunk("/a.txt", 1, "original", "MODIFICADO")
+    manifest.close()
+    with open(manifest_path, "a", encoding="utf-8") as f:
+        f.write('{"type": "chunk", "path": "/a.txt"')
+
+    resumed = RunManifest(str(manifest_path), "prompt", resume=True)
+    assert resumed.chunk_output("/a.txt", 1, "original") == "MODIFICADO"
+    resumed.close()
+
+
+def test_chunk_outputs_are_dropped_when_the_file_is_done(tmp_path, target_file):
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    manifest = RunManifest(manifest_path, "prompt")
+    manifest.record_chunk(str(target_file), 1, "original", "MODIFICADO")
+    manifest.record_chunk("/otro.txt", 1, "original", "OTRO")
+    assert "MODIFICADO" not in open(manifest_path, encoding="utf-8").read()
+    manifest.record_file(str(target_file), "done")
+    assert manifest.chunk_output(str(target_file), 1, "original") is None
+    manifest.close()
+
+    resumed = RunManifest(manifest_path, "prompt", resume=True)
+    assert resumed.chunk_output(str(target_file), 1, "original") is None
+    assert resumed.chunk_output("/otro.txt", 1, "original") == "OTRO"
+    resumed.forget_chunks("/otro.txt")
+    resumed.close()
+    assert not (tmp_path / "manifest.jsonl.chunks").exists()
@@ -0,0 +1,63 @@
+import pathlib
+import pytest
+from src.cambiacosas.__main__ import scan_folder
+from src.cambiacosas.administracion_archivo.scan_filter import IgnoreRules, ScanFilter, is_binary_file
+
+
+def _walk(root, scan_filter):
+    """Devuelve las rutas relativas que scan_folder incluye con scan_filter."""
+    return sorted(pathlib.Path(record["full_path"]).relative_to(root).as_posix()
+                  for record in scan_folder(str(root), scan_filter))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "config").write_text("[core]\n")
+    (tmp_path / "node_modules" / "lib").mkdir(parents=True)
+    (tmp_path / "node_modules" / "lib" / "index.js").write_text("x\n")
+    (tmp_path / "env").mkdir()
+    (tmp_path / "env" / "pyvenv.cfg").write_text("home = /usr\n")
+    (tmp_path / "src" / "build").mkdir(parents=True)
+    (tmp_path / "src" / "main.py").write_text("print('hola')\n")
+    (tmp_path / "src" / "notes.log").write_text("log\n")
+    (tmp_path / "src" / "keep.log").write_text("log\n")
+    (tmp_path / "src" / "build" / "out.py").write_text("x\n")
+    (tmp_path / "src" / ".gitignore").write_text("build/\n")
+    (tmp_path / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n\0\0\0")
+    (tmp_path / "big.txt").write_text("a" * 5000)
+    (tmp_path / ".gitignore").write_text("# registros\n*.log\n!keep.log\n/big.txt\n")
+    return tmp_path
+
+
+def test_default_filter(tree):
+    assert _walk(tree, ScanFilter()) == [".gitignore", "src/.gitignore", "src/keep.log", "src/main.py"]
+
+
+def test_no_gitignore_keeps_everything_but_binaries(tree):
+    included = _walk(tree, ScanFilter(use_gitignore=False))
+    assert "node_modules/lib/index.js" in included
+    assert "src/build/out.py" in included
+    assert "big.txt" in included
+    assert "image.png" not in included
+
+
+def test_include_exclude_and_max_size(tree):
+    assert _walk(tree, ScanFilter(include=["*.py"])) == ["src/main.py"]
+    assert _walk(tree, ScanFilter(exclude=["src"])) == [".gitignore"]
+    assert "big.txt" not in _walk(tree, ScanFilter(use_gitignore=False, max_size=1000))
+
+
+def test_anchored_and_double_star_patterns(tmp_path):
+    (tmp_path / ".gitignore").write_text("/root_only.txt\ndocs/**/*.md\n")
+    rules = IgnoreRules().child(str(tmp_path))
+    assert rules.is_ignored(str(tmp_path / "root_only.txt"), is_dir=False)
+    assert not rules.is_ignored(str(tmp_path / "sub" / "root_only.txt"), is_dir=False)
+    assert rules.is_ignored(str(tmp_path / "docs" / "a" / "b" / "x.md"), is_dir=False)
+    assert rules.is_ignored(str(tmp_path / "docs" / "x.md"), is_dir=False)
+    assert not rules.is_ignored(str(tmp_path / "docs" / "x.txt"), is_dir=False)
+
+
+def test_is_binary_file(tree):
+    assert is_binary_file(str(tree / "image.png"))
+    assert not is_binary_file(str(tree / "src" / "main.py"))
@@ -0,0 +1,80 @@
+import os
+import pytest
+from src.cambiacosas.administracion_archivo.staging import StagingArea, default_staging_dir
+
+
+@pytest.fixture
+def tree(tmp_path):
+    folder = tmp_path / "tree"
+    folder.mkdir()
+    (folder / "a.txt").write_text("a original\n")
+    (folder / "b.txt").write_text("b original\n")
+    return folder
+
+
+def test_default_staging_dir_is_outside_folder(tmp_path):
+    staging_dir = default_staging_dir(str(tmp_path / "tree"))
+    assert os.path.dirname(staging_dir) == str(tmp_path)
+
+
+def test_commit_applies_staged_operations_and_rollback_restores(tmp_path, tree):
+    staging = StagingArea(str(tmp_path / "staging"))
+    staging.stage_write(str(tree / "a.txt"), "a nuevo\n")
+    staging.stage_write(str(tree / "c.txt"), "c nuevo\n")
+    staging.stage_remove(str(tree / "b.txt"))
+    assert (tree / "a.txt").read_text() == "a original\n"  # Nada se toca antes de confirmar
+    assert not (tree / "c.txt").exists()
+
+    assert staging.commit() == 3
+    assert (tree / "a.txt").read_text() == "a nuevo\n"
+    assert (tree / "c.txt").read_text() == "c nuevo\n"
+    assert not (tree / "b.txt").exists()
+    assert len(staging) == 0
+
+    assert staging.rollback() == 3
+    assert sorted(os.listdir(tree)) == ["a.txt", "b.txt"]
+    assert (tree / "a.txt").read_text() == "a original\n"
+    with pytest.raises(ValueError):
+        staging.rollback()
+    staging.close()
+
+
+def test_resume_keeps_uncommitted_operations(tmp_path, tree):
+    staging = StagingArea(str(tmp_path / "staging"))
+    staging.stage_write(str(tree / "a.txt"), "a nuevo\n")
+    staging.close()
+
+    resumed = StagingArea(str(tmp_path / "staging"), resume=True, fsync=True)
+    assert len(resumed) == 1
+    assert resumed.commit() == 1
+    assert (tree / "a.txt").read_text() == "a nuevo\n"
+    resumed.close()
+
+    fresh = StagingArea(str(tmp_path / "staging"))
+    assert len(fresh) == 0
+    fresh.close()
+
+
+def test_rollback_of_interrupted_commit(tmp_path, tree, monkeypatch):
+    staging = StagingArea(str(tmp_path / "staging"))
+    staging.stage_write(str(tree / "a.txt"), "a nuevo\n")
+    staging.stage_write(str(tree / "b.txt"), "b nuevo\n")
+
+    original_commit_entry = staging._commit_entry
+
+    def failing_commit_entry(entry):
+        if entry["path"].endswith("b.txt"):
+            raise OSError("disco lleno")
+        original_commit_entry(entry)
+
+    monkeypatch.setattr(staging, "_commit_entry", failing_commit_entry)
+    with pytest.raises(OSError):
+        staging.commit(workers=1)
+    assert (tree / "a.txt").read_text() == "a nuevo\n"
+    with pytest.raises(ValueError):
+        staging.commit()  # Hay que deshacer la confirmación interrumpida primero
+
+    assert staging.rollback() == 1
+    assert (tree / "a.txt").read_text() == "a original\n"
+    assert (tree / "b.txt").read_text() == "b original\n"
+    staging.close()
@@ -0,0 +1,99 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.cambiacosas.googleapi.api_client import (gemini_usage_metadata, parse_gemini_response, parse_gemini_text,
+                                                  stream_gemini_api)
+from src.cambiacosas.googleapi.gemini_options import GeminisOptions
+from src.cambiacosas.googleapi.http_client import GeminiHTTPClient
+
+
+def _item(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.paths.append(self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for fragment in self.server.fragments:
+            item = _item(fragment)
+            item["usageMetadata"] = {"promptTokenCount": 5, "candidatesTokenCount": len(self.server.paths), "totalTokenCount": 9}
+            self.wfile.write(b"data: " + json.dumps(item).encode("utf-8") + b"\r\n\r\n")
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def sse_server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _SSEHandler)
+    httpd.paths = []
+    httpd.fragments = ['{"response": "ho', 'la ñandú', '"}']
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def gemini_config(monkeypatch, sse_server):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    config = GeminisOptions()
+    config.url = f"http://127.0.0.1:{sse_server.server_address[1]}/models/test:streamGenerateContent?key=test-key"
+    config.set_input_text("hola")
+    return config
+
+
+def test_stream_gemini_api_collects_text(gemini_config, sse_server):
+    received = []
+    sink = io.StringIO()
+    with GeminiHTTPClient() as client:
+        text = stream_gemini_api(gemini_config, client, on_text=received.append)
+        # Con sink, el texto se escribe en él y no se acumula: se devuelve su longitud
+        assert stream_gemini_api(gemini_config, client, sink=sink) == len(text)
+    assert text == '{"response": "hola ñandú"}'
+    assert sink.getvalue() == text
+    assert received == sse_server.fragments
+    assert sse_server.paths[0].endswith("&alt=sse")
+    assert parse_gemini_text(text) == {"response": "hola ñandú"}
+
+
+def test_stream_gemini_api_without_client(gemini_config):
+    assert stream_gemini_api(gemini_config) == '{"response": "hola ñandú"}'
+
+
+def test_stream_gemini_api_reports_first_byte_and_usage(gemini_config):
+    first_bytes, usages = [], []
+    stream_gemini_api(gemini_config, on_first_byte=first_bytes.append, on_usage=usages.append)
+    assert len(first_bytes) == 1 and first_bytes[0] >= 0
+    assert usages == [{"promptTokenCount": 5, "candidatesTokenCount": 1, "totalTokenCount": 9}]
+
+
+def test_gemini_usage_metadata_takes_last_item():
+    first, last = _item("a"), _item("b")
+    first["usageMetadata"] = {"totalTokenCount": 1}
+    last["usageMetadata"] = {"totalTokenCount": 7}
+    assert gemini_usage_metadata([first, _item("x"), last]) == {"totalTokenCount": 7}
+    assert gemini_usage_metadata([_item("x")]) is None
+
+
+def test_parse_gemini_response_joins_parts():
+    response = [_item('{"response": '), _item('"abc"}')]
+    assert parse_gemini_response(response) == {"response": "abc"}
+
+
+def test_parse_gemini_response_plain_text():
+    assert parse_gemini_response([_item("sin json")]) == "sin json"
+
+
+def test_parse_gemini_response_invalid():
+    assert parse_gemini_response(None) is None
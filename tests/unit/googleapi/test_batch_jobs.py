@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from src.cambiacosas.googleapi.batch_jobs import batch_key, batch_request_line, parse_batch_key, read_batch_results
+from src.cambiacosas.googleapi.gemini_options import GeminisOptions
+
+
+def test_batch_key_round_trip():
+    key = batch_key("src/app.py", 2, 3, "ab" * 32)
+    assert key == "src/app.py#2/3@" + "ab" * 8
+    assert parse_batch_key(key) == ("src/app.py", 2, 3, "ab" * 8)
+
+
+@pytest.mark.parametrize("key", ["app.py", "app.py#4/3@abcd", "app.py#1/1@XYZ", None])
+def test_parse_batch_key_rejects_invalid_keys(key):
+    with pytest.raises(ValueError):
+        parse_batch_key(key)
+
+
+def test_batch_request_line_is_stable(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    first, second = GeminisOptions(), GeminisOptions()
+    first.set_input_text("hola")
+    second.set_input_text("hola")
+    line = batch_request_line("a.txt#1/1@00", first)
+    assert line == batch_request_line("a.txt#1/1@00", second)
+    assert line.endswith("\n")
+    record = json.loads(line)
+    assert record["key"] == "a.txt#1/1@00"
+    assert record["request"]["contents"][0]["parts"][0]["text"] == "hola"
+    assert "test-key" not in line
+
+
+def test_read_batch_results(tmp_path):
+    results_path = tmp_path / "results.jsonl"
+    response = {"candidates": [{"content": {"parts": [{"text": '{"response": '}, {"text": '"HOLA"}'}]}}]}
+    results_path.write_text("\n".join([
+        json.dumps({"key": "a", "response": response}),
+        json.dumps({"key": "b", "error": {"code": 400, "message": "mal"}}),
+        "{no es json",
+        "",
+    ]) + "\n")
+    results = list(read_batch_results(str(results_path)))
+    assert results[0] == ("a", '{"response": "HOLA"}', None)
+    assert results[1] == ("b", None, {"code": 400, "message": "mal"})
+    assert results[2][0] is None and results[2][2]
+    assert len(results) == 3
@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.mock_gemini_server import MockGeminiConfig, MockGeminiServer
+from src.cambiacosas import __main__ as cambiacosas_main
+from src.cambiacosas.googleapi.api_client import call_gemini_api, gemini_usage_metadata
+from src.cambiacosas.googleapi.context_cache import ContextCache, is_context_error
+from src.cambiacosas.googleapi.gemini_options import GeminisOptions
+from src.cambiacosas.run_metrics import RunMetrics
+
+LONG_PROMPT = "Sigue la guía de estilo. " * 400  # ~10.000 caracteres, ~2.500 tokens estimados
+
+
+@pytest.fixture
+def server(monkeypatch):
+    def start(**config):
+        mock = MockGeminiServer(MockGeminiConfig(latency_ms=0, **config)).start()
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        monkeypatch.setenv("GEMINI_API_BASE_URL", mock.base_url)
+        started.append(mock)
+        return mock
+    started = []
+    yield start
+    for mock in started:
+        mock.stop()
+
+
+def _config(text, instruction=LONG_PROMPT):
+    gemini_config = GeminisOptions()
+    gemini_config.set_system_instruction(instruction)
+    gemini_config.set_input_text(text)
+    return gemini_config
+
+
+def test_context_is_created_once_and_referenced(server):
+    mock = server()
+    cache = ContextCache(log=lambda message: None)
+
+    def request(i):
+        gemini_config = _config(f"archivo {i}")
+        assert cache.apply(gemini_config)
+        assert "systemInstruction" not in gemini_config.body
+        return call_gemini_api(gemini_config)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(request, range(16)))
+    assert cache.created == 1
+    assert mock.requests == 16
+    assert all(gemini_usage_metadata(response)["cachedContentTokenCount"] > 0 for response in responses)
+
+    cache.close()
+    assert mock.cached_contents == []
+
+
+def test_short_instructions_are_sent_inline(server):
+    server()
+    cache = ContextCache(log=lambda message: None)
+    gemini_config = _config("archivo", instruction="Mayúsculas.")
+    assert not cache.apply(gemini_config)
+    assert gemini_config.cached_content is None
+    assert cache.created == 0
+
+
+def test_falls_back_when_caching_is_unavailable(server):
+    server(context_cache=False)
+    messages = []
+    cache = ContextCache(log=messages.append)
+    for i in range(3):
+        gemini_config = _config(f"archivo {i}")
+        assert not cache.apply(gemini_config)
+        assert gemini_config.body["systemInstruction"]["parts"][0]["text"] == LONG_PROMPT
+        call_gemini_api(gemini_config)
+    assert len(messages) == 1  # Solo se intenta crear una vez por ejecución
+
+
+def test_process_files_retries_inline_when_the_context_expired(server, tmp_path):
+    mock = server()
+    folder = tmp_path / "tree"
+    folder.mkdir()
+    for i in range(4):
+        (folder / f"file_{i}.txt").write_text(f"content {i}\n")
+    context = cambiacosas_main.ProcessingContext(context_cache=ContextCache(log=lambda message: None), metrics=RunMetrics())
+
+    first, *rest = sorted(cambiacosas_main.scan_folder(str(folder)), key=lambda file_info: file_info['name'])
+    assert cambiacosas_main.process_files_with_gemini([first], LONG_PROMPT, False, context) == 1
+    mock.expire_cached_contents()  # La siguiente petición recibe 404 y se repite en línea
+    assert cambiacosas_main.process_files_with_gemini(rest, LONG_PROMPT, False, context) == 3
+    for i in range(4):
+        assert (folder / f"file_{i}.txt").read_text() == f"content {i}\n"
+
+    assert context.context_cache.created == 2  # Se crea otro contexto tras el rechazo
+    assert mock.requests == 5
+    assert context.metrics.summary()["tokens"]["cached"] > 0
+
+
+def test_is_context_error_follows_wrapped_exceptions():
+    class Response:
+        status_code = 404
+
+    class HTTPError(Exception):
+        response = Response()
+
+    try:
+        try:
+            raise HTTPError()
+        except HTTPError as e:
+            raise RuntimeError("API request failed") from e
+    except RuntimeError as wrapped:
+        assert is_context_error(wrapped)
+    assert not is_context_error(ValueError("otro"))
+
+
+def test_ttl_must_exceed_the_expiry_margin():
+    with pytest.raises(ValueError):
+        ContextCache(ttl_seconds=30)
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from src.cambiacosas.googleapi.gemini_options import (
+    DEFAULT_RESPONSE_SCHEMA,
+    GeminiOptionsError,
+    GeminisOptions,
+    LINE_EDITS_RESPONSE_SCHEMA,
+)
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+
+def test_body_bytes_match_body():
+    gemini_config = GeminisOptions()
+    gemini_config.set_input_text('línea "uno"\n\tdos \\ tres   ✓')
+    gemini_config.set_system_instruction("Responde en español.")
+    gemini_config.set_response_schema(LINE_EDITS_RESPONSE_SCHEMA)
+    assert json.loads(gemini_config.body_bytes().decode("utf-8")) == gemini_config.body
+    assert gemini_config.body["contents"][0]["parts"][0]["text"] == 'línea "uno"\n\tdos \\ tres   ✓'
+    assert gemini_config.body["systemInstruction"]["parts"][0]["text"] == "Responde en español."
+    assert gemini_config.body["generationConfig"]["responseSchema"] is LINE_EDITS_RESPONSE_SCHEMA
+
+
+def test_input_text_containing_the_template_placeholder():
+    gemini_config = GeminisOptions()
+    gemini_config.set_input_text("\0cambiacosas-input\0")
+    assert json.loads(gemini_config.body_bytes())["contents"][0]["parts"][0]["text"] == "\0cambiacosas-input\0"
+
+
+def test_options_share_the_serialized_template():
+    first, second = GeminisOptions(), GeminisOptions()
+    for gemini_config, text in ((first, "a"), (second, "b")):
+        gemini_config.set_response_schema(LINE_EDITS_RESPONSE_SCHEMA)
+        gemini_config.set_input_text(text)
+    assert first._template is second._template
+    assert first.body_bytes() != second.body_bytes()
+
+
+def test_setters_update_the_serialized_body():
+    gemini_config = GeminisOptions()
+    gemini_config.set_input_text("hola")
+    before = gemini_config.body_bytes()
+    gemini_config.set_input_text("adiós")
+    assert gemini_config.body_bytes() != before
+
+    gemini_config.set_model("gemini-2.0-flash-thinking-exp-01-21")
+    config = json.loads(gemini_config.body_bytes())["generationConfig"]
+    assert config == {"responseMimeType": "text/plain"}
+    gemini_config.set_model("gemini-2.0-flash")
+    assert gemini_config.body["generationConfig"]["responseSchema"] is DEFAULT_RESPONSE_SCHEMA
+    assert "gemini-2.0-flash:" in gemini_config.url
+
+
+def test_a_new_schema_object_is_not_confused_with_a_cached_one():
+    gemini_config = GeminisOptions()
+    gemini_config.set_response_schema({"type": "object", "properties": {"a": {"type": "string"}}})
+    gemini_config.set_response_schema({"type": "object", "properties": {"b": {"type": "string"}}})
+    assert "b" in json.loads(gemini_config.body_bytes())["generationConfig"]["responseSchema"]["properties"]
+
+
+def test_invalid_options_raise_gemini_options_error():
+    gemini_config = GeminisOptions()
+    with pytest.raises(GeminiOptionsError):
+        gemini_config.set_input_text(None)
+    with pytest.raises(GeminiOptionsError):
+        gemini_config.set_response_schema({"type": object()})
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.cambiacosas.googleapi.api_client import call_gemini_api, gemini_response_text, stream_gemini_api
+from src.cambiacosas.googleapi.gemini_options import GeminisOptions
+from src.cambiacosas.googleapi.hedging import HedgePolicy
+from src.cambiacosas.googleapi.http_client import GeminiHTTPClient
+from src.cambiacosas.googleapi.rate_limiter import RateLimiter
+
+
+class _DelayedHandler(BaseHTTPRequestHandler):
+    """Responde con el número de la petición, tras la espera que le corresponde en server.delays."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            self.server.requests += 1
+            number = self.server.requests
+            delay = self.server.delays.pop(0) if self.server.delays else 0.0
+        time.sleep(delay)
+        item = {"candidates": [{"content": {"parts": [{"text": f"respuesta {number}"}]}}]}
+        if "alt=sse" in self.path:
+            payload = b"data: " + json.dumps(item).encode("utf-8") + b"\r\n\r\n"
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps([item]).encode("utf-8")
+            content_type = "application/json"
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass  # El cliente abandonó la petición perdedora
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _DelayedHandler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.requests = 0
+    httpd.delays = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def gemini_config(monkeypatch, server):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_API_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    config = GeminisOptions()
+    config.set_input_text("hola")
+    return config
+
+
+def test_slow_request_is_hedged_and_the_duplicate_wins(server, gemini_config):
+    server.delays = [2.0]  # Solo la primera petición es lenta
+    hedge = HedgePolicy(delay=0.1)
+    start = time.monotonic()
+    with GeminiHTTPClient() as client:
+        response = call_gemini_api(gemini_config, client, RateLimiter(rpm=10 ** 6, log=lambda message: None), hedge=hedge)
+    assert time.monotonic() - start < 1.5
+    assert gemini_response_text(response) == "respuesta 2"
+    assert (hedge.requests, hedge.hedges, hedge.hedge_wins) == (1, 1, 1)
+
+
+def _attempt_threads():
+    return [thread for thread in threading.enumerate() if "_run_attempt" in thread.name]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_the_losing_attempt_is_abandoned_when_the_other_wins(server, gemini_config, stream):
+    server.delays = [5.0]
+    hedge = HedgePolicy(delay=0.1)
+    limiter = RateLimiter(initial_concurrency=1, max_concurrency=1, log=lambda message: None)
+    start = time.monotonic()
+    with GeminiHTTPClient() as client:
+        if stream:
+            assert stream_gemini_api(gemini_config, client, limiter=limiter, hedge=hedge) == "respuesta 2"
+        else:
+            assert gemini_response_text(call_gemini_api(gemini_config, client, limiter, hedge=hedge)) == "respuesta 2"
+        # El original liberó su hueco del limitador y cerró su conexión sin esperar a su respuesta
+        assert gemini_response_text(call_gemini_api(gemini_config, client, limiter)) == "respuesta 3"
+        while _attempt_threads() and time.monotonic() - start < 2.0:
+            time.sleep(0.02)
+    assert time.monotonic() - start < 2.0
+    assert _attempt_threads() == []
+
+
+def test_slow_stream_is_hedged(server, gemini_config):
+    server.delays = [2.0]
+    hedge = HedgePolicy(delay=0.1)
+    received = []
+    start = time.monotonic()
+    assert stream_gemini_api(gemini_config, on_text=received.append, hedge=hedge) == "respuesta 2"
+    assert time.monotonic() - start < 1.5
+    assert received == ["respuesta 2"]  # El intento perdedor no entrega texto
+    assert hedge.hedge_wins == 1
+
+
+def test_fast_request_is_not_hedged(server, gemini_config):
+    hedge = HedgePolicy(delay=1.0)
+    assert gemini_response_text(call_gemini_api(gemini_config, hedge=hedge)) == "respuesta 1"
+    assert hedge.hedges == 0
+    assert server.requests == 1
+
+
+def test_hedges_are_capped_by_max_fraction(server, gemini_config):
+    server.delays = [0.3]
+    hedge = HedgePolicy(delay=0.05, max_fraction=0)
+    assert gemini_response_text(call_gemini_api(gemini_config, hedge=hedge)) == "respuesta 1"
+    assert hedge.hedges == 0
+    assert server.requests == 1
+
+
+def test_budget_allows_one_hedge_plus_the_fraction():
+    hedge = HedgePolicy(delay=1.0, max_fraction=0.1)
+    hedge.requests = 10
+    assert hedge.acquire_hedge() and hedge.acquire_hedge()
+    assert not hedge.acquire_hedge()
+
+
+def test_hedge_delay_uses_the_observed_percentile():
+    hedge = HedgePolicy(min_samples=20)
+    for seconds in range(1, 20):
+        hedge.record_first_byte(float(seconds))
+    assert hedge.hedge_delay() is None
+    for seconds in range(20, 101):
+        hedge.record_first_byte(float(seconds))
+    assert hedge.hedge_delay() == 95.0
+
+
+@pytest.mark.parametrize("options", [{"delay": 0}, {"percentile": 100}, {"max_fraction": 1.5}])
+def test_invalid_policy(options):
+    with pytest.raises(ValueError):
+        HedgePolicy(**options)
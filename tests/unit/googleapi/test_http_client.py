@@ -0,0 +1,80 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.cambiacosas.googleapi.http_client import GeminiHTTPClient
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive
+
+    def do_POST(self):
+        raw_body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw_body = gzip.decompress(raw_body)
+        self.server.client_ports.add(self.client_address[1])
+        if self.path == "/slow":
+            self.server.release.wait(5)
+        payload = json.dumps({
+            "body": json.loads(raw_body),
+            "gzip": self.headers.get("Content-Encoding") == "gzip",
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+    httpd.client_ports = set()
+    httpd.release = threading.Event()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.release.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path="/"):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def test_send_reuses_connection(server):
+    with GeminiHTTPClient(pool_size=1) as client:
+        for i in range(3):
+            response = client.send("POST", _url(server), {"Content-Type": "application/json"}, {"i": i})
+            assert response.json()["body"] == {"i": i}
+    assert len(server.client_ports) == 1
+
+
+def test_send_compresses_large_bodies(server):
+    headers = {"Content-Type": "application/json"}
+    with GeminiHTTPClient(gzip_min_bytes=1024) as client:
+        small = client.send("POST", _url(server), headers, {"text": "a"}).json()
+        large = client.send("POST", _url(server), headers, {"text": "a" * 4096}).json()
+    assert small["gzip"] is False
+    assert large["gzip"] is True
+    assert large["body"] == {"text": "a" * 4096}
+    assert "Content-Encoding" not in headers
+
+
+def test_send_read_timeout(server):
+    with GeminiHTTPClient(read_timeout=0.2) as client:
+        with pytest.raises(requests.exceptions.Timeout):
+            client.send("POST", _url(server, "/slow"), {}, {})
+
+
+def test_invalid_pool_size():
+    with pytest.raises(ValueError):
+        GeminiHTTPClient(pool_size=0)
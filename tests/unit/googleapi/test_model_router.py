@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from src.cambiacosas import __main__ as cambiacosas_main
+from src.cambiacosas.googleapi.gemini_options import GeminisOptions
+from src.cambiacosas.googleapi.model_router import ModelRoute, ModelRouter, parse_route
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+
+def test_first_matching_route_wins():
+    router = ModelRouter([
+        ModelRoute("gemini-2.0-flash-lite", max_tokens=100, paths=["*.json", "*.yaml"]),
+        ModelRoute("gemini-2.5-pro", min_tokens=1000),
+        ModelRoute("gemini-2.5-flash", content=r"^class "),
+    ])
+    assert router.choose(["config/app.json"], 10, "{}") == "gemini-2.0-flash-lite"
+    assert router.choose(["config/app.json"], 500, "{}") == "gemini-2.0-flash"
+    assert router.choose(["src/big.py"], 5000, "x") == "gemini-2.5-pro"
+    assert router.choose(["src/model.py"], 50, "import os\nclass A:\n") == "gemini-2.5-flash"
+    # Un paquete solo cumple paths si todos sus archivos lo cumplen
+    assert router.choose(["a.json", "b.py"], 10, "") == "gemini-2.0-flash"
+
+
+def test_apply_sets_the_model_and_keeps_the_response_schema():
+    router = ModelRouter([ModelRoute("gemini-2.0-flash-lite", max_tokens=100)])
+    gemini_config = cambiacosas_main._line_edits_config("a\nb\n", 1, "Mayúsculas.")
+    assert router.apply(gemini_config, ["a.txt"], 2) == "gemini-2.0-flash-lite"
+    assert "gemini-2.0-flash-lite:" in gemini_config.url
+    body = json.loads(gemini_config.body_bytes())
+    assert body["generationConfig"]["responseSchema"]["required"] == ["edits"]
+    assert router.routed == {"gemini-2.0-flash-lite": 1}
+
+
+def test_parse_route_and_routes_file(tmp_path):
+    route = parse_route("gemini-2.0-flash-lite:max_tokens=500;paths=*.json|*.yaml")
+    assert (route.model, route.max_tokens, route.paths) == ("gemini-2.0-flash-lite", 500, ("*.json", "*.yaml"))
+
+    routes_file = tmp_path / "routes.json"
+    routes_file.write_text(json.dumps({"default": "gemini-2.5-flash",
+                                       "routes": [{"model": "gemini-2.5-pro", "min_tokens": 2000}]}))
+    router = ModelRouter.from_file(str(routes_file), extra_routes=[route])
+    assert router.models == ["gemini-2.5-flash", "gemini-2.0-flash-lite", "gemini-2.5-pro"]
+    assert router.choose(["a.json"], 10, "") == "gemini-2.0-flash-lite"
+    assert router.choose(["a.py"], 10, "") == "gemini-2.5-flash"
+
+
+@pytest.mark.parametrize("spec", ["gemini-2.0-flash-lite:tokens=5", "gemini-2.0-flash-lite:max_tokens=muchos",
+                                  "gemini-2.0-flash-thinking-exp-01-21", ":max_tokens=5"])
+def test_invalid_routes(spec):
+    with pytest.raises(ValueError):
+        parse_route(spec)
+
+
+def test_process_files_routes_each_file(tmp_path, monkeypatch):
+    folder = tmp_path / "tree"
+    folder.mkdir()
+    (folder / "small.json").write_text('{"a": 1}\n')
+    (folder / "large.py").write_text("x = 1\n" * 400)
+    models = {}
+
+    def fake_call(gemini_config, client=None, limiter=None):
+        models[gemini_config.input_text[:5]] = gemini_config.model_id
+        return [{"candidates": [{"content": {"parts": [{"text": json.dumps({"response": gemini_config.input_text})}]}}]}]
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", fake_call)
+    router = ModelRouter([parse_route("gemini-2.0-flash-lite:max_tokens=100")], default_model="gemini-2.5-flash")
+    context = cambiacosas_main.ProcessingContext(router=router)
+    assert cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "Nada.", False, context) == 2
+    assert models == {'{"a":': "gemini-2.0-flash-lite", "x = 1": "gemini-2.5-flash"}
+    assert router.routed == {"gemini-2.0-flash-lite": 1, "gemini-2.5-flash": 1}
+
+
+def test_path_globs_are_relative_to_the_processed_folder(tmp_path, monkeypatch):
+    folder = tmp_path / "proj"
+    (folder / "src" / "pkg").mkdir(parents=True)
+    (folder / "tests").mkdir()
+    for name in ("src/a.py", "src/pkg/b.py", "tests/c.py", "d.py"):
+        (folder / name).write_text(f"# {name}\n")
+    models = {}
+
+    def fake_call(gemini_config, client=None, limiter=None):
+        models[gemini_config.input_text.split()[1]] = gemini_config.model_id
+        return [{"candidates": [{"content": {"parts": [{"text": json.dumps({"response": gemini_config.input_text})}]}}]}]
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", fake_call)
+    router = ModelRouter([parse_route("gemini-2.5-pro:paths=src/*.py"), parse_route("gemini-2.0-flash-lite:paths=tests/**")],
+                         default_model="gemini-2.5-flash")
+    context = cambiacosas_main.ProcessingContext(router=router, root=str(folder))
+    assert cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "Nada.", False, context) == 4
+    assert models == {"src/a.py": "gemini-2.5-pro", "src/pkg/b.py": "gemini-2.5-pro",
+                      "tests/c.py": "gemini-2.0-flash-lite", "d.py": "gemini-2.5-flash"}
+
+
+def test_text_only_model_keeps_plain_text_responses():
+    gemini_config = GeminisOptions()
+    gemini_config.set_model("gemini-2.0-flash-lite")
+    assert gemini_config.body["generationConfig"]["responseMimeType"] == "application/json"
+    gemini_config.set_model("gemini-2.0-flash-thinking-exp-01-21")
+    assert gemini_config.body["generationConfig"] == {"responseMimeType": "text/plain"}
@@ -0,0 +1,142 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.cambiacosas.googleapi import rate_limiter
+from src.cambiacosas.googleapi.api_client import call_gemini_api
+from src.cambiacosas.googleapi.gemini_options import GeminisOptions
+from src.cambiacosas.googleapi.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Registra las esperas del limitador en lugar de dormir."""
+    recorded = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", recorded.append)
+    return recorded
+
+
+def _http_error(status, headers=None, body=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = json.dumps(body or {}).encode("utf-8")
+    return requests.exceptions.HTTPError(f"{status} Error", response=response)
+
+
+def _failing_then(result, errors):
+    errors = list(errors)
+
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return request
+
+
+def test_retries_429_honoring_retry_after_and_halves_concurrency(sleeps):
+    limiter = RateLimiter(rpm=1000, initial_concurrency=8, max_concurrency=8, log=lambda message: None)
+    request = _failing_then("ok", [_http_error(429, {"Retry-After": "7"})])
+    assert limiter.call("gemini-2.0-flash", request) == "ok"
+    assert any(6.9 < delay <= 7.0 for delay in sleeps)
+    assert limiter.retries == 1
+    assert limiter.concurrency("gemini-2.0-flash") < 8
+
+
+def test_retry_delay_from_retry_info_body(sleeps):
+    limiter = RateLimiter(rpm=1000, log=lambda message: None)
+    body = {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "12s"}]}}
+    limiter.call("gemini-2.0-flash", _failing_then("ok", [_http_error(429, body=body)]))
+    assert any(11.9 < delay <= 12.0 for delay in sleeps)
+
+
+def test_jittered_backoff_for_5xx_is_bounded(sleeps):
+    limiter = RateLimiter(rpm=1000, base_delay=1.0, max_delay=3.0, log=lambda message: None)
+    errors = [_http_error(500), _http_error(502), requests.exceptions.ConnectionError("reset"), _http_error(504)]
+    assert limiter.call("gemini-2.0-flash", _failing_then("ok", errors)) == "ok"
+    assert len(sleeps) == 4
+    assert all(0 <= delay <= 3.0 for delay in sleeps)
+
+
+def test_non_retryable_and_exhausted_errors_are_raised(sleeps):
+    limiter = RateLimiter(rpm=1000, max_retries=2, log=lambda message: None)
+    with pytest.raises(requests.exceptions.HTTPError):
+        limiter.call("gemini-2.0-flash", _failing_then("ok", [_http_error(400)]))
+    assert sleeps == []
+    with pytest.raises(requests.exceptions.HTTPError):
+        limiter.call("gemini-2.0-flash", _failing_then("ok", [_http_error(503)] * 3))
+    assert len(sleeps) == 2
+
+
+def test_concurrency_grows_additively_on_success(sleeps):
+    limiter = RateLimiter(rpm=1000, initial_concurrency=1, max_concurrency=4)
+    for _ in range(20):
+        limiter.call("gemini-2.0-flash", lambda: "ok")
+    assert 4 >= limiter.concurrency("gemini-2.0-flash") > 3
+
+
+def test_rpm_and_tpm_budgets_delay_requests(sleeps):
+    limiter = RateLimiter(rpm=2, tpm=1000)
+    for _ in range(3):
+        limiter.call("gemini-2.0-flash", lambda: "ok")
+    assert len(sleeps) == 1 and 29 < sleeps[0] <= 30  # La tercera petición espera a que se recargue el cupo
+
+    limiter = RateLimiter(rpm=1000, tpm=1000)
+    limiter.call("gemini-2.0-flash", lambda: "ok", estimated_tokens=1000)
+    limiter.call("gemini-2.0-flash", lambda: "ok", estimated_tokens=500)
+    assert 29 < sleeps[-1] <= 30
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests += 1
+        if self.server.requests == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+            return
+        body = json.dumps([{"candidates": [{"content": {"parts": [{"text": "ok"}]}}]}]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_call_gemini_api_retries_through_limiter(monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyHandler)
+    httpd.requests = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        config = GeminisOptions()
+        config.url = f"http://127.0.0.1:{httpd.server_address[1]}/models/test:streamGenerateContent?key=test-key"
+        limiter = RateLimiter(rpm=1000, log=lambda message: None)
+        response = call_gemini_api(config, limiter=limiter)
+        assert response[0]["candidates"][0]["content"]["parts"][0]["text"] == "ok"
+        assert httpd.requests == 2
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_budgets_apply_only_when_known(sleeps):
+    limiter = RateLimiter()
+    for _ in range(20):
+        limiter.call("gemini-2.0-flash", lambda: "ok")
+    assert sleeps == []  # Sin presupuestos: una clave de pago no se limita a la cuota gratuita
+
+    limiter = RateLimiter(free_tier=True)
+    for _ in range(20):
+        limiter.call("gemini-2.0-flash", lambda: "ok")
+    assert len(sleeps) == 5  # 15 RPM del nivel gratuito
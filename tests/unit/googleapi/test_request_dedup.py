@@ -0,0 +1,74 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.cambiacosas import __main__ as cambiacosas_main
+from src.cambiacosas.googleapi.request_dedup import RequestDeduplicator
+
+
+def test_concurrent_identical_requests_wait_for_the_one_in_flight():
+    dedup = RequestDeduplicator()
+    release = threading.Event()
+    calls = []
+
+    def request():
+        calls.append(1)
+        release.wait(5)
+        return "respuesta"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(dedup.run, "clave", request) for _ in range(4)]
+        release.set()
+        results = [future.result() for future in futures]
+    assert len(calls) == 1
+    assert sorted(results) == [("respuesta", False)] + [("respuesta", True)] * 3
+    assert dedup.shared == 3
+
+
+def test_failed_requests_are_not_shared():
+    dedup = RequestDeduplicator()
+    with pytest.raises(RuntimeError):
+        dedup.run("clave", lambda: (_ for _ in ()).throw(RuntimeError("sin conexión")))
+    assert dedup.run("clave", lambda: None) == (None, False)
+    assert dedup.run("clave", lambda: "respuesta") == ("respuesta", False)
+    assert dedup.run("clave", lambda: pytest.fail("petición repetida")) == ("respuesta", True)
+
+
+def test_finished_responses_are_kept_up_to_max_chars():
+    dedup = RequestDeduplicator(max_chars=10)
+    for key in ("a", "b", "c"):
+        dedup.run(key, lambda: key * 4)
+    assert dedup.run("a", lambda: "nueva") == ("nueva", False)  # La menos reciente se olvidó
+    assert dedup.run("c", lambda: pytest.fail("petición repetida")) == ("cccc", True)
+    assert dedup.run("b", lambda: "otra") == ("otra", False)
+    assert dedup.run("grande", lambda: "x" * 20) == ("x" * 20, False)
+    assert dedup.run("grande", lambda: "de nuevo") == ("de nuevo", False)
+
+
+def test_identical_files_and_chunks_are_sent_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    folder = tmp_path / "tree"
+    (folder / "vendor").mkdir(parents=True)
+    license_header = "".join(f"# Licencia, línea {i}\n" for i in range(200))
+    for name in ("a.py", "b.py", "vendor/a.py"):
+        (folder / name).write_text("LICENCIA\n")
+    (folder / "large_1.txt").write_text(license_header + "\n" + "x = 1\n" * 600)
+    (folder / "large_2.txt").write_text(license_header + "\n" + "y = 2\n" * 600)
+    calls = []
+
+    def fake_call(gemini_config, client=None, limiter=None):
+        calls.append(gemini_config.input_text)
+        return [{"candidates": [{"content": {"parts": [{"text": json.dumps({"response": gemini_config.input_text.lower()})}]}}]}]
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", fake_call)
+    context = cambiacosas_main.ProcessingContext(workers=4, chunk_tokens=1200)
+    assert cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "Minúsculas.", False, context) == 5
+
+    assert calls.count("LICENCIA\n") == 1
+    for name in ("a.py", "b.py", "vendor/a.py"):
+        assert (folder / name).read_text() == "licencia\n"
+    assert (folder / "large_2.txt").read_text() == license_header.lower() + "\n" + "y = 2\n" * 600
+    assert len(calls) == 4  # LICENCIA, la cabecera de licencia (una vez) y el resto de cada archivo grande
+    assert context.dedup.shared == 3
@@ -0,0 +1,55 @@
+import pytest
+
+from src.cambiacosas.googleapi.gemini_options import GeminisOptions
+from src.cambiacosas.googleapi.response_cache import ResponseCache, cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    response_cache = ResponseCache(str(tmp_path / "cache"), max_bytes=100)
+    yield response_cache
+    response_cache.close()
+
+
+def test_get_and_put(cache):
+    assert cache.get("a") is None
+    cache.put("a", "respuesta")
+    assert cache.get("a") == "respuesta"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction(cache):
+    cache.put("a", "x" * 40)
+    cache.put("b", "y" * 40)
+    cache.get("a")  # "b" pasa a ser la menos usada
+    cache.put("c", "z" * 40)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 40
+    assert cache.get("c") == "z" * 40
+
+
+def test_oversized_entry_is_not_stored(cache):
+    cache.put("a", "x" * 200)
+    assert cache.get("a") is None
+
+
+def test_persists_between_instances(tmp_path):
+    first = ResponseCache(str(tmp_path))
+    first.put("a", "respuesta")
+    first.close()
+    second = ResponseCache(str(tmp_path))
+    assert second.get("a") == "respuesta"
+    second.close()
+
+
+def test_cache_key_depends_on_request(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    first, second = GeminisOptions(), GeminisOptions()
+    first.set_input_text("hola")
+    second.set_input_text("hola")
+    assert cache_key(first) == cache_key(second)
+    second.set_system_instruction("otra instrucción")
+    assert cache_key(first) != cache_key(second)
+    second.set_system_instruction(first.body["systemInstruction"]["parts"][0]["text"])
+    second.set_model("gemini-2.0-flash-lite")
+    assert cache_key(first) != cache_key(second)
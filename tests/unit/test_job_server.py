@@ -0,0 +1,207 @@
+import http.client
+import json
+import os
+import socket
+import stat
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from src.cambiacosas.job_server import JobConflictError, JobServer, create_http_server, is_loopback_host
+
+
+def _validate(request):
+    if "folder" not in request:
+        raise ValueError("Falta la carpeta.")
+    return dict(request)
+
+
+@pytest.fixture
+def blocking_server():
+    """Un servidor con un solo trabajo activo cuyos trabajos esperan a que se libere `release`."""
+    release = threading.Event()
+    started = []
+
+    def run_job(job):
+        started.append(job.folder)
+        job.emit({"event": "file", "files": [job.folder + "/a.txt"]})
+        release.wait(5)
+        if job.folder == "roto":
+            raise RuntimeError("sin conexión")
+
+    job_server = JobServer(run_job, _validate, max_active_jobs=1)
+    yield job_server, release, started
+    release.set()
+    job_server.close()
+
+
+def _wait_state(job, state):
+    for event in job.events():
+        if event["event"] == "state" and event["state"] == state:
+            return
+    assert job.state == state
+
+
+def test_jobs_run_in_order_and_queued_jobs_can_be_cancelled(blocking_server):
+    job_server, release, started = blocking_server
+    first = job_server.submit({"folder": "uno"})
+    second = job_server.submit({"folder": "dos"})
+    third = job_server.submit({"folder": "roto"})
+    _wait_state(first, "running")
+    with pytest.raises(JobConflictError):
+        job_server.submit({"folder": "uno"})
+    with pytest.raises(ValueError):
+        job_server.submit({})
+
+    assert job_server.cancel(second.id).state == "cancelled"
+    release.set()
+    _wait_state(third, "failed")
+    assert started == ["uno", "roto"]
+    assert first.state == "done"
+    assert third.error == "sin conexión"
+    assert [event["event"] for event in first.events()] == ["state", "state", "file", "state"]
+    assert [event["seq"] for event in first.events(2)] == [2, 3]
+    assert job_server.cancel("no-existe") is None
+
+
+def test_running_jobs_end_as_cancelled(blocking_server):
+    job_server, release, _ = blocking_server
+    job = job_server.submit({"folder": "uno"})
+    _wait_state(job, "running")
+    job_server.cancel(job.id)
+    assert job.cancel_event.is_set()
+    release.set()
+    _wait_state(job, "cancelled")
+
+
+def test_jobs_on_nested_or_linked_folders_conflict(tmp_path, blocking_server):
+    job_server, release, _ = blocking_server
+    (tmp_path / "a" / "sub").mkdir(parents=True)
+    (tmp_path / "b").mkdir()
+    job_server.submit({"folder": str(tmp_path / "a" / "sub")})
+    for folder in (tmp_path / "a", tmp_path / "a" / "sub" / "..", tmp_path / "a" / "sub" / "x"):
+        with pytest.raises(JobConflictError):
+            job_server.submit({"folder": str(folder)})
+    if hasattr(os, "symlink"):
+        os.symlink(tmp_path / "a", tmp_path / "enlace")
+        with pytest.raises(JobConflictError):
+            job_server.submit({"folder": str(tmp_path / "enlace" / "sub")})
+    job_server.submit({"folder": str(tmp_path / "b")})
+
+
+def _request(base_url, method, path, body=None, headers=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = dict({"Content-Type": "application/json"} if data is not None else {}, **(headers or {}))
+    request = urllib.request.Request(base_url + path, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def test_http_api(blocking_server):
+    job_server, release, _ = blocking_server
+    httpd = create_http_server(job_server, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        status, body = _request(base_url, "POST", "/jobs", {"folder": "uno", "prompt": "secreto"})
+        assert status == 201
+        job = json.loads(body)
+        assert job["state"] == "queued" and "prompt" not in job["options"]
+        assert _request(base_url, "POST", "/jobs", {"folder": "uno"})[0] == 409
+        assert _request(base_url, "POST", "/jobs", {"carpeta": "uno"})[0] == 400
+        assert _request(base_url, "GET", "/jobs/no-existe")[0] == 404
+
+        release.set()
+        status, body = _request(base_url, "GET", f"/jobs/{job['id']}/events")
+        events = [json.loads(line) for line in body.splitlines()]
+        assert [event.get("state") for event in events] == ["queued", "running", None, "done"]
+
+        status, body = _request(base_url, "GET", "/jobs")
+        assert [item["state"] for item in json.loads(body)["jobs"]] == ["done"]
+        status, body = _request(base_url, "DELETE", f"/jobs/{job['id']}")
+        assert status == 202 and json.loads(body)["state"] == "done"  # Ya había terminado
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="sin sockets Unix")
+def test_http_api_on_unix_socket(tmp_path, blocking_server):
+    job_server, release, _ = blocking_server
+    socket_path = str(tmp_path / "cambiacosas.sock")
+    umask = os.umask(0o022)
+    try:
+        httpd = create_http_server(job_server, socket_path=socket_path)
+    finally:
+        assert os.umask(umask) == 0o022  # Se restaura la máscara anterior
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    class UnixConnection(http.client.HTTPConnection):
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(socket_path)
+
+    try:
+        connection = UnixConnection("localhost", timeout=5)
+        connection.request("POST", "/jobs", json.dumps({"folder": "uno"}), {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        assert response.status == 201 and json.loads(response.read())["folder"] == "uno"
+        connection.close()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_http_api_rejects_foreign_and_unauthenticated_requests(blocking_server):
+    job_server, _, started = blocking_server
+    httpd = create_http_server(job_server, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        # Un formulario o un fetch "simple" desde una página web no puede enviar application/json
+        status, _ = _request(base_url, "POST", "/jobs", {"folder": "uno"}, {"Content-Type": "text/plain"})
+        assert status == 415
+        # Ni otro origen ni un nombre de DNS que resuelve a 127.0.0.1
+        assert _request(base_url, "POST", "/jobs", {"folder": "uno"}, {"Origin": "https://ejemplo.com"})[0] == 403
+        assert _request(base_url, "GET", "/jobs", headers={"Host": "ejemplo.com:8765"})[0] == 403
+        assert _request(base_url, "GET", "/jobs", headers={"Origin": "http://localhost:3000"})[0] == 200
+        assert _request(base_url, "GET", "/jobs", headers={"Host": f"[::1]:{httpd.server_address[1]}"})[0] == 200
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert started == []
+
+
+def test_http_api_token(blocking_server):
+    job_server, release, _ = blocking_server
+    httpd = create_http_server(job_server, port=0, token="s3creto\n")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        status, _ = _request(base_url, "POST", "/jobs", {"folder": "uno"})
+        assert status == 401
+        assert _request(base_url, "GET", "/jobs", headers={"Authorization": "Bearer otro"})[0] == 401
+        status, body = _request(base_url, "POST", "/jobs", {"folder": "uno"}, {"Authorization": "Bearer s3creto"})
+        assert status == 201
+        assert _request(base_url, "DELETE", f"/jobs/{json.loads(body)['id']}")[0] == 401
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_non_loopback_addresses_require_a_token(blocking_server):
+    job_server, _, _ = blocking_server
+    assert is_loopback_host("localhost") and is_loopback_host("::1") and is_loopback_host("127.0.0.2")
+    assert not is_loopback_host("0.0.0.0") and not is_loopback_host("ejemplo.com")
+    for host in ("0.0.0.0", "", "ejemplo.com"):
+        with pytest.raises(ValueError):
+            create_http_server(job_server, host=host, port=0)
+    with pytest.raises(ValueError):
+        create_http_server(job_server, port=0, token="  ")
+    httpd = create_http_server(job_server, host="0.0.0.0", port=0, token="s3creto")
+    httpd.server_close()
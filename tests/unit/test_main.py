@@ -0,0 +1,570 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src.cambiacosas import __main__ as cambiacosas_main
+from src.cambiacosas.administracion_archivo.chunking import split_into_chunks
+from src.cambiacosas.administracion_archivo.file_watcher import FileWatcher
+from src.cambiacosas.administracion_archivo.manifest import RunManifest
+from src.cambiacosas.administracion_archivo.staging import StagingArea
+from src.cambiacosas.googleapi.response_cache import ResponseCache
+from src.cambiacosas.job_server import JobServer
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """Sustituye la llamada a Gemini por una que devuelve el texto de entrada en mayúsculas."""
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+    def fake_call(gemini_config, client=None, limiter=None):
+        content = gemini_config.body["contents"][0]["parts"][0]["text"]
+        return [{"candidates": [{"content": {"parts": [{"text": '{"response": ' + json.dumps(content.upper()) + '}'}]}}]}]
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", fake_call)
+
+
+def _make_tree(tmp_path, count):
+    folder = tmp_path / "tree"
+    folder.mkdir()
+    for i in range(count):
+        (folder / f"file_{i}.txt").write_text(f"content {i}\n")
+    return folder
+
+
+def test_process_files_sequential(tmp_path, fake_gemini):
+    folder = _make_tree(tmp_path, 3)
+    file_info_list = cambiacosas_main.scan_folder(str(folder))
+    cambiacosas_main.process_files_with_gemini(file_info_list, "mayúsculas", False)
+    for i in range(3):
+        assert (folder / f"file_{i}.txt").read_text() == f"CONTENT {i}\n"
+
+
+def test_process_files_with_workers(tmp_path, fake_gemini, capsys):
+    folder = _make_tree(tmp_path, 8)
+    file_info_list = cambiacosas_main.scan_folder(str(folder))
+    context = cambiacosas_main.ProcessingContext(workers=4)
+    cambiacosas_main.process_files_with_gemini(file_info_list, "mayúsculas", False, context)
+    for i in range(8):
+        assert (folder / f"file_{i}.txt").read_text() == f"CONTENT {i}\n"
+
+    # Las líneas de cada archivo se imprimen juntas
+    output_lines = capsys.readouterr().out.splitlines()
+    for index, line in enumerate(output_lines):
+        if line.startswith("Procesando archivo:"):
+            name = line.rsplit("/", 1)[-1].rstrip(".")
+            assert name in output_lines[index + 1]
+
+
+def test_processing_context_invalid_workers():
+    with pytest.raises(ValueError):
+        cambiacosas_main.ProcessingContext(workers=0)
+
+
+def _large_file_info(tmp_path, line_total):
+    path = tmp_path / "large.txt"
+    path.write_text("".join(f"line {i}\n" for i in range(line_total)))
+    return {"full_path": str(path), "name": path.name, "content": path.read_text()}
+
+
+def test_process_large_file_merges_chunks_in_order(tmp_path, fake_gemini):
+    file_info = _large_file_info(tmp_path, 1000)
+    context = cambiacosas_main.ProcessingContext(workers=4, chunk_tokens=500)
+    result = cambiacosas_main.process_large_file(file_info, "mayúsculas", False, context)
+    assert result == file_info["content"].upper()
+
+
+def test_process_large_file_divide_writes_parts_in_order(tmp_path, fake_gemini):
+    file_info = _large_file_info(tmp_path, 700)
+    context = cambiacosas_main.ProcessingContext(workers=3, chunk_tokens=1000)
+    assert cambiacosas_main.process_large_file(file_info, "mayúsculas", True, context) is True
+    chunks = split_into_chunks(file_info["content"].upper(), 1000, "large.txt")
+    assert len(chunks) == 3
+    for chunk_num, chunk in enumerate(chunks, start=1):
+        assert (tmp_path / f"large.part{chunk_num}.txt").read_text() == chunk
+
+
+def test_process_large_file_divide_failure_writes_nothing(tmp_path, fake_gemini, monkeypatch):
+    file_info = _large_file_info(tmp_path, 700)
+    original_call = cambiacosas_main.call_gemini_api
+
+    def failing_call(gemini_config, client=None, limiter=None):
+        if "line 650" in gemini_config.body["contents"][0]["parts"][0]["text"]:
+            return None
+        return original_call(gemini_config, client, limiter)
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", failing_call)
+    context = cambiacosas_main.ProcessingContext(workers=3, chunk_tokens=1000)
+    assert cambiacosas_main.process_large_file(file_info, "mayúsculas", True, context) is False
+    assert not list(tmp_path.glob("large.part*"))
+
+
+@pytest.mark.parametrize("file_count", [1, 3])
+def test_workers_bound_files_and_chunks_together(tmp_path, fake_gemini, monkeypatch, file_count):
+    folder = tmp_path / "tree"
+    folder.mkdir()
+    for i in range(file_count):
+        (folder / f"large_{i}.txt").write_text("".join(f"line {i} {n}\n" for n in range(600)))
+    lock = threading.Lock()
+    in_flight = [0, 0]  # Actuales, máximo
+    threads = set()
+    fake_call = cambiacosas_main.call_gemini_api
+
+    def counting_call(gemini_config, client=None, limiter=None):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            threads.add(threading.current_thread().name)
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return fake_call(gemini_config, client, limiter)
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", counting_call)
+    context = cambiacosas_main.ProcessingContext(workers=3, chunk_tokens=500)
+    assert cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context) == file_count
+    assert in_flight[1] == 3  # Los fragmentos de un solo archivo usan todos los trabajadores
+    assert len(threads) == 3 and context.executor is None
+    assert (folder / "large_0.txt").read_text() == "".join(f"LINE 0 {n}\n" for n in range(600))
+
+
+def test_large_files_are_read_lazily_by_chunk(tmp_path, fake_gemini, monkeypatch):
+    folder = tmp_path / "tree"
+    folder.mkdir()
+    content = "".join(f"línea {i}\r\n" for i in range(800))
+    (folder / "large.log").write_bytes(content.encode("utf-8"))
+    monkeypatch.setattr(cambiacosas_main, "LAZY_FILE_BYTES", 1024)
+    monkeypatch.setattr(cambiacosas_main, "split_into_chunks", lambda *args: pytest.fail("contenido completo"))
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    context = cambiacosas_main.ProcessingContext(workers=3, chunk_tokens=500, manifest=RunManifest(manifest_path, "mayúsculas"))
+    assert cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context) == 1
+    context.manifest.close()
+    assert (folder / "large.log").read_text() == content.replace("\r\n", "\n").upper()
+
+    # El hash del original leído por líneas coincide con el del archivo escrito: al reanudar se omite
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", lambda *args: pytest.fail("llamada a Gemini"))
+    context = cambiacosas_main.ProcessingContext(manifest=RunManifest(manifest_path, "mayúsculas", resume=True))
+    cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context)
+    context.manifest.close()
+
+
+def test_lazy_original_is_unmapped_before_it_is_replaced(tmp_path, fake_gemini, monkeypatch):
+    folder = tmp_path / "tree"
+    folder.mkdir()
+    (folder / "large.log").write_text("".join(f"línea {i}\n" for i in range(400)))
+    monkeypatch.setattr(cambiacosas_main, "LAZY_FILE_BYTES", 1024)
+    indexes = []
+    real_get_file_info = cambiacosas_main.get_file_info
+
+    def tracking_get_file_info(*args, **kwargs):
+        file_info = real_get_file_info(*args, **kwargs)
+        indexes.append(file_info["lines"])
+        return file_info
+
+    real_modify_file_lines = cambiacosas_main.modify_file_lines
+
+    def checking_modify_file_lines(*args, **kwargs):
+        assert indexes and indexes[0].closed  # En Windows no se puede sustituir un archivo mapeado
+        return real_modify_file_lines(*args, **kwargs)
+
+    monkeypatch.setattr(cambiacosas_main, "get_file_info", tracking_get_file_info)
+    monkeypatch.setattr(cambiacosas_main, "modify_file_lines", checking_modify_file_lines)
+    context = cambiacosas_main.ProcessingContext(chunk_tokens=500)
+    assert cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context) == 1
+    assert (folder / "large.log").read_text().startswith("LÍNEA 0\n")
+
+
+def test_stream_mode_spools_fragments_instead_of_accumulating_them(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    folder = _make_tree(tmp_path, 1)
+    sinks = []
+
+    def fake_stream(gemini_config, client=None, sink=None, on_text=None, limiter=None, **callbacks):
+        content = gemini_config.body["contents"][0]["parts"][0]["text"]
+        text = '{"response": ' + json.dumps(content.upper() * 50) + '}'
+        for start in range(0, len(text), 16):
+            sink.write(text[start:start + 16])
+            on_text(text[start:start + 16])
+        sinks.append(sink)
+        return len(text)
+
+    monkeypatch.setattr(cambiacosas_main, "stream_gemini_api", fake_stream)
+    monkeypatch.setattr(cambiacosas_main, "STREAM_SPOOL_BYTES", 64)
+    context = cambiacosas_main.ProcessingContext(stream=True)
+    assert cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context) == 1
+    assert (folder / "file_0.txt").read_text() == "CONTENT 0\n" * 50
+    assert sinks[0]._rolled and sinks[0].closed  # Pasó a un archivo temporal y se cerró
+
+
+def test_process_files_uses_response_cache(tmp_path, fake_gemini, monkeypatch):
+    folder = _make_tree(tmp_path, 2)
+    cache = ResponseCache(str(tmp_path / "cache"))
+    context = cambiacosas_main.ProcessingContext(cache=cache)
+    cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    # Se restaura el contenido original: la segunda ejecución no debe llamar a Gemini
+    for i in range(2):
+        (folder / f"file_{i}.txt").write_text(f"content {i}\n")
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", lambda *args: pytest.fail("llamada a Gemini"))
+    cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context)
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert (folder / "file_0.txt").read_text() == "CONTENT 0\n"
+    cache.close()
+
+
+def test_resume_skips_finished_files(tmp_path, fake_gemini, monkeypatch):
+    folder = _make_tree(tmp_path, 2)
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    context = cambiacosas_main.ProcessingContext(manifest=RunManifest(manifest_path, "mayúsculas"))
+    cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context)
+    context.manifest.close()
+
+    (folder / "file_2.txt").write_text("content 2\n")
+    calls = []
+    original_call = cambiacosas_main.call_gemini_api
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", lambda *args: calls.append(args) or original_call(*args))
+    context = cambiacosas_main.ProcessingContext(manifest=RunManifest(manifest_path, "mayúsculas", resume=True))
+    cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context)
+    context.manifest.close()
+    assert len(calls) == 1
+    assert (folder / "file_2.txt").read_text() == "CONTENT 2\n"
+
+
+@pytest.fixture
+def fake_gemini_patch(monkeypatch):
+    """Sustituye la llamada a Gemini por una que devuelve ediciones: cada línea par en mayúsculas."""
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    requests_seen = []
+
+    def fake_call(gemini_config, client=None, limiter=None):
+        requests_seen.append(gemini_config)
+        numbered = gemini_config.body["contents"][0]["parts"][0]["text"]
+        edits = []
+        for line in numbered.splitlines():
+            line_num, original = line.split("| ", 1)
+            if int(line_num) % 2 == 0:
+                edits.append({"start_line": int(line_num), "end_line": int(line_num), "replacement": original.upper()})
+        return [{"candidates": [{"content": {"parts": [{"text": json.dumps({"edits": edits})}]}}]}]
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", fake_call)
+    return requests_seen
+
+
+def _expected_patch_result(line_total):
+    return "".join(f"LINE {i}\n" if (i + 1) % 2 == 0 else f"line {i}\n" for i in range(line_total))
+
+
+def test_patch_mode_applies_line_edits(tmp_path, fake_gemini_patch):
+    file_info = _large_file_info(tmp_path, 6)
+    context = cambiacosas_main.ProcessingContext(patch=True)
+    cambiacosas_main.process_files_with_gemini([file_info], "mayúsculas", False, context)
+    assert (tmp_path / "large.txt").read_text() == _expected_patch_result(6)
+    schema = fake_gemini_patch[0].body["generationConfig"]["responseSchema"]
+    assert "edits" in schema["properties"]
+
+
+def test_patch_mode_chunks_keep_file_line_numbers(tmp_path, fake_gemini_patch):
+    file_info = _large_file_info(tmp_path, 700)
+    context = cambiacosas_main.ProcessingContext(workers=3, chunk_tokens=1000, patch=True)
+    cambiacosas_main.process_files_with_gemini([file_info], "mayúsculas", False, context)
+    assert len(fake_gemini_patch) == 3
+    assert (tmp_path / "large.txt").read_text() == _expected_patch_result(700)
+
+
+def test_patch_mode_rejects_out_of_range_edits(tmp_path, fake_gemini_patch, monkeypatch):
+    file_info = _large_file_info(tmp_path, 3)
+
+    def bad_call(gemini_config, client=None, limiter=None):
+        edits = [{"start_line": 3, "end_line": 9, "replacement": "x"}]
+        return [{"candidates": [{"content": {"parts": [{"text": json.dumps({"edits": edits})}]}}]}]
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", bad_call)
+    context = cambiacosas_main.ProcessingContext(patch=True)
+    cambiacosas_main.process_files_with_gemini([file_info], "mayúsculas", False, context)
+    assert (tmp_path / "large.txt").read_text() == "line 0\nline 1\nline 2\n"
+
+
+def test_staging_defers_all_writes_until_commit(tmp_path, fake_gemini):
+    folder = _make_tree(tmp_path, 2)
+    large_info = _large_file_info(folder, 700)
+    staging = StagingArea(str(tmp_path / "staging"))
+    context = cambiacosas_main.ProcessingContext(chunk_tokens=1000, staging=staging,
+                                                 manifest=RunManifest(str(tmp_path / "manifest.jsonl"), "mayúsculas"))
+    cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", True, context)
+    assert (folder / "file_0.txt").read_text() == "content 0\n"
+    assert (folder / "large.txt").exists() and not list(folder.glob("large.part*"))
+    assert context.manifest.is_file_done(cambiacosas_main.get_file_info(str(folder / "large.txt")))
+
+    assert staging.commit() == 6  # 2 archivos, 3 partes y la eliminación del original
+    assert (folder / "file_0.txt").read_text() == "CONTENT 0\n"
+    assert not (folder / "large.txt").exists()
+    assert "".join((folder / f"large.part{n}.txt").read_text() for n in range(1, 4)) == large_info["content"].upper()
+    context.manifest.close()
+    staging.close()
+
+
+def test_scan_folder_yields_lightweight_records(tmp_path):
+    folder = _make_tree(tmp_path, 2)
+    (folder / "sub").mkdir()
+    (folder / "sub" / "nested.txt").write_text("nested\n")
+    records = cambiacosas_main.scan_folder(str(folder))
+    first = next(records)
+    assert "content" not in first
+    assert first["metadata"]["size"] == len("content 0\n")
+    names = [first["name"]] + [record["name"] for record in records]
+    assert names == ["file_0.txt", "file_1.txt", "nested.txt"]
+
+
+def test_scan_folder_invalid_path(tmp_path):
+    with pytest.raises(ValueError):
+        cambiacosas_main.scan_folder(str(tmp_path / "no_existe"))
+
+
+def test_processing_starts_before_walk_finishes(tmp_path, fake_gemini, monkeypatch):
+    folder = _make_tree(tmp_path, 3)
+    events = []
+
+    def records():
+        for record in cambiacosas_main.scan_folder(str(folder)):
+            events.append("scan")
+            yield record
+
+    original_call = cambiacosas_main.call_gemini_api
+
+    def recording_call(*args):
+        events.append("call")
+        return original_call(*args)
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", recording_call)
+    count = cambiacosas_main.process_files_with_gemini(records(), "mayúsculas", False)
+    assert count == 3
+    assert events == ["scan", "call"] * 3
+
+
+@pytest.fixture
+def fake_gemini_pack(monkeypatch):
+    """Sustituye la llamada a Gemini por una que atiende peticiones empaquetadas (y sueltas) en mayúsculas."""
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    requests_seen = []
+
+    def fake_call(gemini_config, client=None, limiter=None):
+        requests_seen.append(gemini_config)
+        content = gemini_config.body["contents"][0]["parts"][0]["text"]
+        if "files" not in gemini_config.body["generationConfig"]["responseSchema"]["properties"]:
+            return [{"candidates": [{"content": {"parts": [{"text": '{"response": ' + json.dumps(content.upper()) + '}'}]}}]}]
+        # Omite el primer archivo del paquete para comprobar que se reintenta por separado
+        files = [{"path": item["path"], "content": item["content"].upper()} for item in json.loads(content)[1:]]
+        return [{"candidates": [{"content": {"parts": [{"text": json.dumps({"files": files})}]}}]}]
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", fake_call)
+    return requests_seen
+
+
+def test_pack_groups_small_files_into_one_request(tmp_path, fake_gemini_pack):
+    folder = _make_tree(tmp_path, 6)
+    context = cambiacosas_main.ProcessingContext(pack_tokens=1000)
+    processed = cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context)
+    assert processed == 6
+    for i in range(6):
+        assert (folder / f"file_{i}.txt").read_text() == f"CONTENT {i}\n"
+    # Un paquete con los 6 archivos y un reintento del que faltaba en la respuesta
+    assert len(fake_gemini_pack) == 2
+
+
+def test_work_items_keep_large_files_alone(tmp_path):
+    folder = _make_tree(tmp_path, 3)
+    (folder / "big.txt").write_text("x" * 4000)
+    context = cambiacosas_main.ProcessingContext(pack_tokens=1000)
+    items = list(cambiacosas_main._work_items(cambiacosas_main.scan_folder(str(folder)), context))
+    assert sorted(len(item) for item in items) == [1, 3]
+    assert [info["name"] for item in items if len(item) == 1 for info in item] == ["big.txt"]
+
+
+def _fake_batch_results(requests_path, results_path, transform):
+    """Simula la API de lotes: responde a cada línea de peticiones con transform(texto de entrada)."""
+    with open(requests_path, encoding="utf-8") as requests_file, open(results_path, "w", encoding="utf-8") as results_file:
+        for line in requests_file:
+            record = json.loads(line)
+            content = record["request"]["contents"][0]["parts"][0]["text"]
+            response = {"candidates": [{"content": {"parts": [{"text": transform(content)}]}}]}
+            results_file.write(json.dumps({"key": record["key"], "response": response}) + "\n")
+
+
+def test_batch_submit_and_apply_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    folder = _make_tree(tmp_path, 2)
+    large_info = _large_file_info(folder, 700)
+    requests_path, results_path = tmp_path / "requests.jsonl", tmp_path / "results.jsonl"
+    context = cambiacosas_main.ProcessingContext(chunk_tokens=1000)
+    count = cambiacosas_main.batch_submit(cambiacosas_main.scan_folder(str(folder)), str(folder), "mayúsculas",
+                                          str(requests_path), context)
+    assert count == 5  # 2 archivos pequeños y 3 fragmentos
+    keys = [json.loads(line)["key"] for line in requests_path.read_text().splitlines()]
+    assert keys[0].startswith("file_0.txt#1/1@") and keys[-1].startswith("large.txt#3/3@")
+
+    _fake_batch_results(requests_path, results_path, lambda content: json.dumps({"response": content.upper()}))
+    (folder / "file_1.txt").write_text("cambiado\n")  # Ya no coincide con la petición enviada
+    counts = cambiacosas_main.batch_apply(str(folder), str(results_path))
+    assert counts == {"applied": 2, "skipped": 1}
+    assert (folder / "file_0.txt").read_text() == "CONTENT 0\n"
+    assert (folder / "file_1.txt").read_text() == "cambiado\n"
+    assert (folder / "large.txt").read_text() == large_info["content"].upper()
+
+
+def test_batch_apply_patch_results(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    _large_file_info(tmp_path, 700)
+    requests_path, results_path = tmp_path / "requests.jsonl", tmp_path / "results.jsonl"
+    context = cambiacosas_main.ProcessingContext(chunk_tokens=1000, patch=True)
+    file_info = cambiacosas_main.get_file_info(str(tmp_path / "large.txt"))
+    assert cambiacosas_main.batch_submit([file_info], str(tmp_path), "mayúsculas", str(requests_path), context) == 3
+
+    def even_lines_upper(numbered):
+        edits = []
+        for line in numbered.splitlines():
+            line_num, original = line.split("| ", 1)
+            if int(line_num) % 2 == 0:
+                edits.append({"start_line": int(line_num), "end_line": int(line_num), "replacement": original.upper()})
+        return json.dumps({"edits": edits})
+
+    _fake_batch_results(requests_path, results_path, even_lines_upper)
+    assert cambiacosas_main.batch_apply(str(tmp_path), str(results_path)) == {"applied": 1, "skipped": 0}
+    assert (tmp_path / "large.txt").read_text() == _expected_patch_result(700)
+
+
+def test_metrics_record_phases_and_tokens(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+    def measured_call(gemini_config, client=None, limiter=None, on_first_byte=None, on_usage=None):
+        content = gemini_config.body["contents"][0]["parts"][0]["text"]
+        on_first_byte(0.01)
+        on_usage({"promptTokenCount": 7, "candidatesTokenCount": 3, "totalTokenCount": 10})
+        return [{"candidates": [{"content": {"parts": [{"text": '{"response": ' + json.dumps(content.upper()) + '}'}]}}]}]
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", measured_call)
+    folder = _make_tree(tmp_path, 2)
+    _large_file_info(folder, 700)
+    context = cambiacosas_main.ProcessingContext(chunk_tokens=1000, metrics=cambiacosas_main.RunMetrics())
+    cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context)
+    summary = context.metrics.summary()
+    assert summary["requests"]["ok"] == 5  # 2 archivos y 3 fragmentos
+    assert summary["tokens"]["total"] == 50
+    assert summary["files"][str(folder / "large.txt")]["requests"] == 3
+    for phase in ("scan", "request", "ttfb", "parse", "write", "file"):
+        assert summary["phases"][phase]["count"] > 0
+    assert sorted(event.get("chunk") for event in context.metrics.events() if "chunk" in event) == [1, 2, 3]
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "la condición no se cumplió a tiempo"
+        time.sleep(0.02)
+
+
+def test_watch_reprocesses_only_changed_files(tmp_path, fake_gemini, monkeypatch):
+    folder = _make_tree(tmp_path, 3)
+    calls = []
+    fake_call = cambiacosas_main.call_gemini_api
+
+    def counting_call(gemini_config, client=None, limiter=None):
+        calls.append(gemini_config.input_text)
+        return fake_call(gemini_config, client, limiter)
+
+    monkeypatch.setattr(cambiacosas_main, "call_gemini_api", counting_call)
+    watcher = FileWatcher(str(folder), debounce=0.1, poll_interval=0.05, use_inotify=False)
+    context = cambiacosas_main.ProcessingContext()
+    stop = threading.Event()
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(
+        count=cambiacosas_main.watch_folder(str(folder), "mayúsculas", context, watcher=watcher, stop=stop)))
+    thread.start()
+    try:
+        _wait_until(lambda: len(calls) == 3 and (folder / "file_2.txt").read_text() == "CONTENT 2\n")
+        (folder / "file_1.txt").write_text("nuevo 1\n")
+        (folder / "file_0.txt").write_text("CONTENT 0\n")  # Guardado sin cambios
+        _wait_until(lambda: (folder / "file_1.txt").read_text() == "NUEVO 1\n")
+        time.sleep(0.5)  # Las escrituras propias no deben volver a procesarse
+    finally:
+        stop.set()
+        thread.join(5)
+    assert calls == ["content 0\n", "content 1\n", "content 2\n", "nuevo 1\n"]
+    assert result["count"] == 4
+    assert context.on_write is None
+
+
+def test_parse_job_request(tmp_path):
+    folder = _make_tree(tmp_path, 1)
+    prompt_file = tmp_path / "prompt.txt"
+    prompt_file.write_text("mayúsculas\n")
+    options = cambiacosas_main._parse_job_request({"folder": str(folder), "prompt": "  mayúsculas\n",
+                                                   "patch": True, "include": ["*.txt"], "max_size": "1K"})
+    assert options["prompt"] == "mayúsculas"
+    assert options["patch"] and not options["divide"]
+    assert options["include"] == ["*.txt"] and options["max_size"] == 1024
+
+    for request in ({"folder": str(folder)},
+                    {"folder": str(tmp_path / "missing"), "prompt": "x"},
+                    {"folder": str(folder), "prompt_file": str(prompt_file)},  # El servidor no lee archivos locales
+                    {"folder": str(folder), "prompt": "x", "prompt_file": str(prompt_file)},
+                    {"folder": str(folder), "prompt": "x", "manifest": str(tmp_path / "otro.jsonl")},
+                    {"folder": str(folder), "prompt": "x", "workers": 4},
+                    {"folder": str(folder), "prompt": "x", "patch": "sí"},
+                    {"folder": str(folder), "prompt": "x", "patch": True, "divide": True},
+                    {"folder": str(folder), "prompt": "x", "pack_tokens": 100}):
+        with pytest.raises(ValueError):
+            cambiacosas_main._parse_job_request(request)
+
+
+def test_serve_refuses_non_loopback_hosts_without_a_token(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv("CAMBIACOSAS_SERVER_TOKEN", raising=False)
+    with pytest.raises(SystemExit):
+        cambiacosas_main._serve_main(["--host", "0.0.0.0"])
+    assert "token" in capsys.readouterr().err
+    (tmp_path / "token").write_text("\n")
+    with pytest.raises(SystemExit):
+        cambiacosas_main._serve_main(["--token-file", str(tmp_path / "token")])
+
+
+def test_server_jobs_share_the_worker_pool(tmp_path, fake_gemini):
+    folders = []
+    for name in ("a", "b"):
+        folder = tmp_path / name
+        folder.mkdir()
+        for i in range(4):
+            (folder / f"file_{i}.txt").write_text(f"{name} {i}\n")
+        folders.append(folder)
+    shared = cambiacosas_main.ProcessingContext(workers=2)
+    shared.executor = ThreadPoolExecutor(max_workers=2)
+    job_server = JobServer(lambda job: cambiacosas_main._run_server_job(job, shared),
+                           cambiacosas_main._parse_job_request, max_active_jobs=2)
+    try:
+        jobs = [job_server.submit({"folder": str(folder), "prompt": "mayúsculas"}) for folder in folders]
+        for job in jobs:
+            events = list(job.events())
+            assert job.state == "done"
+            file_events = [event for event in events if event["event"] == "file"]
+            assert sorted(path for event in file_events for path in event["written"]) == \
+                [os.path.join(job.folder, f"file_{i}.txt") for i in range(4)]
+            assert events[-2]["event"] == "summary" and events[-2]["written"] == 4
+        assert (folders[1] / "file_3.txt").read_text() == "B 3\n"
+    finally:
+        job_server.close()
+        shared.executor.shutdown()
+
+
+def test_cancelled_jobs_stop_before_the_remaining_files(tmp_path, fake_gemini):
+    folder = _make_tree(tmp_path, 5)
+    cancel = threading.Event()
+    done = []
+
+    def on_file_done(work_item, log_lines):
+        done.append(work_item[0]["full_path"])
+        cancel.set()
+
+    context = cambiacosas_main.ProcessingContext(cancel=cancel, on_file_done=on_file_done)
+    cambiacosas_main.process_files_with_gemini(cambiacosas_main.scan_folder(str(folder)), "mayúsculas", False, context)
+    assert len(done) == 1
+    assert [str(path) for path in folder.iterdir() if path.read_text().startswith("CONTENT")] == done
@@ -0,0 +1,58 @@
+import json
+
+from src.cambiacosas.run_metrics import RunMetrics
+
+
+def test_timed_and_timed_iter_accumulate_phases():
+    metrics = RunMetrics()
+    with metrics.timed("write"):
+        pass
+    assert list(metrics.timed_iter(iter([1, 2, 3]), "scan")) == [1, 2, 3]
+    phases = metrics.summary()["phases"]
+    assert phases["write"]["count"] == 1
+    assert phases["scan"]["count"] == 1 and phases["scan"]["total_s"] >= 0
+
+
+def test_record_request_aggregates_tokens_per_file():
+    metrics = RunMetrics()
+    usage = {"promptTokenCount": 10, "candidatesTokenCount": 4, "totalTokenCount": 14}
+    metrics.record_request({"file": "/a.py", "chunk": 1}, "ok", total_s=0.5, ttfb_s=0.1, usage=usage)
+    metrics.record_request({"file": "/a.py", "chunk": 2}, "ok", total_s=0.25, usage=usage)
+    metrics.record_request({"file": "/b.py"}, "cached")
+    metrics.record_request({"files": ["/c.py", "/d.py"]}, "ok", total_s=1.0, usage=usage)
+    summary = metrics.summary()
+    assert summary["requests"] == {"ok": 3, "cached": 1, "failed": 0}
+    assert summary["tokens"]["prompt"] == 30 and summary["tokens"]["total"] == 42
+    assert summary["phases"]["request"] == {"count": 3, "total_s": 1.75, "max_s": 1.0}
+    assert summary["phases"]["ttfb"]["count"] == 1
+    assert summary["files"]["/a.py"] == {"requests": 2, "tokens": {"prompt": 20, "candidates": 8, "total": 28}}
+    assert summary["files"]["/d.py"] == {"requests": 1, "tokens": {}}  # Los tokens del paquete van al primero
+    assert metrics.events()[0]["chunk"] == 1 and metrics.events()[0]["tokens"]["prompt"] == 10
+
+
+def test_write_ndjson_and_prometheus(tmp_path):
+    metrics = RunMetrics()
+    metrics.record_request({"file": "/a.py"}, "ok", total_s=0.5, usage={"totalTokenCount": 3})
+    metrics.write_ndjson(str(tmp_path / "run.ndjson"))
+    lines = [json.loads(line) for line in (tmp_path / "run.ndjson").read_text().splitlines()]
+    assert [line["type"] for line in lines] == ["request", "summary"]
+
+    metrics.write_prometheus(str(tmp_path / "run.prom"))
+    text = (tmp_path / "run.prom").read_text()
+    assert 'cambiacosas_tokens_total{kind="total"} 3' in text
+    assert 'cambiacosas_requests_total{status="ok"} 1' in text
+    assert "# TYPE cambiacosas_phase_seconds_total counter" in text
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["run.ndjson", "run.prom"]  # Sin temporales
+
+
+def test_events_and_files_are_bounded():
+    metrics = RunMetrics(max_events=3, max_files=2)
+    for i in range(5):
+        metrics.record_request({"file": f"/{i}.py"}, "ok", total_s=0.1, usage={"totalTokenCount": 1})
+    metrics.record_request({"file": "/3.py"}, "ok")
+    metrics.record_request({"file": "/5.py"}, "failed")
+    assert [event.get("file") for event in metrics.events()] == ["/4.py", "/3.py", "/5.py"]
+    summary = metrics.summary()
+    assert sorted(summary["files"]) == ["/3.py", "/5.py"]  # Se descarta el que lleva más tiempo sin peticiones
+    assert summary["dropped"] == {"events": 4, "files": 4}
+    assert summary["requests"] == {"ok": 6, "cached": 0, "failed": 1} and summary["tokens"]["total"] == 5